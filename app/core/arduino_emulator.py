@@ -0,0 +1,918 @@
+"""
+Virtual Arduino running the eyetracker_arduino.ino state machine on a pseudo-terminal.
+
+The emulator opens a pty pair and behaves like the firmware on the slave side, so
+ArduinoTracker connects to emulator.port with the real serial.Serial code path.
+Outgoing bytes are paced at the configured baud rate, and response delays, jitter,
+dropped and corrupted messages can be injected to test and benchmark the host side
+without hardware. Linux and macOS only.
+
+Usage:
+    python -m app.core.arduino_emulator                 # serve, print the port to connect to
+    python -m app.core.arduino_emulator --benchmark 200 # measure ping round trips
+    python -m app.core.arduino_emulator --throughput    # measure telemetry throughput per baud rate
+"""
+import argparse
+from collections import deque
+import heapq
+import json
+import os
+import random
+import select
+import statistics
+import termios
+import threading
+import time
+import tty
+
+import numpy as np
+
+from app.core.binary_codec import (
+    encode_frame, crc16, MSG_TEXT, MSG_STATUS, MSG_EVENT, MSG_RESULTS, MSG_ACK, MSG_SYNC, MSG_PLAN, MSG_BAUD,
+    STATUS_DTYPE, EVENT_DTYPE, ACK_DTYPE, SYNC_DTYPE, PLAN_REPLY_DTYPE, PLAN_POINT_DTYPE, BAUD_REPLY_DTYPE,
+    STATE_READY, STATE_RUNNING, STATE_FINISHED,
+    PLAN_OK, PLAN_TOO_LARGE, PLAN_BAD_CRC, PLAN_BUSY, PLAN_OUT_OF_ORDER,
+    BAUD_OK, BAUD_UNSUPPORTED, BAUD_BAD_CRC, BAUD_BUSY,
+    EVENT_TEST_START, EVENT_POINT_MOVED, EVENT_LASER_ON, EVENT_LASER_OFF, EVENT_BUTTON_HIT,
+    EVENT_WRONG_PRESS, EVENT_LOOK_AWAY, EVENT_LOOK_BACK, EVENT_TEST_END, NO_POINT
+)
+
+# Command bytes, as in eyetracker_arduino.ino
+CMD_START_TEST = 0x01
+CMD_END_TEST = 0x02
+CMD_PING = 0x03
+CMD_WITHIN_THRESHOLD = 0x04
+CMD_OUT_OF_THRESHOLD = 0x05
+CMD_TEST_RESULTS = 0x06
+CMD_SET_BINARY_MODE = 0x07
+CMD_IDENTIFY = 0x08
+CMD_SYNC = 0x09
+CMD_PLAN_BEGIN = 0x0A
+CMD_PLAN_POINTS = 0x0B
+CMD_SET_BAUD = 0x0C
+CMD_CONFIRM_BAUD = 0x0D
+
+# Stimulus plan limits of the firmware
+MAX_PLAN_POINTS = 512
+PLAN_WINDOW = 8
+PLAN_LEAD_IN = 1.0
+
+# Link rates of the firmware
+BASE_BAUD = 115200
+BAUD_RATES = (115200, 250000, 500000, 1000000)
+BAUD_CONFIRM_TIMEOUT = 0.5
+
+# Line speeds a host can set with termios, to tell whether it follows a rate change.
+# Other rates are set with platform ioctls and can't be read back, they count as matching.
+TERMIOS_SPEEDS = {
+    getattr(termios, f'B{rate}'): rate
+    for rate in (9600, 19200, 38400, 57600, 115200, 230400, 460800, 500000, 576000, 921600, 1000000)
+    if hasattr(termios, f'B{rate}')
+}
+
+# Laser points of the firmware, (Y, X) servo angles
+DEFAULT_POINTS = [(20, 130), (60, 130), (60, 70), (10, 70)]
+
+
+class VirtualArduino:
+    """Emulates the eye tracker firmware on a pty.
+
+    Timing follows the firmware: a new point every point_duration seconds, the laser
+    fires pre_fire_delay seconds after moving and stays on for laser_duration. A
+    button press while the laser is on counts as a hit, every press counts as a click.
+    A stimulus plan uploaded by the host replaces the points and their timing, the
+    emulator buffers it in the same PLAN_WINDOW point window as the firmware.
+
+    Output is paced at the link rate, which the host can raise with CMD_SET_BAUD like
+    on the firmware. While the host's pty runs at a different speed than the emulated
+    board, bytes are garbled in both directions, as on a real line.
+    Like the firmware, commands are handled one by one in the order received.
+
+    Example:
+        emulator = VirtualArduino(point_duration=0.5)
+        emulator.start()
+        tracker = ArduinoTracker(auto_connect=False)
+        tracker.connect_to_port(emulator.port)
+    """
+
+    def __init__(self, baud_rate=115200, points=None, point_duration=5.0, laser_duration=2.0,
+                 pre_fire_delay=0.5, progress_interval=0.3, heartbeat_interval=1.0, test_timeout=300.0,
+                 response_delay=0.0, jitter=0.0, drop_rate=0.0, corrupt_rate=0.0,
+                 hit_rate=0.0, reaction_time=0.4, binary_support=True, max_baud_rate=1000000,
+                 max_reliable_baud_rate=None, seed=None):
+        """Initialize the emulator.
+
+        Args:
+            baud_rate: Power-on link rate, used to pace outgoing bytes (10 bits per byte), None for no pacing
+            points: List of (Y, X) laser points, defaults to the firmware's points
+            point_duration: Seconds each point is shown
+            laser_duration: Seconds the laser stays on
+            pre_fire_delay: Seconds between moving to a point and firing the laser
+            progress_interval: Seconds between status messages while a test runs
+            heartbeat_interval: Seconds between status messages in binary mode, where progress is sent as events
+            test_timeout: Seconds after which a test is ended
+            response_delay: Seconds added before every outgoing message
+            jitter: Maximum random seconds added on top of response_delay
+            drop_rate: Probability of dropping an outgoing message
+            corrupt_rate: Probability of flipping a byte in an outgoing message
+            hit_rate: Probability the simulated patient presses for a point, 0 to only use press_button
+            reaction_time: Seconds between the laser turning on and the simulated press
+            binary_support: If False, behave like firmware without CMD_SET_BINARY_MODE, CMD_IDENTIFY and CMD_SYNC
+            max_baud_rate: Highest rate the board accepts with CMD_SET_BAUD
+            max_reliable_baud_rate: Above this rate half the outgoing messages get corrupted, like on a
+                                    long cable, None for a clean line at every rate
+            seed: Random seed for jitter, faults and the simulated patient
+        """
+        self.baud_rate = baud_rate
+        self.points = list(points or DEFAULT_POINTS)
+        self.point_duration = point_duration
+        self.laser_duration = laser_duration
+        self.pre_fire_delay = pre_fire_delay
+        self.progress_interval = progress_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.test_timeout = test_timeout
+        self.response_delay = response_delay
+        self.jitter = jitter
+        self.drop_rate = drop_rate
+        self.corrupt_rate = corrupt_rate
+        self.hit_rate = hit_rate
+        self.reaction_time = reaction_time
+        self.binary_support = binary_support
+        self.max_baud_rate = max_baud_rate
+        self.max_reliable_baud_rate = max_reliable_baud_rate
+        self.random = random.Random(seed)
+
+        self.port = None
+        self.master_fd = None
+        self.slave_fd = None
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self._pending_presses = 0
+        self._outbox = []  # heap of (due time, sequence, bytes)
+        self._input = bytearray()  # Received bytes not yet handled
+        self._outbox_seq = 0
+        self._line_free_at = 0.0
+
+        # Statistics
+        self.commands_received = 0
+        self.bytes_sent = 0
+        self.messages_dropped = 0
+        self.messages_corrupted = 0
+        self.bytes_garbled = 0
+
+        self._reset_state()
+
+    def _reset_state(self):
+        """Power-on state of the firmware."""
+        self.binary_mode = False
+        self.frame_seq = 0
+        self.link_baud_rate = self.baud_rate or BASE_BAUD
+        self.fallback_baud_rate = self.link_baud_rate
+        self.pending_baud_rate = None
+        self.baud_switch_at = None  # Output due time at which a requested rate takes effect
+        self.baud_pending_until = None  # Deadline for CMD_CONFIRM_BAUD after switching
+        self.test_running = False
+        self.test_finished = False
+        self.led_on = False
+        self.point_tracker = -1
+        self.click_tracker = ['0'] * len(self.points)
+        self.click_counter = 0
+        self.out_of_thres_counter = 0
+        self.plan_total = 0  # 0 without a plan, the built-in points are used
+        self.plan_received = 0
+        self.plan_window = deque()
+        self.plan_used = False
+        self.current_point_duration = self.point_duration
+        self.current_pre_fire_delay = self.pre_fire_delay
+        self.current_laser_duration = self.laser_duration
+        self.laser_on = False
+        self.laser_flag = False
+        self.laser_start_time = 0.0
+        self.timestamp = 0.0
+        self.test_start_time = 0.0
+        self.last_progress_time = 0.0
+        self.scheduled_press = None
+        self.boot_time = time.monotonic()
+
+    # Lifecycle
+
+    def start(self):
+        """Open the pty and start the firmware loop.
+
+        Returns:
+            str: Device path of the port to connect to
+        """
+        self.master_fd, self.slave_fd = os.openpty()
+        # Raw mode, no echo or newline translation, like a USB serial device
+        tty.setraw(self.slave_fd)
+        self.port = os.ttyname(self.slave_fd)
+
+        self._stop_event.clear()
+        self._reset_state()
+        self.reply("System ready")
+
+        self._thread = threading.Thread(target=self._run, name="virtual-arduino", daemon=True)
+        self._thread.start()
+        return self.port
+
+    def stop(self):
+        """Stop the firmware loop and close the pty."""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=1)
+            self._thread = None
+        for fd in (self.master_fd, self.slave_fd):
+            if fd is not None:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+        self.master_fd = self.slave_fd = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def press_button(self):
+        """Simulate the patient pressing the button, thread-safe."""
+        with self._lock:
+            self._pending_presses += 1
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            now = time.monotonic()
+            timeout = 0.002
+            if self._outbox:
+                timeout = max(0.0, min(timeout, self._outbox[0][0] - now))
+
+            try:
+                readable, _, _ = select.select([self.master_fd], [], [], timeout)
+                if readable:
+                    data = os.read(self.master_fd, 256)
+                    if self._rate_matches():
+                        self._input.extend(data)
+                        self._handle_input()
+                    else:
+                        # Sent at another rate, the UART would read noise
+                        self.bytes_garbled += len(data)
+            except OSError:
+                break
+
+            self.step(time.monotonic())
+            self._flush_outbox(time.monotonic())
+            self._update_baud(time.monotonic())
+
+    def _host_baud_rate(self):
+        """Speed the host set on its end of the pty, None if it can't be read."""
+        try:
+            return TERMIOS_SPEEDS.get(termios.tcgetattr(self.slave_fd)[5])
+        except (termios.error, OSError):
+            return None
+
+    def _rate_matches(self):
+        host_rate = self._host_baud_rate()
+        return host_rate is None or host_rate == self.link_baud_rate
+
+    def _update_baud(self, now):
+        """Switch rate once the reply announcing it was sent, fall back if it is not confirmed."""
+        if self.baud_switch_at is not None and now >= self.baud_switch_at:
+            self.baud_switch_at = None
+            self.link_baud_rate, self.pending_baud_rate = self.pending_baud_rate, None
+            self.baud_pending_until = now + BAUD_CONFIRM_TIMEOUT
+        elif self.baud_pending_until is not None and now > self.baud_pending_until:
+            self.revert_baud()
+
+    def revert_baud(self):
+        """Go back to the rate before an unconfirmed change, see revertBaud in the firmware."""
+        self.link_baud_rate = self.fallback_baud_rate
+        self.baud_pending_until = None
+        self._input.clear()
+
+    # Output
+
+    def _send(self, data):
+        """Queue bytes for output, applying delays, pacing and faults."""
+        if self.drop_rate and self.random.random() < self.drop_rate:
+            self.messages_dropped += 1
+            return
+
+        if self.corrupt_rate and self.random.random() < self.corrupt_rate:
+            data = bytearray(data)
+            data[self.random.randrange(len(data))] ^= 0x10
+            data = bytes(data)
+            self.messages_corrupted += 1
+
+        if (self.max_reliable_baud_rate and self.link_baud_rate > self.max_reliable_baud_rate
+                and self.random.random() < 0.5):
+            data = bytearray(data)
+            data[self.random.randrange(len(data))] ^= 0x01
+            data = bytes(data)
+            self.messages_corrupted += 1
+
+        now = time.monotonic()
+        delay = self.response_delay + (self.random.uniform(0, self.jitter) if self.jitter else 0.0)
+        # The line sends one message at a time, 10 bits per byte
+        start = max(now + delay, self._line_free_at)
+        duration = len(data) * 10 / self.link_baud_rate if self.baud_rate else 0.0
+        self._line_free_at = start + duration
+
+        heapq.heappush(self._outbox, (start + duration, self._outbox_seq, data))
+        self._outbox_seq += 1
+
+    def _flush_outbox(self, now):
+        while self._outbox and self._outbox[0][0] <= now:
+            _, _, data = heapq.heappop(self._outbox)
+            if not self._rate_matches():
+                # The host reads noise, keep the delimiters so it resynchronises like on a real line
+                data = bytes(byte ^ 0x5A if byte else 0 for byte in data)
+                self.bytes_garbled += len(data)
+            try:
+                os.write(self.master_fd, data)
+                self.bytes_sent += len(data)
+            except OSError:
+                return
+
+    def reply(self, text):
+        """Send a text line, or a text frame in binary mode."""
+        if self.binary_mode:
+            self._send_frame(MSG_TEXT, text.encode('utf-8'))
+        else:
+            self._send((text + "\r\n").encode('utf-8'))
+
+    def _send_frame(self, msg_type, body):
+        self._send(encode_frame(msg_type, body, self.frame_seq))
+        self.frame_seq = (self.frame_seq + 1) & 0xFFFF
+
+    def _send_json(self, document):
+        self._send((json.dumps(document, separators=(',', ':')) + "\r\n").encode('utf-8'))
+
+    def device_ms(self):
+        """millis() of the emulated device."""
+        return int((time.monotonic() - self.boot_time) * 1000) & 0xFFFFFFFF
+
+    def _status_fields(self):
+        if self.test_running:
+            state, points_shown = STATE_RUNNING, self.point_tracker + 1
+        elif self.test_finished:
+            state, points_shown = STATE_FINISHED, self.point_tracker
+        else:
+            state, points_shown = STATE_READY, 0
+        return state, max(points_shown, 0)
+
+    def send_status_frame(self, msg_type):
+        """Binary STATUS or RESULTS message, see sendStatusFrame in the firmware."""
+        state, points_shown = self._status_fields()
+        record = np.zeros(1, dtype=STATUS_DTYPE)
+        record['device_ms'] = self.device_ms()
+        record['state'] = state
+        record['points_shown'] = points_shown
+        record['total_points'] = self.total_points()
+        record['clicks'] = self.click_counter
+        record['hits'] = self.click_tracker.count('1')
+        record['out_of_thres_counter'] = self.out_of_thres_counter
+        body = record.tobytes()
+
+        if msg_type == MSG_RESULTS:
+            bits = np.array([c == '1' for c in self.click_tracker], dtype=np.uint8)
+            body += np.packbits(bits, bitorder='little').tobytes()
+
+        self._send_frame(msg_type, body)
+
+    def send_ack(self, command):
+        """Acknowledge a threshold command, see sendAck in the firmware."""
+        if self.binary_mode:
+            record = np.zeros(1, dtype=ACK_DTYPE)
+            record['command'] = command
+            record['device_ms'] = self.device_ms()
+            self._send_frame(MSG_ACK, record.tobytes())
+        else:
+            self.reply("O")
+
+    def send_sync(self):
+        """Answer a clock sync request, see sendSync in the firmware."""
+        if self.binary_mode:
+            record = np.zeros(1, dtype=SYNC_DTYPE)
+            record['device_ms'] = self.device_ms()
+            self._send_frame(MSG_SYNC, record.tobytes())
+        else:
+            self.reply(f"SYNC {self.device_ms()}")
+
+    def send_plan_status(self, status):
+        """Plan reply and window credit, see sendPlanStatus in the firmware."""
+        record = np.zeros(1, dtype=PLAN_REPLY_DTYPE)
+        record['status'] = status
+        record['max_points'] = MAX_PLAN_POINTS
+        record['window'] = PLAN_WINDOW
+        record['received'] = self.plan_received
+        record['free'] = PLAN_WINDOW - len(self.plan_window)
+        self._send_frame(MSG_PLAN, record.tobytes())
+
+    def send_baud_status(self, status, baud):
+        """Reply to a rate change, see sendBaudStatus in the firmware."""
+        record = np.zeros(1, dtype=BAUD_REPLY_DTYPE)
+        record['status'] = status
+        record['baud'] = baud
+        self._send_frame(MSG_BAUD, record.tobytes())
+
+    def send_event(self, event_type, arg=0):
+        """Stream a test event, binary mode only, see pushEvent in the firmware."""
+        if not self.binary_mode:
+            return
+        record = np.zeros(1, dtype=EVENT_DTYPE)
+        record['device_ms'] = self.device_ms()
+        record['event_type'] = event_type
+        record['point'] = NO_POINT if self.point_tracker < 0 else self.point_tracker
+        record['arg'] = arg
+        self._send_frame(MSG_EVENT, record.tobytes())
+
+    def print_test_status(self):
+        """Periodic status, JSON in text mode."""
+        if self.binary_mode:
+            self.send_status_frame(MSG_STATUS)
+            return
+
+        if self.test_running or self.test_finished:
+            _, points_shown = self._status_fields()
+            self._send_json({
+                'test_status': "Test Running" if self.test_running else "Test Finished",
+                'points_shown': points_shown,
+                'total_points': self.total_points(),
+                'clicks': self.click_counter,
+                'click_pattern': ''.join(self.click_tracker),
+            })
+        else:
+            self._send_json({'test_status': "System Ready"})
+
+    # Firmware state machine
+
+    def total_points(self):
+        return self.plan_total or len(self.points)
+
+    def _handle_input(self):
+        """Handle the complete commands received, with their payloads."""
+        while self._input:
+            command = self._input[0]
+            if self.baud_pending_until is not None and command != CMD_CONFIRM_BAUD:
+                # Only the confirmation counts until the new rate is verified
+                del self._input[:1]
+                continue
+            if command == CMD_PLAN_BEGIN:
+                size = 4
+            elif command in (CMD_SET_BAUD, CMD_CONFIRM_BAUD):
+                size = 6
+            elif command == CMD_PLAN_POINTS:
+                if len(self._input) < 4:
+                    return
+                if self._input[3] > PLAN_WINDOW:
+                    # Like the firmware, the rest of a bad payload is discarded
+                    self._input.clear()
+                    self.send_plan_status(PLAN_BAD_CRC)
+                    return
+                size = 3 + self._input[3] * PLAN_POINT_DTYPE.itemsize + 2
+            else:
+                size = 0
+
+            if len(self._input) < 1 + size:
+                return
+            payload = bytes(self._input[1:1 + size])
+            del self._input[:1 + size]
+            self.handle_command(command, payload)
+
+    def handle_command(self, command, payload=b''):
+        """Handle one command received from the host.
+
+        Args:
+            command: Command byte
+            payload: Bytes following the command, for the plan commands
+        """
+        self.commands_received += 1
+
+        if command == CMD_START_TEST:
+            if not self.test_running:
+                self.start_test()
+                if not self.binary_mode:
+                    self.reply(str(self.point_tracker))
+            else:
+                self.reply("System busy: Test already running")
+
+        elif command == CMD_END_TEST:
+            if self.test_running:
+                self.end_test("Test manually stopped")
+
+        elif command == CMD_PING:
+            if self.test_running:
+                self.reply("Test Running")
+            elif self.test_finished:
+                self.reply("Test Ended")
+            else:
+                self.reply("System Online")
+
+        elif command == CMD_WITHIN_THRESHOLD:
+            self.led_on = False
+            self.send_ack(command)
+            if self.test_running:
+                self.send_event(EVENT_LOOK_BACK)
+
+        elif command == CMD_OUT_OF_THRESHOLD:
+            self.out_of_thres_counter += 1
+            self.led_on = True
+            self.send_ack(command)
+            if self.test_running:
+                self.send_event(EVENT_LOOK_AWAY, self.out_of_thres_counter)
+
+        elif command == CMD_TEST_RESULTS:
+            if self.binary_mode:
+                finished = self.test_finished and not self.test_running
+                self.send_status_frame(MSG_RESULTS if finished else MSG_STATUS)
+            elif self.test_running:
+                self._send_json({'test_status': "Test Running"})
+            elif self.test_finished:
+                self._send_json({
+                    'test_status': "Test Finished",
+                    'points_shown': self.point_tracker,
+                    'total_points': self.total_points(),
+                    'clicks': self.click_counter,
+                    'click_pattern': ''.join(self.click_tracker),
+                    'out_of_thres_counter': self.out_of_thres_counter,
+                })
+            else:
+                self._send_json({'test_status': "System Ready"})
+
+        elif command == CMD_SET_BINARY_MODE and self.binary_support:
+            self.reply("Binary mode")
+            self.binary_mode = True
+
+        elif command == CMD_IDENTIFY and self.binary_support:
+            self.reply(f"EyeTracker fw1 {'binary' if self.binary_mode else 'text'}")
+
+        elif command == CMD_SYNC and self.binary_support:
+            self.send_sync()
+
+        elif command == CMD_PLAN_BEGIN and self.binary_support:
+            self.begin_plan(payload)
+
+        elif command == CMD_PLAN_POINTS and self.binary_support:
+            self.receive_plan_points(payload)
+
+        elif command == CMD_SET_BAUD and self.binary_support:
+            self.set_baud(payload)
+
+        elif command == CMD_CONFIRM_BAUD and self.binary_support:
+            self.confirm_baud(payload)
+
+    @staticmethod
+    def _baud_from_payload(payload):
+        """Rate of a CMD_SET_BAUD / CMD_CONFIRM_BAUD payload, None if its CRC is wrong."""
+        if crc16(payload[:4]) != int.from_bytes(payload[4:6], 'little'):
+            return None
+        return int.from_bytes(payload[:4], 'little')
+
+    def set_baud(self, payload):
+        """Switch the link rate once the reply is sent, see setBaud in the firmware."""
+        baud = self._baud_from_payload(payload)
+        if not self.binary_mode:
+            return
+        if baud is None:
+            self.send_baud_status(BAUD_BAD_CRC, self.link_baud_rate)
+        elif self.test_running:
+            self.send_baud_status(BAUD_BUSY, self.link_baud_rate)
+        elif baud not in BAUD_RATES or baud > self.max_baud_rate:
+            self.send_baud_status(BAUD_UNSUPPORTED, self.link_baud_rate)
+        else:
+            self.send_baud_status(BAUD_OK, baud)
+            # Like Serial.flush(), the reply goes out at the old rate
+            self.fallback_baud_rate = self.link_baud_rate
+            self.pending_baud_rate = baud
+            self.baud_switch_at = self._line_free_at
+
+    def confirm_baud(self, payload):
+        """Keep a new rate, see confirmBaud in the firmware."""
+        if self._baud_from_payload(payload) != self.link_baud_rate:
+            if self.baud_pending_until is not None:
+                self.revert_baud()
+            return
+        self.baud_pending_until = None
+        self.send_baud_status(BAUD_OK, self.link_baud_rate)
+
+    def begin_plan(self, payload):
+        """Announce a stimulus plan, see beginPlan in the firmware."""
+        if crc16(payload[:2]) != int.from_bytes(payload[2:4], 'little'):
+            self.send_plan_status(PLAN_BAD_CRC)
+            return
+        if self.test_running:
+            self.send_plan_status(PLAN_BUSY)
+            return
+
+        total = int.from_bytes(payload[:2], 'little')
+        self.plan_total = 0
+        self.plan_used = False
+        self.plan_received = 0
+        self.plan_window.clear()
+        if not self.binary_mode or total == 0 or total > MAX_PLAN_POINTS:
+            self.send_plan_status(PLAN_TOO_LARGE)
+            return
+        self.plan_total = total
+        self.send_plan_status(PLAN_OK)
+
+    def receive_plan_points(self, payload):
+        """Fill the plan window, see receivePlanPoints in the firmware."""
+        body, crc = payload[:-2], int.from_bytes(payload[-2:], 'little')
+        if crc16(body) != crc:
+            self.send_plan_status(PLAN_BAD_CRC)
+            return
+
+        start, count = int.from_bytes(body[:2], 'little'), body[2]
+        if (not self.plan_total or start != self.plan_received
+                or count > PLAN_WINDOW - len(self.plan_window) or start + count > self.plan_total):
+            self.send_plan_status(PLAN_OUT_OF_ORDER)
+            return
+
+        self.plan_window.extend(np.frombuffer(body[3:], dtype=PLAN_POINT_DTYPE, count=count))
+        self.plan_received += count
+        self.send_plan_status(PLAN_OK)
+
+    def start_test(self):
+        self.reply("Test starting...")
+        now = time.monotonic()
+        self.test_running = True
+        self.test_finished = False
+        self.test_start_time = now
+        self.timestamp = now
+        self.last_progress_time = now
+        self.point_tracker = -1
+        self.click_counter = 0
+        self.out_of_thres_counter = 0
+        if self.plan_used:
+            self.plan_total = 0
+        self.plan_used = self.plan_total > 0
+        self.current_point_duration = PLAN_LEAD_IN if self.plan_used else self.point_duration
+        self.current_pre_fire_delay = self.pre_fire_delay
+        self.current_laser_duration = self.laser_duration
+        self.click_tracker = ['0'] * self.total_points()
+        self.scheduled_press = None
+        self.send_event(EVENT_TEST_START, self.total_points())
+
+    def end_test(self, reason):
+        self.laser_on = False
+        self.laser_flag = False
+        self.test_running = False
+        self.test_finished = True
+        self.scheduled_press = None
+
+        if self.binary_mode:
+            self.send_event(EVENT_TEST_END)
+            self.reply("TEST_END")
+            self.reply(reason)
+            self.send_status_frame(MSG_RESULTS)
+            self.reply("System ready")
+            return
+
+        self.reply("TEST_END")
+        self.reply(f"Reason: {reason}")
+        self.reply(f"Click counter: {self.click_counter}")
+        self.reply(f"Click tracker: {''.join(self.click_tracker)}")
+        self.reply(f"Out-of-thres tracker: {self.out_of_thres_counter}")
+        self.reply("System ready")
+
+    def step(self, now):
+        """Advance the test logic to time now, the firmware's runTestLogic."""
+        with self._lock:
+            presses, self._pending_presses = self._pending_presses, 0
+
+        if not self.test_running:
+            return
+
+        # With a plan, wait if the host has not refilled the window in time
+        next_point_ready = (not self.plan_total or self.plan_window
+                            or self.point_tracker + 1 >= self.plan_total)
+
+        if now - self.timestamp > self.current_point_duration and next_point_ready:
+            self.point_tracker += 1
+            if self.point_tracker >= self.total_points():
+                self.end_test("Test completed successfully")
+                return
+
+            if self.laser_on:
+                self.laser_on = False
+                self.send_event(EVENT_LASER_OFF)
+            if self.plan_total:
+                point = self.plan_window.popleft()
+                self.current_pre_fire_delay = point['pre_fire_ms'] / 1000
+                self.current_laser_duration = point['laser_ms'] / 1000
+                self.current_point_duration = point['point_ms'] / 1000
+                self.send_plan_status(PLAN_OK)
+            self.send_event(EVENT_POINT_MOVED, self.total_points())
+            self.laser_flag = True
+            self.laser_start_time = now
+            self.timestamp = now
+
+            # Simulated patient decides whether to respond to this point
+            if self.hit_rate and self.random.random() < self.hit_rate:
+                self.scheduled_press = now + self.current_pre_fire_delay + self.reaction_time
+            else:
+                self.scheduled_press = None
+
+        if self.scheduled_press is not None and now >= self.scheduled_press:
+            self.scheduled_press = None
+            presses += 1
+
+        for _ in range(presses):
+            if self.laser_on:
+                self.laser_on = False
+                self.laser_flag = False
+                self.click_tracker[self.point_tracker] = '1'
+                self.send_event(EVENT_BUTTON_HIT)
+                self.send_event(EVENT_LASER_OFF, 1)
+            else:
+                self.send_event(EVENT_WRONG_PRESS)
+            self.click_counter += 1
+
+        # Laser control
+        if self.laser_flag:
+            if not self.laser_on:
+                if now - self.laser_start_time >= self.current_pre_fire_delay:
+                    self.laser_on = True
+                    self.laser_start_time = now
+                    self.send_event(EVENT_LASER_ON)
+            elif now - self.laser_start_time >= self.current_laser_duration:
+                self.laser_on = False
+                self.laser_flag = False
+                self.send_event(EVENT_LASER_OFF)
+
+        interval = self.heartbeat_interval if self.binary_mode else self.progress_interval
+        if now - self.last_progress_time >= interval:
+            self.print_test_status()
+            self.last_progress_time = now
+
+            # Repeat the plan credit, the host refills the window from it if a refill was lost
+            if self.plan_total and self.plan_received < self.plan_total and len(self.plan_window) < PLAN_WINDOW:
+                self.send_plan_status(PLAN_OK)
+
+        if now - self.test_start_time > self.test_timeout:
+            self.end_test("Test timed out")
+
+
+def run_benchmark(emulator, count, binary_protocol=True):
+    """Measure ping round trips through ArduinoTracker against the emulator.
+
+    Args:
+        emulator: Started VirtualArduino
+        count: Number of pings
+        binary_protocol: Switch to binary frames before measuring
+
+    Returns:
+        dict: Round-trip statistics in milliseconds
+    """
+    from app.core.arduino_tracker import ArduinoTracker
+
+    tracker = ArduinoTracker(auto_connect=False, baud_rate=emulator.baud_rate or 115200,
+                             binary_protocol=binary_protocol)
+    if not tracker.connect_to_port(emulator.port):
+        raise RuntimeError(f"Could not connect to emulator at {emulator.port}")
+
+    try:
+        round_trips = []
+        failures = 0
+        for _ in range(count):
+            start = time.perf_counter()
+            if tracker.ping():
+                round_trips.append((time.perf_counter() - start) * 1000)
+            else:
+                failures += 1
+    finally:
+        tracker.disconnect()
+
+    if not round_trips:
+        return {'count': 0, 'failures': failures}
+
+    round_trips.sort()
+    return {
+        'count': len(round_trips),
+        'failures': failures,
+        'min_ms': round_trips[0],
+        'median_ms': statistics.median(round_trips),
+        'p95_ms': round_trips[int(0.95 * (len(round_trips) - 1))],
+        'max_ms': round_trips[-1],
+    }
+
+
+def run_throughput_benchmark(emulator, rates=BAUD_RATES, count=500, timeout=10.0):
+    """Measure how fast status telemetry arrives at each negotiated baud rate.
+
+    For each rate a new ArduinoTracker connects in binary mode, negotiates that rate
+    and sends count status requests at once. The emulator answers each with a status
+    frame, paced at the link rate, and the time until the last one arrives is measured.
+
+    Args:
+        emulator: Started VirtualArduino, with pacing (baud_rate not None)
+        rates: Baud rates to measure
+        count: Status frames per rate
+        timeout: Seconds to wait for the frames of one rate
+
+    Returns:
+        list: One dict per rate, with the rate actually negotiated, frames and bytes
+              received, seconds, bytes/s, frames/s and the fraction of the line rate used
+    """
+    from app.core.arduino_tracker import ArduinoTracker
+
+    results = []
+    for rate in rates:
+        tracker = ArduinoTracker(auto_connect=False, baud_rate=BASE_BAUD, link_baud_rates=[rate])
+        if not tracker.connect_to_port(emulator.port):
+            raise RuntimeError(f"Could not connect to emulator at {emulator.port}")
+
+        received = threading.Event()
+        frames = [0]
+
+        def on_message(message):
+            if tracker.protocol.is_status_document(message):
+                frames[0] += 1
+                if frames[0] == count:
+                    received.set()
+
+        try:
+            link_rate = tracker.link_baud_rate
+            tracker.subscribe(on_message)
+            bytes_before = tracker.protocol.framer.bytes_received
+            start = time.perf_counter()
+            tracker._write(tracker.CMD_TEST_RESULTS * count)
+            received.wait(timeout)
+            seconds = time.perf_counter() - start
+            received_bytes = tracker.protocol.framer.bytes_received - bytes_before
+        finally:
+            tracker.unsubscribe(on_message)
+            # The next tracker starts at the base rate
+            if tracker.link_baud_rate != BASE_BAUD:
+                tracker.restore_baud(BASE_BAUD)
+            tracker.disconnect()
+
+        results.append({
+            'baud_rate': rate,
+            'link_baud_rate': link_rate,
+            'frames': frames[0],
+            'bytes': received_bytes,
+            'seconds': seconds,
+            'bytes_per_s': received_bytes / seconds,
+            'frames_per_s': frames[0] / seconds,
+            'line_usage': received_bytes * 10 / seconds / link_rate,
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Virtual eye tracker Arduino on a pseudo-terminal")
+    parser.add_argument('--baud', type=int, default=115200, help="Baud rate used to pace output")
+    parser.add_argument('--delay-ms', type=float, default=0.0, help="Delay added to every response")
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help="Maximum random extra delay")
+    parser.add_argument('--drop-rate', type=float, default=0.0, help="Probability of dropping a message")
+    parser.add_argument('--corrupt-rate', type=float, default=0.0, help="Probability of corrupting a message")
+    parser.add_argument('--hit-rate', type=float, default=0.8, help="Probability the simulated patient responds")
+    parser.add_argument('--text-only', action='store_true', help="Emulate firmware without binary mode")
+    parser.add_argument('--seed', type=int, default=None, help="Random seed")
+    parser.add_argument('--benchmark', type=int, metavar='N', default=0, help="Measure N ping round trips and exit")
+    parser.add_argument('--throughput', action='store_true', help="Measure status throughput at each baud rate and exit")
+    parser.add_argument('--max-baud', type=int, default=1000000, help="Highest rate the board accepts")
+    args = parser.parse_args()
+
+    emulator = VirtualArduino(
+        baud_rate=args.baud,
+        response_delay=args.delay_ms / 1000,
+        jitter=args.jitter_ms / 1000,
+        drop_rate=args.drop_rate,
+        corrupt_rate=args.corrupt_rate,
+        hit_rate=args.hit_rate,
+        binary_support=not args.text_only,
+        max_baud_rate=args.max_baud,
+        seed=args.seed,
+    )
+
+    with emulator:
+        if args.benchmark:
+            stats = run_benchmark(emulator, args.benchmark, binary_protocol=not args.text_only)
+            print(f"Round trips: {stats['count']} ok, {stats['failures']} failed")
+            if stats['count']:
+                print(f"min {stats['min_ms']:.2f} ms | median {stats['median_ms']:.2f} ms | "
+                      f"p95 {stats['p95_ms']:.2f} ms | max {stats['max_ms']:.2f} ms")
+            return
+
+        if args.throughput:
+            for stats in run_throughput_benchmark(emulator):
+                print(f"{stats['baud_rate']:>8} baud (link {stats['link_baud_rate']}): "
+                      f"{stats['frames']} frames, {stats['bytes_per_s'] / 1000:.1f} kB/s, "
+                      f"{stats['frames_per_s']:.0f} frames/s, {stats['line_usage']:.0%} of the line")
+            return
+
+        print(f"Virtual Arduino listening on {emulator.port} (Ctrl+C to stop)")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -2,45 +2,162 @@ import time
 import sys
 import serial
 import serial.tools.list_ports
-import json
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 
-class ArduinoTracker:
-    """Handles connection and communication with Arduino hardware."""
+from app.core.arduino_protocol import ArduinoProtocol, ProtocolConstants, ProtocolIOError
+from app.core.binary_codec import PLAN_OK, PLAN_STATUS_NAMES, BAUD_OK, BAUD_STATUS_NAMES
+from app.core.command_outbox import CommandOutbox
+from app.core.connection_watchdog import ConnectionWatchdog
+
+
+class SerialReader(threading.Thread):
+    """Background thread that owns reading from the Arduino serial port.
+    
+    Received bytes are fed to the protocol, which frames them into messages and
+    dispatches them to waiting requests, the message queue and subscribers.
+    """
+    
+    def __init__(self, port, protocol):
+        super().__init__(name="arduino-reader", daemon=True)
+        self.port = port
+        self.protocol = protocol
+        self.error = None
+        self._stop_event = threading.Event()
+    
+    def stop(self):
+        """Ask the thread to exit, it stops after its current read."""
+        self._stop_event.set()
+    
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                # Blocks for at most the port's read timeout
+                data = self.port.read(self.port.in_waiting or 1)
+            except (serial.SerialException, OSError, TypeError) as e:
+                # Port closed or device unplugged
+                if not self._stop_event.is_set():
+                    print(f"Serial reader error: {e}")
+                    self.error = e
+                break
+            
+            if data:
+                self.protocol.feed(data)
+
+
+def probe_port(port, baud_rate=115200, timeout=3.0, poll_interval=0.1):
+    """Open a port and check that the eye tracker firmware answers on it.
     
-    # Command bytes for efficient serial communication (single-byte)
-    CMD_START_TEST = b'\x01'      # Start test (0x01)
-    CMD_END_TEST = b'\x02'        # End test (0x02)
-    CMD_PING = b'\x03'            # Ping signal to check connection (0x03)
-    CMD_WITHIN_THRESHOLD = b'\x04'  # Within threshold signal (0x04)
-    CMD_OUT_OF_THRESHOLD = b'\x05'  # Out of threshold signal (0x05)
-    CMD_TEST_RESULTS = b'\x06'  # Check test status: Ready, Running, Ended (0x06)
+    DTR is kept low where the platform allows it, so the board is not reset by opening
+    the port. Instead of sleeping for a reset, CMD_IDENTIFY is sent every poll_interval
+    until the firmware answers, which takes a few milliseconds on a board that is
+    already running. Firmware without CMD_IDENTIFY is recognised by its ping response.
     
-    # Response codes from Arduino
-    RESP_ACK = 'O'           # Command acknowledged
-    RESP_TEST_START = "Test starting..."
-    RESP_TEST_END = "TEST_END"
-    RESP_SYSTEM_ONLINE = "Online"
-    RESP_SYSTEM_READY = "Ready"
-    RESP_SYSTEM_NOT_READY = "Running"
+    Args:
+        port: Serial port to probe
+        baud_rate: Baud rate for serial communication
+        timeout: Maximum seconds to wait, covers a board that resets on open
+        poll_interval: Seconds between handshake attempts
+        
+    Returns:
+        tuple: (open serial.Serial, identity string), or (None, None) if not our firmware
+    """
+    try:
+        handle = serial.Serial()
+        handle.port = port
+        handle.baudrate = baud_rate
+        handle.timeout = 0.01
+        handle.dtr = False  # Avoid resetting the board when possible
+        handle.open()
+    except (serial.SerialException, OSError, ValueError) as e:
+        print(f"Probe {port}: {e}")
+        return None, None
     
-    def __init__(self, auto_connect=True, baud_rate=115200, timeout=2, on_detect_callback=None, port_identifiers=None):
+    buffer = bytearray()
+    identity = None
+    legacy = False
+    attempt = 0
+    deadline = time.monotonic() + timeout
+    try:
+        while identity is None and time.monotonic() < deadline:
+            # Alternate with ping for legacy firmware, commands sent together would be discarded
+            command = ProtocolConstants.CMD_PING if attempt % 2 and not legacy else ProtocolConstants.CMD_IDENTIFY
+            attempt += 1
+            handle.write(command)
+            
+            poll_end = time.monotonic() + poll_interval
+            while time.monotonic() < poll_end:
+                buffer.extend(handle.read(handle.in_waiting or 1))
+                match = ProtocolConstants.IDENTITY_PATTERN.search(buffer)
+                if match:
+                    identity = match.group().decode()
+                    break
+            
+            if identity is None and legacy:
+                # Answered ping but not identify on the following attempt
+                identity = ProtocolConstants.LEGACY_IDENTITY
+            legacy = any(response.encode() in buffer for response in ProtocolConstants.PING_RESPONSES)
+    except (serial.SerialException, OSError) as e:
+        print(f"Probe {port}: {e}")
+    
+    if identity is None:
+        handle.close()
+        return None, None
+    return handle, identity
+
+
+class ArduinoTracker(ProtocolConstants):
+    """Handles connection and communication with Arduino hardware.
+    
+    Blocking driver of ArduinoProtocol: a reader thread feeds received bytes to the
+    protocol and each operation waits on a future for its response.
+    """
+    
+    # Read timeout of the port, bounds how long the reader thread takes to notice a stop request
+    READ_TIMEOUT = 0.1
+    
+    # Longest time a probed board may take to answer, covers a reset on opening the port
+    PROBE_TIMEOUT = 3.0
+    
+    # Pings that must be answered without a corrupt frame before a raised baud rate is kept
+    BAUD_VERIFY_PINGS = 8
+    
+    # Seconds the firmware waits for a rate change to be confirmed before falling back
+    BAUD_CONFIRM_TIMEOUT = 0.5
+    
+    def __init__(self, auto_connect=True, baud_rate=115200, timeout=2, on_detect_callback=None, port_identifiers=None,
+                 binary_protocol=True, preferred_device=None, link_baud_rates=None):
         """Initialize the Arduino tracker.
         
         Args:
             auto_connect: If True, try to auto-connect to Arduino
             baud_rate: Baud rate for serial communication
-            timeout: Serial connection timeout in seconds
+            timeout: Time to wait for a response to a command in seconds
             on_detect_callback: Callback function called when multiple ports are detected
                                 Function signature: callback(ports) -> selected_port
             port_identifiers: List of strings to identify Arduino ports
+            binary_protocol: If True, switch the device to binary frames after connecting
+            preferred_device: Device dict of the last successful connection (see self.device), tried first
+            link_baud_rates: Faster rates to negotiate after connecting in binary mode, the highest
+                             one that verifies is used. None to stay at baud_rate
         """
         self.arduino = None
+        self.preferred_device = preferred_device
+        self.device = None # Port, serial number and VID:PID of the connected board
+        self.identity = None # Firmware identification string
         self.baud_rate = baud_rate
         self.timeout = timeout
         self.port_identifiers = port_identifiers or ['arduino', 'uno', 'usbserial']
-        self.is_test_running = False
-        self.test_results = None
-        self.prev_command = None
+        self.binary_protocol = binary_protocol
+        self.link_baud_rates = link_baud_rates or []
+        self.negotiated_baud_rate = None # Rate the board was last switched to, it keeps it until reset
+        self.protocol = ArduinoProtocol()
+        self.reader = None # Background thread reading from the port, started on connect
+        self.outbox = None # Background thread sending posted commands, started on connect
+        self.watchdog = None # Background thread reconnecting a lost link, see start_watchdog
+        self.plan = None # StimulusPlan being streamed to the Arduino, see load_plan
+        self._write_lock = threading.Lock()
+        self._acks_checked = 0
         
         # If auto_connect is enabled, try to connect automatically
         if auto_connect:
@@ -50,9 +167,29 @@ class ArduinoTracker:
             else:
                 print(f"Auto-connect failed: {message}")
     
+    # Protocol state, kept on the protocol so both drivers share it
+    @property
+    def is_test_running(self):
+        return self.protocol.is_test_running
+    
+    @is_test_running.setter
+    def is_test_running(self, value):
+        self.protocol.is_test_running = value
+    
+    @property
+    def test_results(self):
+        return self.protocol.test_results
+    
+    @property
+    def prev_command(self):
+        return self.protocol.prev_command
+    
     def try_connect(self, on_detect_callback=None):
         """Try to connect to Arduino, handling port detection and selection.
         
+        The last known good device is tried first. Otherwise all candidate ports are
+        probed concurrently and only ports answering with our firmware are considered.
+        
         Args:
             on_detect_callback: Callback function for port selection
             
@@ -64,36 +201,79 @@ class ArduinoTracker:
         if not ports:
             return False, "No Arduino devices detected"
         
-        if len(ports) == 1:
-            # Only one port found, connect automatically
-            port = ports[0]['port']
-            success = self.connect_to_port(port)
-            
-            if success:
-                return True, f"Connected to Arduino at {port}"
-            else:
-                return False, f"Failed to connect to Arduino at {port}"
+        # Fast path, the board we used last time
+        if self.preferred_device:
+            for port in ports:
+                if self._matches_device(port, self.preferred_device):
+                    if self.connect_to_port(port['port']):
+                        return True, f"Connected to Arduino at {port['port']} (last used device)"
+                    ports = [other for other in ports if other is not port]
+                    break
+        
+        found = self.probe_ports(ports)
+        
+        if not found:
+            return False, "No eye tracker firmware found on " + ", ".join(port['port'] for port in ports)
+        
+        if len(found) == 1:
+            # Only one board answered, connect automatically
+            port, handle, identity = found[0]
+            note = ""
+        elif on_detect_callback:
+            # Multiple boards answered, let user select
+            selected_port = on_detect_callback([port for port, _, _ in found])
+            selected = [entry for entry in found if entry[0]['port'] == selected_port]
+            if not selected:
+                for _, handle, _ in found:
+                    handle.close()
+                return False, "No port selected"
+            port, handle, identity = selected[0]
+            note = ""
         else:
-            # Multiple ports found, let user select
-            if on_detect_callback:
-                selected_port = on_detect_callback(ports)
-                if selected_port:
-                    success = self.connect_to_port(selected_port)
-                    if success:
-                        return True, f"Connected to Arduino at {selected_port}"
-                    else:
-                        return False, f"Failed to connect to Arduino at {selected_port}"
-                else:
-                    return False, "No port selected"
-            else:
-                # Default to first port if no callback
-                port = ports[0]['port']
-                success = self.connect_to_port(port)
-                
-                if success:
-                    return True, f"Connected to Arduino at {port} (default selection)"
-                else:
-                    return False, f"Failed to connect to Arduino at {port} (default selection)"
+            # Default to first board if no callback
+            port, handle, identity = found[0]
+            note = " (default selection)"
+        
+        for other_port, other_handle, _ in found:
+            if other_handle is not handle:
+                other_handle.close()
+        
+        if self._attach(handle, identity, port):
+            return True, f"Connected to Arduino at {port['port']}{note}"
+        return False, f"Failed to connect to Arduino at {port['port']}{note}"
+
+    def probe_ports(self, ports):
+        """Probe candidate ports concurrently for our firmware.
+        
+        Args:
+            ports: Port dicts from detect_arduino_ports
+            
+        Returns:
+            list: (port dict, open serial.Serial, identity) for every port that answered
+        """
+        if not ports:
+            return []
+        
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=len(ports)) as pool:
+            results = list(pool.map(
+                lambda port: probe_port(port['port'], self.baud_rate, self.PROBE_TIMEOUT), ports
+            ))
+        
+        found = [(port, handle, identity) for port, (handle, identity) in zip(ports, results) if handle]
+        print(f"Probed {len(ports)} ports in {time.monotonic() - start:.2f}s, found {len(found)}")
+        return found
+
+    @staticmethod
+    def _matches_device(port, device):
+        """Check if a detected port is the given device, by serial number or else VID:PID and path."""
+        if device.get('serial_number'):
+            return port.get('serial_number') == device['serial_number']
+        return (
+            device.get('vid') is not None
+            and (port.get('vid'), port.get('pid')) == (device.get('vid'), device.get('pid'))
+            and port['port'] == device.get('port')
+        )
 
     def detect_arduino_ports(self):
         """Detect available Arduino serial ports.
@@ -113,27 +293,69 @@ class ArduinoTracker:
             # Debug output
             print(f"Port: {port_device}, Description: {port_description}")
             
-            # Check if any identifier matches the port description
-            if any(identifier in port_description for identifier in self.port_identifiers):
-                arduino_ports.append({
-                    'port': port_device,
-                    'description': port_info.description
-                })
+            # Check if any identifier matches the port description, or it is the last used board
+            port = self._describe_port(port_info)
+            if any(identifier in port_description for identifier in self.port_identifiers) or (
+                self.preferred_device and self._matches_device(port, self.preferred_device)
+            ):
+                arduino_ports.append(port)
         
         return arduino_ports
 
-    def connect_to_port(self, port):
+    @staticmethod
+    def _describe_port(port_info):
+        """Port dict with the USB identifiers used to recognise the board next time."""
+        return {
+            'port': port_info.device,
+            'description': port_info.description,
+            'serial_number': port_info.serial_number,
+            'vid': port_info.vid,
+            'pid': port_info.pid,
+        }
+
+    def connect_to_port(self, port, baud_rate=None):
         """Connect to Arduino at specified port.
         
         Args:
             port: Serial port to connect to
+            baud_rate: Rate to probe at, None for self.baud_rate
+            
+        Returns:
+            bool: True if connection successful, False otherwise
+        """
+        handle, identity = probe_port(port, baud_rate or self.baud_rate, self.PROBE_TIMEOUT)
+        if handle is None:
+            print(f"No eye tracker firmware answered on {port}")
+            return False
+        
+        port_info = next((info for info in serial.tools.list_ports.comports() if info.device == port), None)
+        device = self._describe_port(port_info) if port_info else {'port': port}
+        return self._attach(handle, identity, device)
+
+    def _attach(self, handle, identity, device):
+        """Take over a probed port: start the reader and outbox, verify and set up the protocol.
+        
+        Args:
+            handle: Open serial.Serial returned by probe_port
+            identity: Identity string returned by probe_port
+            device: Port dict of the board
             
         Returns:
             bool: True if connection successful, False otherwise
         """
         try:
-            self.arduino = serial.Serial(port, self.baud_rate, timeout=self.timeout)
-            time.sleep(2)  # Allow time for Arduino reset
+            # Short read timeout, the reader thread polls the port and requests use self.timeout
+            handle.timeout = self.READ_TIMEOUT
+            handle.reset_input_buffer()
+            self.arduino = handle
+            self.identity = identity
+            self.device = device
+            
+            # A board that was not reset may still be sending binary frames
+            self.protocol.reset(binary=identity.endswith(" binary"))
+            self._start_reader()
+            self.outbox = CommandOutbox(self)
+            self.outbox.start()
             
             # Test connection by pinging
             if not self.ping():
@@ -142,45 +364,215 @@ class ArduinoTracker:
                 return False
         
             else:
-                print("Connection verified with ping")
+                print(f"Connection verified with ping ({identity})")
+                if identity != self.LEGACY_IDENTITY:
+                    if self.binary_protocol:
+                        self.set_binary_mode()
+                    if self.link_baud_rates and self.protocol.binary_mode:
+                        self.negotiate_baud()
+                    # After the rate change, round trips get shorter with it
+                    self.sync_clock()
                 return True
                 
         except serial.SerialException as e:
             print(f"Connection error: {e}")
-            self.arduino = None
+            self.disconnect()
             return False
 
+    def _start_reader(self):
+        """Start the background thread reading from the port."""
+        self.reader = SerialReader(self.arduino, self.protocol)
+        self.reader.start()
+
+    def _write(self, data, expects_ack=False):
+        """Write bytes to the port, safe to call from several threads.
+        
+        Returns:
+            float: Clock time the write started, for round-trip measurement
+        """
+        metrics = self.protocol.metrics
+        with self._write_lock:
+            sent_at = metrics.clock()
+            self.arduino.write(data)
+            self.arduino.flush()
+            write_seconds = metrics.clock() - sent_at
+        metrics.command_sent(self.protocol.command_name(data), sent_at, write_seconds, expects_ack)
+        return sent_at
+
+    def _execute(self, request):
+        """Write a request's command and wait for its response.
+        
+        Returns as soon as the response is received by the reader thread.
+        
+        Returns:
+            The response message, or None on timeout or if no response is expected
+        """
+        if request.predicate is None:
+            self._write(request.command, expects_ack=request.command in self.ACKED_COMMANDS)
+            return None
+        
+        future = Future()
+        self.protocol.expect(request.predicate, future)
+        try:
+            sent_at = request.sent_at = self._write(request.command)
+            response = future.result(timeout=self.timeout if request.timeout is None else request.timeout)
+            self.protocol.metrics.response_received(self.protocol.command_name(request.command), sent_at)
+            return response
+        except FutureTimeoutError:
+            return None
+        finally:
+            self.protocol.cancel(future)
+
+    def _run(self, operation):
+        """Drive a protocol operation to completion, blocking until it returns."""
+        try:
+            request = next(operation)
+            while True:
+                try:
+                    response = self._execute(request)
+                except (serial.SerialException, OSError) as e:
+                    request = operation.throw(ProtocolIOError(str(e)))
+                else:
+                    request = operation.send(response)
+        except StopIteration as stop:
+            return stop.value
+
     def ping(self):
         """Ping Arduino to verify connection.
         
         Returns:
-            bool: True if ping successful, False otherwise
+            str: Arduino's status response if successful, False otherwise
+        """
+        if not self.is_connected():
+            return False
+        return self._run(self.protocol.ping())
+
+    def set_binary_mode(self):
+        """Switch the Arduino to binary frames, falls back to text for older firmware.
+        
+        Returns:
+            bool: True if the Arduino now sends binary frames
         """
         if not self.is_connected():
             return False
+        if self._run(self.protocol.set_binary_mode()):
+            print("Using binary protocol")
+            return True
+        print("Binary protocol not supported by firmware, using text protocol")
+        return False
+
+    def sync_clock(self, samples=8):
+        """Exchange clock sync messages to map the Arduino's timestamps onto the host clock.
+        
+        Args:
+            samples: Number of exchanges, the fastest ones are used for the estimate
             
-        try:
-            # Clear buffers
-            self.arduino.reset_input_buffer()
-            self.arduino.reset_output_buffer()
+        Returns:
+            bool: True if the Arduino's clock is mapped, False for firmware without CMD_SYNC
+        """
+        if not self.is_connected():
+            return False
+        for _ in range(samples):
+            if not self._run(self.protocol.sync_clock()):
+                break
+        return self.protocol.clock_sync.synced
+
+    @property
+    def link_baud_rate(self):
+        """Baud rate of the open link, None if not connected."""
+        return self.arduino.baudrate if self.is_connected() else None
+
+    def negotiate_baud(self, rates=None):
+        """Raise the link rate to the fastest rate both sides verify, needs the binary protocol.
+        
+        Each rate is tried from the highest down. The Arduino answers the request at the
+        current rate and switches. The host follows and confirms at the new rate, and the
+        rate is kept once the confirmation and BAUD_VERIFY_PINGS pings come back without
+        a corrupt frame. Otherwise both sides go back to the current rate.
+        
+        Args:
+            rates: Rates to try, None for self.link_baud_rates
             
-            # Send ping command
-            self.arduino.write(self.CMD_PING)
-            self.arduino.flush()
+        Returns:
+            int: Baud rate of the link afterwards
+        """
+        if not self.is_connected() or not self.protocol.binary_mode:
+            return self.link_baud_rate
+        
+        current = self.arduino.baudrate
+        for rate in sorted(self.link_baud_rates if rates is None else rates, reverse=True):
+            if rate <= current:
+                break
             
-            # Wait for response
-            start_time = time.time()
-            while time.time() - start_time < 2:
-                if self.arduino.in_waiting > 0:
-                    response = self.arduino.readline().decode('utf-8', errors='ignore').strip()
-                    return response
-                time.sleep(0.1)
-                
-            return False
+            status = self._run(self.protocol.set_baud(rate))
+            if status is None:
+                print("Baud rate negotiation not supported by firmware")
+                break
+            if status['status'] != BAUD_OK:
+                print(f"Baud rate {rate} rejected ({BAUD_STATUS_NAMES.get(status['status'])})")
+                continue
+            
+            self._set_port_baud(rate)
+            if self._run(self.protocol.confirm_baud(rate, self.BAUD_CONFIRM_TIMEOUT)) and self._verify_link():
+                print(f"Link running at {rate} baud")
+                self.negotiated_baud_rate = rate
+                return rate
+            
+            print(f"Baud rate {rate} failed verification, falling back to {current}")
+            if not self.restore_baud(current):
+                break
+        return self.link_baud_rate
+
+    def restore_baud(self, rate=None):
+        """Bring both sides back to a slower rate, e.g. when frames arrive corrupt.
+        
+        Works whether or not the Arduino confirmed the faster rate: a confirmed board is
+        asked to switch, an unconfirmed one falls back by itself.
+        
+        Args:
+            rate: Rate to go back to, None for self.baud_rate
             
-        except serial.SerialException as e:
-            print(f"Ping error: {e}")
+        Returns:
+            bool: True if the Arduino answers at that rate
+        """
+        if not self.is_connected():
+            return False
+        rate = rate or self.baud_rate
+        
+        # The reply to the request may be unreadable, it is not waited for
+        try:
+            self._write(self.protocol.encode_baud(self.CMD_SET_BAUD, rate))
+            time.sleep(0.05)
+        except (serial.SerialException, OSError) as e:
+            print(f"Error restoring baud rate: {e}")
+        self._set_port_baud(rate)
+        
+        if not self._run(self.protocol.confirm_baud(rate, self.BAUD_CONFIRM_TIMEOUT)):
+            # An unconfirmed board falls back after its timeout
+            time.sleep(self.BAUD_CONFIRM_TIMEOUT)
+        if not self.ping():
+            print(f"Arduino does not answer at {rate} baud")
             return False
+        self.negotiated_baud_rate = rate if rate != self.baud_rate else None
+        return True
+
+    def _set_port_baud(self, rate):
+        """Change the host side of the link, between writes."""
+        with self._write_lock:
+            self.arduino.baudrate = rate
+
+    def _verify_link(self):
+        """Ping a few times and check no frame arrived corrupt meanwhile."""
+        dropped = self.protocol.framer.frames_dropped
+        for _ in range(self.BAUD_VERIFY_PINGS):
+            if not self.ping():
+                return False
+        return self.protocol.framer.frames_dropped == dropped
+
+    @property
+    def clock_sync(self):
+        """ClockSync mapping the Arduino's millis() to the host clock (time.perf_counter)."""
+        return self.protocol.clock_sync
 
     def is_connected(self):
         """Check if Arduino is connected.
@@ -190,66 +582,190 @@ class ArduinoTracker:
         """
         return self.arduino is not None and self.arduino.is_open
     
-    def disconnect(self):
-        """Disconnect from Arduino."""
+    def disconnect(self, keep_state=False):
+        """Disconnect from Arduino.
+        
+        Args:
+            keep_state: If True, keep the test state and the watchdog, used when the
+                        watchdog closes a broken link before reconnecting
+        """
+        if self.watchdog and not keep_state:
+            self.watchdog.stop()
+            self.watchdog = None
+        if self.outbox:
+            self.outbox.stop()
+            self.outbox = None
+        if self.reader:
+            self.reader.stop()
         try:
             if self.arduino and self.arduino.is_open:
                 self.arduino.close()
         except serial.SerialException as e:
             print(f"Error during disconnect: {e}")
         finally:
+            if self.reader and self.reader is not threading.current_thread():
+                self.reader.join(timeout=1)
+            self.reader = None
             self.arduino = None
-            self.is_test_running = False
+            if not keep_state:
+                self.is_test_running = False
+
+    def reconnect(self):
+        """Connect again to the last connected board, probing for it if it moved to another port.
+        
+        Returns:
+            bool: True if connection successful, False otherwise
+        """
+        device = self.device
+        if device and device.get('port') and self.connect_to_port(device['port']):
+            return True
+        # A board that was not reset still runs at the negotiated rate
+        if device and device.get('port') and self.negotiated_baud_rate and self.connect_to_port(
+            device['port'], self.negotiated_baud_rate
+        ):
+            return True
+        if device and device.get('serial_number'):
+            self.preferred_device = device
+            success, message = self.try_connect()
+            print(message)
+            return success
+        return False
+
+    def start_watchdog(self, on_state_change=None, **kwargs):
+        """Monitor the link in the background and reconnect automatically when it is lost.
+        
+        Args:
+            on_state_change: Function (state, detail) called from the watchdog thread,
+                             see ConnectionWatchdog for the states
+            **kwargs: Heartbeat and backoff settings passed to ConnectionWatchdog
+        """
+        if self.watchdog or not self.is_connected():
+            return
+        self.watchdog = ConnectionWatchdog(self, on_state_change, **kwargs)
+        self.watchdog.start()
+
+    def subscribe(self, callback):
+        """Call callback(message) for every message received from the Arduino.
+        
+        The callback runs on the reader thread and must not block.
+        """
+        self.protocol.subscribe(callback)
+
+    def unsubscribe(self, callback):
+        """Remove a callback added with subscribe."""
+        self.protocol.unsubscribe(callback)
 
     def send_command(self, command):
-        """Send command to Arduino and verify acknowledgment.
+        """Send command to Arduino.
         
         Args:
-            command: Command to send
+            command: Command to send, bytes or 'H' / 'L'
             
         Returns:
-            int: 1 if successful, 0 if failed, 2 if special response received
+            int: 1 if successful, 0 if failed
         """
         if not self.is_connected():
             print("Cannot send command: Not connected to Arduino")
             return 0
-            
-        # Convert command to bytes if it's a string
-        if isinstance(command, str):
-            if command == 'H':
-                command = self.CMD_OUT_OF_THRESHOLD
-            elif command == 'L':
-                command = self.CMD_WITHIN_THRESHOLD
-            else:
-                print(f"Unknown command sent: {command}")
-                return 0
-            
-        try:
-            self.arduino.write(command)
-            self.arduino.flush()
-            self.prev_command = command
-            return 1
-        except serial.SerialException as e:
-            print(f"Error sending command: {e}")
-            return 0
-        
+        return self._run(self.protocol.send_command(command))
     
+    def post_command(self, command, coalesce_key=None, on_failure=None):
+        """Queue a command to be sent by the outbox thread, without blocking.
+        
+        Use this from the frame processing path, a stalled serial port then delays the
+        command instead of the frame loop.
+        
+        Args:
+            command: Command to send, bytes or 'H' / 'L'
+            coalesce_key: Queued commands with the same key are replaced by the latest one
+            on_failure: Called with the command from the outbox thread if sending fails
+            
+        Returns:
+            bool: True if the command was queued
+        """
+        outbox = self.outbox
+        if outbox is None or not self.is_connected():
+            return False
+        outbox.post(command, coalesce_key, on_failure)
+        return True
+
     def check_ack(self):
-        """Non-blocking check for Arduino acknowledgment."""
+        """Non-blocking check for Arduino acknowledgment.
+        
+        Returns:
+            int: 1 if an acknowledgement arrived since the last check, 0 otherwise
+        """
         if not self.is_connected():
             return 0
+        
+        # Acknowledgments are matched to their commands by the protocol's metrics
+        acks = self.protocol.metrics.acks_received
+        acked = acks > self._acks_checked
+        self._acks_checked = acks
+        return int(acked)
+
+    def load_plan(self, plan):
+        """Upload a stimulus plan for the next test, needs the binary protocol.
+        
+        The Arduino only buffers a small window of points. The first window is sent now,
+        and whenever the Arduino frees a slot during the test, it credits the host, and the
+        next points are posted to the outbox.
+        
+        Args:
+            plan: StimulusPlan to run
             
+        Returns:
+            bool: True if the Arduino accepted the plan, False if it runs its built-in points
+        """
+        if not self.is_connected() or not self.protocol.binary_mode:
+            print("Stimulus plans need the binary protocol, using the built-in points")
+            return False
         try:
-            if self.arduino.in_waiting > 0:
-                response = self.arduino.read(1)
-                if response == b'O':
-                    return 1
-                else:
-                    return 2
-            return 0
-        except serial.SerialException as e:
-            print(f"Error checking acknowledgment: {e}")
-            return 0
+            plan.validate()
+        except ValueError as e:
+            print(f"Invalid stimulus plan: {e}")
+            return False
+        
+        self.protocol.unsubscribe(self._on_plan_status)
+        self.plan = None
+        status = self._run(self.protocol.begin_plan(plan))
+        if not status or status['status'] != PLAN_OK:
+            reason = PLAN_STATUS_NAMES.get(status['status']) if status else "no response"
+            limit = f", the device accepts at most {status['max_points']} points" if status else ""
+            print(f"Stimulus plan of {len(plan)} points rejected ({reason}{limit}), using the built-in points")
+            return False
+        
+        self.plan = plan
+        self.protocol.subscribe(self._on_plan_status)
+        status = self._run(self.protocol.send_plan_points(plan, 0, min(status['free'], len(plan))))
+        print(f"Stimulus plan of {len(plan)} points loaded, {status['received'] if status else 0} buffered on the device")
+        return status is not None and status['status'] == PLAN_OK
+
+    def _on_plan_status(self, message):
+        """Refill the Arduino's plan window when it reports free slots, called on the reader thread."""
+        plan = self.plan
+        if plan is None or not self.protocol.is_plan_response(message):
+            return
+        status = message['plan']
+        received, free = status['received'], status['free']
+        if received >= len(plan) or free == 0:
+            return
+        # Resent from 'received', so lost or rejected points are simply sent again
+        command = self.protocol.encode_plan_points(plan, received, min(free, len(plan) - received))
+        self.post_command(command, coalesce_key='plan')
+
+    def get_link_metrics(self):
+        """Round-trip, write-blocking and outstanding-command statistics of the link.
+        
+        Returns:
+            dict: See SerialMetrics.summary, with the outbox's CommandOutbox.summary under 'outbox'
+                  the clock estimate (ClockSync.summary) under 'clock' and the link rate under 'baud_rate'
+        """
+        summary = self.protocol.metrics.summary()
+        summary['outbox'] = self.outbox.summary() if self.outbox else None
+        summary['clock'] = self.protocol.clock_sync.summary()
+        summary['baud_rate'] = self.link_baud_rate
+        return summary
 
     def start_test(self):
         """Start the test sequence on Arduino.
@@ -260,43 +776,7 @@ class ArduinoTracker:
         if not self.is_connected():
             print("Cannot start test: Not connected to Arduino")
             return False
-            
-        try:
-            # Ping to check test status and system state
-            status = self.ping()
-            print("ping status ", status)
-            if self.RESP_SYSTEM_NOT_READY in status:
-                self.stop_test()
-        
-            # Clear input buffer
-            self.arduino.reset_input_buffer()
-            self.arduino.reset_output_buffer()
-            
-            # Send start test command
-            self.arduino.write(self.CMD_START_TEST)
-            self.arduino.flush()
-            
-            # Wait for confirmation
-            start_time = time.time()
-            while time.time() - start_time < 2:
-                if self.arduino.in_waiting > 0:
-                    response = self.arduino.readline().decode('utf-8', errors='ignore').strip()
-                    print(f"Start test response: {response}")
-                    if self.RESP_TEST_START in response:
-                        self.is_test_running = True
-                        self.test_results = None
-                        return True
-                else:
-                    print("no inwaiting ")
-
-                time.sleep(0.1)
-                
-            print("No or wrong response received for start test command")
-            return False
-            
-        except serial.SerialException as e:
-            print(f"Error starting test: {e}")
-            return False
+        return self._run(self.protocol.start_test())
 
     def stop_test(self):
         """Stop the current test.
@@ -307,33 +787,7 @@ class ArduinoTracker:
         if not self.is_connected():
             print("Cannot stop test: Not connected")
             return False
-            
-        try:
-            # Send end test command
-            self.arduino.write(self.CMD_END_TEST)
-            self.arduino.flush()
-            
-            # Wait for confirmation
-            start_time = time.time()
-            test_ended = False
-            
-            while time.time() - start_time < 3:
-                if self.arduino.in_waiting > 0:
-                    response = self.arduino.readline().decode('utf-8', errors='ignore').strip()
-                    print(f"Stop test response: {response}")
-                    if self.RESP_TEST_END in response:
-                        test_ended = True
-                        break
-                time.sleep(0.1)
-            
-            # Mark test as not running
-            self.is_test_running = False
-            
-            return test_ended
-            
-        except serial.SerialException as e:
-            print(f"Error stopping test: {e}")
-            return False
+        return self._run(self.protocol.stop_test())
 
     def get_test_results(self, timeout=5):
         """Get results from the completed test.
@@ -348,75 +802,18 @@ class ArduinoTracker:
         if not self.is_connected():
             print("Cannot get test results: Not connected to Arduino")
             return None
-        
-        # If we already have results, return them
-        if self.test_results:
-            return self.test_results
-        
-        try:
-            # Ping to check test status and system state
-            status = self.ping()
-            print("status ", status)
-            if self.RESP_SYSTEM_NOT_READY in status:
-                print("System not ready!")
-                return None
-            elif self.RESP_SYSTEM_ONLINE in status: 
-                print("No test initiated!")
-                return None              
-        
-            # Clear input buffer
-            self.arduino.reset_input_buffer()
-            
-            # Send start test command
-            self.arduino.write(self.CMD_TEST_RESULTS)
-            self.arduino.flush()
-        
-            # Wait for results up to timeout
-            start_time = time.time()
-            while time.time() - start_time < timeout:
-                if self.arduino.in_waiting > 0:
-                    line = self.arduino.readline().decode('utf-8', errors='ignore').strip()
-                    print(f"Results line: {line}")
-
-                    if line.startswith("{") and line.endswith("}"):
-                        try:
-                            data = json.loads(line)
-                            return data
-                        except json.JSONDecodeError:
-                            print(f"JSON decode error: {line}")
-                            return None
-                            
-                time.sleep(0.1)
-
-        except serial.SerialException as e:
-            print(f"Error stopping test: {e}")
-            return None
-
-        print(f"Timed out waiting for test results after {timeout} seconds")
-        return None
+        return self._run(self.protocol.get_test_results(timeout))
 
     def read_available_data(self):
         """Read and return any available data from Arduino.
         
         Returns:
-            list: List of lines received from Arduino, or empty list if none
+            list: List of messages received from Arduino (JSON documents as dicts), or empty list if none
         """
         if not self.is_connected():
             return []
             
-        lines = []
-        try:
-            while self.arduino.in_waiting > 0:
-                line = self.arduino.readline().decode('utf-8', errors='ignore').strip()
-                if line.startswith("{") and line.endswith("}"):
-                    json_data = json.loads(line)
-                    lines.append(json_data)
-                else:
-                    lines.append(line)
-        except serial.SerialException as e:
-            print(f"Error reading data: {e}")
-            
-        return lines
+        return self.protocol.drain()
 
     def check_connection(self):
         """Check if Arduino is still responding.
@@ -430,56 +827,18 @@ class ArduinoTracker:
             return True
         
     def get_test_status(self):
-        """Check if test is still ongoing, and retrieve current test info."""
+        """Check if test is still ongoing, and retrieve current test info.
+        
+        Consumes the messages queued since the last call, nothing received
+        in between is discarded.
+        """
         if not self.is_connected():
             return {'test_status': 'Not connected'}
 
-        try:
-            # Read all available lines first
-            lines = []
-            while self.arduino.in_waiting > 0:
-                line = self.arduino.readline().decode('utf-8', errors='ignore').strip()
-                if line:  # Only add non-empty lines
-                    lines.append(line)
-            
-            # NOW clear the buffers after reading everything
-            self.arduino.reset_input_buffer()
-            self.arduino.reset_output_buffer()
-            
-            if not lines:
-                return {'test_status': "No response"}
-            
-            # print("lines:", lines)
-                
-            # Process lines - prioritize TEST_END messages
-            test_end_found = False
-            latest_status = None
-            
-            for line in lines:
-                if self.RESP_TEST_END in line:
-                    test_end_found = True
-                elif self.RESP_SYSTEM_READY in line:
-                    latest_status = {'test_status': 'Ready'}
-                elif line.startswith("{") and line.endswith("}"):
-                    try:
-                        data = json.loads(line)
-                        latest_status = data
-                        # print("data from get test status ", data)
-                    except json.JSONDecodeError:
-                        print(f"JSON decode error: {line}")
-            
-            # Return TEST_END status if found, otherwise return latest status
-            if test_end_found:
-                self.is_test_running = False
-                return {'test_status': 'Finished'}
-            
-            # print('latest_status', latest_status)
-            return latest_status or {'test_status': "No valid response"}
-
-        except serial.SerialException as e:
-            print(f"Ping error: {e}")
+        if self.reader.error is not None:
             return {'test_status': "Serial error"}
 
+        return self.protocol.test_status(self.protocol.drain())
 
 def select_port_menu(ports):
     """Display a menu for selecting a port.
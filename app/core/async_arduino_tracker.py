@@ -0,0 +1,267 @@
+import asyncio
+
+import serial
+
+from app.core.arduino_protocol import ArduinoProtocol, ProtocolConstants, ProtocolIOError
+
+
+class AsyncArduinoTracker(ProtocolConstants):
+    """asyncio counterpart of ArduinoTracker, without threads.
+
+    The serial port's file descriptor is registered with the event loop (add_reader),
+    received bytes are fed to the same ArduinoProtocol state machine the blocking
+    tracker uses, and each operation awaits a future for its response.
+
+    Requires an event loop with add_reader support, i.e. the default loop on
+    macOS and Linux (not the Windows proactor loop).
+
+    Example:
+        tracker = AsyncArduinoTracker()
+        await tracker.connect('/dev/ttyACM0')
+        await tracker.start_test()
+        async for message in tracker.status_messages():
+            ...
+    """
+
+    def __init__(self, baud_rate=115200, timeout=2, binary_protocol=True):
+        """Initialize the tracker.
+
+        Args:
+            baud_rate: Baud rate for serial communication
+            timeout: Time to wait for a response to a command in seconds
+            binary_protocol: If True, switch the device to binary frames after connecting
+        """
+        self.arduino = None
+        self.baud_rate = baud_rate
+        self.timeout = timeout
+        self.binary_protocol = binary_protocol
+        self.protocol = ArduinoProtocol()
+        self.error = None
+        self._loop = None
+
+    @property
+    def is_test_running(self):
+        return self.protocol.is_test_running
+
+    @property
+    def test_results(self):
+        return self.protocol.test_results
+
+    async def connect(self, port, reset_delay=2):
+        """Connect to Arduino at specified port.
+
+        Args:
+            port: Serial port to connect to
+            reset_delay: Seconds to wait for the Arduino to reset after opening the port
+
+        Returns:
+            bool: True if connection successful, False otherwise
+        """
+        self._loop = asyncio.get_running_loop()
+        try:
+            # Non-blocking reads, the loop tells us when data is available
+            self.arduino = serial.Serial(port, self.baud_rate, timeout=0)
+        except serial.SerialException as e:
+            print(f"Connection error: {e}")
+            self.arduino = None
+            return False
+
+        self.error = None
+        self.protocol.reset()  # The reset device talks text again
+        self._loop.add_reader(self.arduino.fileno(), self._on_readable)
+        await asyncio.sleep(reset_delay)  # Allow time for Arduino reset
+
+        if not await self.ping():
+            print("Failed to verify connection with ping")
+            self.disconnect()
+            return False
+
+        print("Connection verified with ping")
+        if self.binary_protocol and not await self._run(self.protocol.set_binary_mode()):
+            print("Binary protocol not supported by firmware, using text protocol")
+        await self.sync_clock()
+        return True
+
+    def _on_readable(self):
+        """Read what the port has available and feed it to the protocol."""
+        try:
+            data = self.arduino.read(self.arduino.in_waiting or 1)
+        except (serial.SerialException, OSError, TypeError) as e:
+            # Device unplugged, stop watching the port
+            print(f"Serial reader error: {e}")
+            self.error = e
+            self._loop.remove_reader(self.arduino.fileno())
+            return
+
+        if data:
+            self.protocol.feed(data)
+
+    def is_connected(self):
+        """Check if Arduino is connected.
+
+        Returns:
+            bool: True if connected, False otherwise
+        """
+        return self.arduino is not None and self.arduino.is_open and self.error is None
+
+    def disconnect(self):
+        """Disconnect from Arduino."""
+        try:
+            if self.arduino and self.arduino.is_open:
+                self._loop.remove_reader(self.arduino.fileno())
+                self.arduino.close()
+        except (serial.SerialException, OSError) as e:
+            print(f"Error during disconnect: {e}")
+        finally:
+            self.arduino = None
+            self.protocol.is_test_running = False
+
+    def _write(self, data, expects_ack=False):
+        """Write bytes to the port and record the write with the link metrics."""
+        metrics = self.protocol.metrics
+        sent_at = metrics.clock()
+        self.arduino.write(data)
+        metrics.command_sent(self.protocol.command_name(data), sent_at, metrics.clock() - sent_at, expects_ack)
+        return sent_at
+
+    async def _execute(self, request):
+        """Write a request's command and await its response.
+
+        Returns:
+            The response message, or None on timeout or if no response is expected
+        """
+        if request.predicate is None:
+            self._write(request.command, expects_ack=request.command in self.ACKED_COMMANDS)
+            return None
+
+        future = self._loop.create_future()
+        self.protocol.expect(request.predicate, future)
+        try:
+            sent_at = request.sent_at = self._write(request.command)
+            timeout = self.timeout if request.timeout is None else request.timeout
+            response = await asyncio.wait_for(future, timeout)
+            self.protocol.metrics.response_received(self.protocol.command_name(request.command), sent_at)
+            return response
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self.protocol.cancel(future)
+
+    async def _run(self, operation):
+        """Drive a protocol operation to completion."""
+        try:
+            request = next(operation)
+            while True:
+                try:
+                    response = await self._execute(request)
+                except (serial.SerialException, OSError) as e:
+                    request = operation.throw(ProtocolIOError(str(e)))
+                else:
+                    request = operation.send(response)
+        except StopIteration as stop:
+            return stop.value
+
+    async def ping(self):
+        """Ping Arduino to verify connection.
+
+        Returns:
+            str: Arduino's status response if successful, False otherwise
+        """
+        if not self.is_connected():
+            return False
+        return await self._run(self.protocol.ping())
+
+    async def sync_clock(self, samples=8):
+        """Exchange clock sync messages to map the Arduino's timestamps onto the host clock.
+
+        Args:
+            samples: Number of exchanges, the fastest ones are used for the estimate
+
+        Returns:
+            bool: True if the Arduino's clock is mapped, False for firmware without CMD_SYNC
+        """
+        if not self.is_connected():
+            return False
+        for _ in range(samples):
+            if not await self._run(self.protocol.sync_clock()):
+                break
+        return self.protocol.clock_sync.synced
+
+    async def send_command(self, command):
+        """Send command to Arduino.
+
+        Args:
+            command: Command to send, bytes or 'H' / 'L'
+
+        Returns:
+            int: 1 if successful, 0 if failed
+        """
+        if not self.is_connected():
+            print("Cannot send command: Not connected to Arduino")
+            return 0
+        return await self._run(self.protocol.send_command(command))
+
+    async def start_test(self):
+        """Start the test sequence on Arduino.
+
+        Returns:
+            bool: True if command acknowledged, False otherwise
+        """
+        if not self.is_connected():
+            print("Cannot start test: Not connected to Arduino")
+            return False
+        return await self._run(self.protocol.start_test())
+
+    async def stop_test(self):
+        """Stop the current test.
+
+        Returns:
+            bool: True if command acknowledged, False otherwise
+        """
+        if not self.is_connected():
+            print("Cannot stop test: Not connected")
+            return False
+        return await self._run(self.protocol.stop_test())
+
+    async def get_test_results(self, timeout=5):
+        """Get results from the completed test.
+
+        Args:
+            timeout: Maximum time to wait for results in seconds
+
+        Returns:
+            dict: Test results, or None if no results available
+        """
+        if not self.is_connected():
+            print("Cannot get test results: Not connected to Arduino")
+            return None
+        return await self._run(self.protocol.get_test_results(timeout))
+
+    def get_test_status(self):
+        """Summarise the messages received since the last call."""
+        if not self.is_connected():
+            return {'test_status': 'Not connected'}
+        return self.protocol.test_status(self.protocol.drain())
+
+    async def status_messages(self):
+        """Iterate over status and progress messages as they arrive.
+
+        Yields JSON status documents as dicts and test end / ready lines as strings.
+        The iteration ends when the connection is lost.
+        """
+        queue = asyncio.Queue()
+
+        def on_message(message):
+            if self.protocol.is_status_message(message):
+                queue.put_nowait(message)
+
+        self.protocol.subscribe(on_message)
+        try:
+            while self.is_connected():
+                try:
+                    message = await asyncio.wait_for(queue.get(), self.timeout)
+                except asyncio.TimeoutError:
+                    continue
+                yield message
+        finally:
+            self.protocol.unsubscribe(on_message)
@@ -0,0 +1,367 @@
+"""
+Binary message format between the Arduino firmware and the host.
+
+Every message is a frame:
+
+    COBS( header | body | crc16 ) 0x00
+
+header  version u8, msg_type u8, seq u16
+body    fixed little-endian struct for msg_type (see the *_DTYPE definitions)
+crc16   CRC-16/CCITT-FALSE over header and body, little-endian
+
+COBS removes every zero byte from the frame so 0x00 only ever appears as the
+frame delimiter, and a receiver can resynchronise after a corrupt frame by
+skipping to the next delimiter. Bodies are decoded straight into NumPy
+structured records with np.frombuffer; the dtypes here must match the structs
+written by eyetracker_arduino.ino.
+"""
+import numpy as np
+
+PROTOCOL_VERSION = 1
+
+# Message types
+MSG_TEXT = 0x01      # UTF-8 text, replaces a println in text mode
+MSG_STATUS = 0x02    # Periodic test progress
+MSG_EVENT = 0x03     # Discrete device event
+MSG_RESULTS = 0x04   # Final results, followed by the click bitmap
+MSG_ACK = 0x05       # Acknowledgement of a threshold command
+MSG_SYNC = 0x06      # Device clock, answer to a clock sync request
+MSG_PLAN = 0x07      # Stimulus plan status and window credit
+MSG_BAUD = 0x08      # Answer to a baud rate change or confirmation
+
+# Test states in status and results messages
+STATE_READY = 0
+STATE_RUNNING = 1
+STATE_FINISHED = 2
+STATE_NAMES = {
+    STATE_READY: "System Ready",
+    STATE_RUNNING: "Test Running",
+    STATE_FINISHED: "Test Finished",
+}
+
+# Event types of MSG_EVENT messages
+EVENT_TEST_START = 1
+EVENT_POINT_MOVED = 2   # arg: total number of points
+EVENT_LASER_ON = 3
+EVENT_LASER_OFF = 4     # arg: 1 if turned off by a hit, 0 at the end of the laser duration
+EVENT_BUTTON_HIT = 5    # Press while the laser is on
+EVENT_WRONG_PRESS = 6   # Press while the laser is off
+EVENT_LOOK_AWAY = 7     # Out of threshold command received, arg: look-away count
+EVENT_LOOK_BACK = 8     # Within threshold command received
+EVENT_TEST_END = 9
+EVENT_OVERFLOW = 10     # arg: events lost because the device's ring buffer was full
+EVENT_NAMES = {
+    EVENT_TEST_START: 'test_start',
+    EVENT_POINT_MOVED: 'point_moved',
+    EVENT_LASER_ON: 'laser_on',
+    EVENT_LASER_OFF: 'laser_off',
+    EVENT_BUTTON_HIT: 'button_hit',
+    EVENT_WRONG_PRESS: 'wrong_press',
+    EVENT_LOOK_AWAY: 'look_away',
+    EVENT_LOOK_BACK: 'look_back',
+    EVENT_TEST_END: 'test_end',
+    EVENT_OVERFLOW: 'overflow',
+}
+NO_POINT = 0xFFFF  # Point of events sent before the first point
+
+# Status of MSG_PLAN messages
+PLAN_OK = 0
+PLAN_TOO_LARGE = 1     # More points than the device can hold results for, or not in binary mode
+PLAN_BAD_CRC = 2
+PLAN_BUSY = 3          # A test is running
+PLAN_OUT_OF_ORDER = 4  # Points not starting at 'received', or more than 'free'
+PLAN_STATUS_NAMES = {
+    PLAN_OK: 'ok',
+    PLAN_TOO_LARGE: 'too large',
+    PLAN_BAD_CRC: 'bad crc',
+    PLAN_BUSY: 'busy',
+    PLAN_OUT_OF_ORDER: 'out of order',
+}
+
+# Status of MSG_BAUD messages
+BAUD_OK = 0
+BAUD_UNSUPPORTED = 1   # Rate not in the device's list
+BAUD_BAD_CRC = 2
+BAUD_BUSY = 3          # A test is running
+BAUD_STATUS_NAMES = {
+    BAUD_OK: 'ok',
+    BAUD_UNSUPPORTED: 'unsupported',
+    BAUD_BAD_CRC: 'bad crc',
+    BAUD_BUSY: 'busy',
+}
+
+HEADER_DTYPE = np.dtype([
+    ('version', '<u1'),
+    ('msg_type', '<u1'),
+    ('seq', '<u2'),
+])
+
+STATUS_DTYPE = np.dtype([
+    ('device_ms', '<u4'),
+    ('state', '<u1'),
+    ('points_shown', '<u2'),
+    ('total_points', '<u2'),
+    ('clicks', '<u2'),
+    ('hits', '<u2'),
+    ('out_of_thres_counter', '<u2'),
+])
+
+EVENT_DTYPE = np.dtype([
+    ('device_ms', '<u4'),
+    ('event_type', '<u1'),
+    ('point', '<u2'),
+    ('arg', '<i2'),
+])
+
+ACK_DTYPE = np.dtype([
+    ('command', '<u1'),
+    ('device_ms', '<u4'),
+])
+
+SYNC_DTYPE = np.dtype([
+    ('device_ms', '<u4'),
+])
+
+PLAN_REPLY_DTYPE = np.dtype([
+    ('status', '<u1'),
+    ('max_points', '<u2'),  # Largest plan the device accepts
+    ('window', '<u1'),      # Points the device buffers ahead
+    ('received', '<u2'),    # Index of the next point the device expects
+    ('free', '<u1'),        # Free window slots, the host may send this many points
+])
+
+BAUD_REPLY_DTYPE = np.dtype([
+    ('status', '<u1'),
+    ('baud', '<u4'),  # Rate the reply refers to, the device's current rate on errors
+])
+
+# One stimulus of a plan, as sent to the device (host to device, no frame)
+PLAN_POINT_DTYPE = np.dtype([
+    ('servo1', '<u1'),
+    ('servo2', '<u1'),
+    ('pre_fire_ms', '<u2'),  # Arrival at the point to laser on
+    ('laser_ms', '<u2'),     # Laser on time
+    ('point_ms', '<u2'),     # Arrival at the point to moving to the next one
+])
+
+# Results share the status layout, the click bitmap (1 bit per point) follows it
+RESULTS_DTYPE = STATUS_DTYPE
+
+CRC_SIZE = 2
+
+
+class FrameError(Exception):
+    """Raised for a frame that fails COBS decoding, CRC or version checks."""
+
+
+def _make_crc_table():
+    table = []
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else (crc << 1)
+        table.append(crc & 0xFFFF)
+    return table
+
+
+_CRC_TABLE = _make_crc_table()
+
+
+def crc16(data, crc=0xFFFF):
+    """CRC-16/CCITT-FALSE (poly 0x1021, init 0xFFFF) of data."""
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFF) ^ _CRC_TABLE[((crc >> 8) ^ byte) & 0xFF]
+    return crc
+
+
+def cobs_encode(data):
+    """COBS-encode data, the result contains no zero bytes (delimiter not included)."""
+    output = bytearray([0])
+    code_index = 0
+    code = 1
+    for byte in data:
+        if byte == 0:
+            output[code_index] = code
+            code_index = len(output)
+            output.append(0)
+            code = 1
+        else:
+            output.append(byte)
+            code += 1
+            if code == 0xFF:
+                output[code_index] = code
+                code_index = len(output)
+                output.append(0)
+                code = 1
+    output[code_index] = code
+    return bytes(output)
+
+
+def cobs_decode(data):
+    """Decode a COBS-encoded frame (without its delimiter).
+
+    Raises:
+        FrameError: If the encoding is invalid
+    """
+    output = bytearray()
+    index = 0
+    length = len(data)
+    while index < length:
+        code = data[index]
+        end = index + code
+        if code == 0 or end > length:
+            raise FrameError("Invalid COBS code")
+        output.extend(data[index + 1:end])
+        index = end
+        if code < 0xFF and index < length:
+            output.append(0)
+    return bytes(output)
+
+
+def encode_frame(msg_type, body=b'', seq=0):
+    """Build a complete frame, including the trailing delimiter.
+
+    Args:
+        msg_type: One of the MSG_* constants
+        body: Encoded body bytes
+        seq: Sequence number of the message
+
+    Returns:
+        bytes: Frame ready to be written
+    """
+    payload = bytes([PROTOCOL_VERSION, msg_type]) + int(seq & 0xFFFF).to_bytes(2, 'little') + bytes(body)
+    payload += crc16(payload).to_bytes(CRC_SIZE, 'little')
+    return cobs_encode(payload) + b'\x00'
+
+
+def decode_frame(frame):
+    """Check and split a frame (without its delimiter).
+
+    Args:
+        frame: COBS-encoded frame bytes
+
+    Returns:
+        tuple: (header record, body bytes)
+
+    Raises:
+        FrameError: If the frame is corrupt or of an unsupported version
+    """
+    payload = cobs_decode(frame)
+    if len(payload) < HEADER_DTYPE.itemsize + CRC_SIZE:
+        raise FrameError("Frame too short")
+
+    data, received_crc = payload[:-CRC_SIZE], int.from_bytes(payload[-CRC_SIZE:], 'little')
+    if crc16(data) != received_crc:
+        raise FrameError("CRC mismatch")
+
+    header = np.frombuffer(data, dtype=HEADER_DTYPE, count=1)[0]
+    if header['version'] != PROTOCOL_VERSION:
+        raise FrameError(f"Unsupported protocol version {header['version']}")
+
+    return header, data[HEADER_DTYPE.itemsize:]
+
+
+def decode_record(body, dtype):
+    """Decode a fixed-size body into a NumPy structured record."""
+    if len(body) < dtype.itemsize:
+        raise FrameError("Body too short")
+    return np.frombuffer(body, dtype=dtype, count=1)[0]
+
+
+def unpack_click_bitmap(bitmap, total_points):
+    """Convert the results click bitmap (LSB first) to the '0'/'1' click pattern string."""
+    bits = np.unpackbits(np.frombuffer(bitmap, dtype=np.uint8), bitorder='little')[:total_points]
+    return ''.join('1' if bit else '0' for bit in bits)
+
+
+def status_to_dict(record):
+    """Convert a status record to the dict layout of the JSON status documents."""
+    return {
+        'test_status': STATE_NAMES.get(int(record['state']), "Unknown"),
+        'device_ms': int(record['device_ms']),
+        'points_shown': int(record['points_shown']),
+        'total_points': int(record['total_points']),
+        'clicks': int(record['clicks']),
+        'hits': int(record['hits']),
+        'out_of_thres_counter': int(record['out_of_thres_counter']),
+    }
+
+
+class BinaryFramer:
+    """Splits the incoming byte stream into frames and decodes them.
+
+    Produces the same kind of messages as LineFramer, so the protocol can switch
+    between them: text frames become strings, status and results frames become dicts
+    (results with a reconstructed 'click_pattern'). Event frames become dicts with
+    'event' set to their record, ack frames dicts with 'ack' set to the command byte.
+    Corrupt frames are counted and skipped.
+    """
+
+    def __init__(self, initial=b''):
+        self._buffer = bytearray(initial)
+        self.frames_received = 0
+        self.frames_dropped = 0
+        self.bytes_received = len(initial)
+
+    def take_buffer(self):
+        """Return and clear the bytes not yet framed."""
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+    def feed(self, data):
+        """Add received bytes and yield the messages completed by them."""
+        self._buffer.extend(data)
+        self.bytes_received += len(data)
+        while True:
+            end = self._buffer.find(b'\x00')
+            if end < 0:
+                return
+            frame = bytes(self._buffer[:end])
+            del self._buffer[:end + 1]
+            if not frame:
+                continue
+
+            try:
+                message = self.decode_message(frame)
+            except FrameError as e:
+                self.frames_dropped += 1
+                print(f"Dropped binary frame: {e}")
+                continue
+
+            self.frames_received += 1
+            if message is not None:
+                yield message
+
+    @staticmethod
+    def decode_message(frame):
+        """Decode one frame into a protocol message."""
+        header, body = decode_frame(frame)
+        msg_type = header['msg_type']
+
+        if msg_type == MSG_TEXT:
+            return body.decode('utf-8', errors='ignore').strip()
+        elif msg_type == MSG_STATUS:
+            return status_to_dict(decode_record(body, STATUS_DTYPE))
+        elif msg_type == MSG_RESULTS:
+            record = decode_record(body, RESULTS_DTYPE)
+            results = status_to_dict(record)
+            results['click_pattern'] = unpack_click_bitmap(body[RESULTS_DTYPE.itemsize:], results['total_points'])
+            return results
+        elif msg_type == MSG_EVENT:
+            record = decode_record(body, EVENT_DTYPE)
+            return {'event': record, 'device_ms': int(record['device_ms'])}
+        elif msg_type == MSG_ACK:
+            record = decode_record(body, ACK_DTYPE)
+            return {'ack': int(record['command']), 'device_ms': int(record['device_ms'])}
+        elif msg_type == MSG_SYNC:
+            return {'sync': int(decode_record(body, SYNC_DTYPE)['device_ms'])}
+        elif msg_type == MSG_PLAN:
+            record = decode_record(body, PLAN_REPLY_DTYPE)
+            return {'plan': {name: int(record[name]) for name in PLAN_REPLY_DTYPE.names}}
+        elif msg_type == MSG_BAUD:
+            record = decode_record(body, BAUD_REPLY_DTYPE)
+            return {'baud': {name: int(record[name]) for name in BAUD_REPLY_DTYPE.names}}
+
+        print(f"Unknown binary message type {msg_type}")
+        return None
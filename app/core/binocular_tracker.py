@@ -0,0 +1,281 @@
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from app.core.pupil_tracker import EyeTracker
+from app.utils.config import DEFAULT_CONFIG
+
+# Size of a processed frame, EyeTrackerUtils.crop_to_aspect_ratio resizes every frame to this
+FRAME_WIDTH = 640
+FRAME_HEIGHT = 480
+
+# Raised by a pipe whose worker process has died
+WORKER_ERRORS = (EOFError, BrokenPipeError, OSError)
+
+
+def _eye_worker(camera_source, conn, shm_name, display_shape, slot, tracking_config):
+    """Run one eye's tracker pipeline in its own process.
+
+    The worker answers requests from the parent over conn. For a 'frame' request it
+    processes the next camera frame, writes it into its half of the shared display
+    buffer and replies with the frame's observation. Any other request name is called
+    as a method on the EyeTracker and replies with the eye's lock state.
+
+    Args:
+        camera_source: Camera index passed to cv2.VideoCapture
+        conn: Pipe connection to the parent process
+        shm_name: Name of the shared memory block holding the display frame
+        display_shape: Shape of the whole display frame (height, width, channels)
+        slot: Index of the eye, selects which horizontal slice of the display to write
+        tracking_config: The 'eye_tracking' config section passed to the EyeTracker
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    display = np.ndarray(display_shape, dtype=np.uint8, buffer=shm.buf)
+    view = display[:, slot * FRAME_WIDTH:(slot + 1) * FRAME_WIDTH]
+
+    eye = EyeTracker(arduino_tracker=None, camera_source=camera_source, tracking_config=tracking_config)
+    conn.send(bool(eye.cap is not None and eye.cap.isOpened()))
+
+    try:
+        while True:
+            try:
+                request = conn.recv()
+            except EOFError:
+                break
+
+            name, args = request[0], request[1:]
+            if name == 'frame':
+                frame = eye.get_processed_frame()
+                if frame is None or frame.shape != view.shape:
+                    conn.send(None)
+                    continue
+                np.copyto(view, frame)
+                conn.send(eye.observation)
+            elif name == 'release':
+                break
+            else:
+                getattr(eye, name)(*args)
+                conn.send(eye.is_position_locked)
+    finally:
+        eye.release()
+        del view, display
+        shm.close()
+
+
+class BinocularEyeTracker:
+    """Tracks both eyes with two independent EyeTracker pipelines running in parallel.
+
+    Each eye runs in its own process with its own camera, lock position and threshold,
+    so frame processing for the two eyes overlaps and the latency per frame is that of
+    the slower eye rather than the sum of both. Processed frames are written side by side
+    into one shared display buffer, which is returned without further copying.
+
+    The two eyes are combined into a single in/out of threshold decision for the Arduino:
+    the patient is within threshold only if every locked eye is within its threshold.
+    Exposes the same interface as EyeTracker so the GUI can use either.
+    """
+
+    EYE_NAMES = ('left', 'right')
+
+    def __init__(self, arduino_tracker=None, camera_sources=(0, 1), tracking_config=None):
+        """Initialize the binocular tracker and start one worker process per eye
+
+        Args:
+            arduino_tracker: ArduinoTracker to send the combined decision to, or None
+            camera_sources: Camera index for each eye, (left, right)
+            tracking_config: The 'eye_tracking' config section used by both eyes, None for
+                             the defaults of DEFAULT_CONFIG
+        """
+        tracking_config = dict(tracking_config or DEFAULT_CONFIG['eye_tracking'])
+        self.tracker = arduino_tracker
+        self.camera_sources = list(camera_sources)
+        self.num_eyes = len(self.camera_sources)
+
+        # State tracking, mirrors EyeTracker
+        self.lockpos_thresholds = [tracking_config['lockpos_threshold']] * self.num_eyes
+        self.is_position_locked = False
+        self.is_pupil_pos_within_threshold = True
+        self.prev_command = 'L'
+        self.observation = None
+        self.eye_observations = [None] * self.num_eyes
+
+        # Display frame shared with the workers, each eye owns a horizontal slice
+        display_shape = (FRAME_HEIGHT, FRAME_WIDTH * self.num_eyes, 3)
+        self._shm = shared_memory.SharedMemory(create=True, size=int(np.prod(display_shape)))
+        self._display = np.ndarray(display_shape, dtype=np.uint8, buffer=self._shm.buf)
+        self._display.fill(0)
+
+        # Spawn rather than fork, forking a process with Qt and camera threads is unsafe
+        context = multiprocessing.get_context('spawn')
+        self._conns = []
+        self._workers = []
+        self.cameras_opened = [False] * self.num_eyes
+        try:
+            for slot, source in enumerate(self.camera_sources):
+                parent_conn, child_conn = context.Pipe()
+                worker = context.Process(
+                    target=_eye_worker,
+                    args=(source, child_conn, self._shm.name, display_shape, slot, tracking_config),
+                    name=f"eye-{self.EYE_NAMES[slot] if slot < len(self.EYE_NAMES) else slot}",
+                    daemon=True,
+                )
+                worker.start()
+                child_conn.close()
+                self._conns.append(parent_conn)
+                self._workers.append(worker)
+
+            # Wait for every camera to open
+            self.cameras_opened = [conn.recv() for conn in self._conns]
+        except Exception:
+            # Stop the workers already started and free the display buffer
+            self.release()
+            raise
+        for source, opened in zip(self.camera_sources, self.cameras_opened):
+            if not opened:
+                print(f"Error: Could not open camera {source}.")
+
+    def _request_all(self, name, *args):
+        """Send the same request to every eye and wait for all replies
+
+        Requests are sent before any reply is awaited, so the eyes work concurrently.
+        The reply of an eye whose worker has died is None.
+        """
+        sent = [self._send(eye, (name,) + args) for eye in range(len(self._conns))]
+        return [self._receive(eye) if ok else None for eye, ok in enumerate(sent)]
+
+    def _request(self, eye, name, *args):
+        """Send a request to a single eye and wait for its reply, None if its worker has died"""
+        if not self._send(eye, (name,) + args):
+            return None
+        return self._receive(eye)
+
+    def _send(self, eye, request):
+        """Send a request to an eye's worker, False if the worker has died"""
+        try:
+            self._conns[eye].send(request)
+            return True
+        except WORKER_ERRORS as e:
+            self._worker_lost(eye, e)
+            return False
+
+    def _receive(self, eye):
+        """Wait for an eye worker's reply, None if the worker has died"""
+        try:
+            return self._conns[eye].recv()
+        except WORKER_ERRORS as e:
+            self._worker_lost(eye, e)
+            return None
+
+    def _worker_lost(self, eye, error):
+        """Mark an eye's camera closed after its worker process died"""
+        if self.cameras_opened[eye]:
+            print(f"Error: Tracker of camera {self.camera_sources[eye]} stopped: {error!r}")
+        self.cameras_opened[eye] = False
+
+    def is_opened(self):
+        """Check if every eye's camera is open"""
+        return all(self.cameras_opened)
+
+    def get_processed_frame(self):
+        """Process the next frame of both eyes in parallel - called by GUI timer
+
+        Returns:
+            numpy array: Both eyes side by side, or None if either camera failed
+        """
+        if not self.is_opened():
+            return None
+
+        observations = self._request_all('frame')
+        if any(observation is None for observation in observations):
+            return None
+
+        self.eye_observations = observations
+        self._update_decision()
+
+        self.observation = {
+            'timestamp': max(observation['timestamp'] or 0 for observation in observations),
+            'frame_size': (self._display.shape[1], self._display.shape[0]),
+            'eyes': [
+                (observation, (slot * FRAME_WIDTH, 0))
+                for slot, observation in enumerate(observations)
+            ],
+        }
+        return self._display
+
+    def _update_decision(self):
+        """Combine the eyes into one in/out of threshold decision and notify the Arduino"""
+        locked = [observation for observation in self.eye_observations if observation['is_position_locked']]
+        if not locked:
+            return
+
+        self.is_pupil_pos_within_threshold = all(observation['within_threshold'] for observation in locked)
+        command = 'L' if self.is_pupil_pos_within_threshold else 'H'
+
+        # Queue command for the Arduino if tracker is available AND if command is different from previous command
+        if self.tracker and command != self.prev_command:
+            if self.tracker.post_command(command, coalesce_key='gaze', on_failure=self._on_command_failed):
+                self.prev_command = command
+
+    def _on_command_failed(self, command):
+        """Called by the outbox thread when a gaze command could not be sent, resend on the next frame"""
+        if self.prev_command == command:
+            self.prev_command = None
+
+    def set_threshold(self, value, eye=None):
+        """Set the lock position threshold for one eye, or both if eye is None"""
+        eyes = range(self.num_eyes) if eye is None else [eye]
+        for index in eyes:
+            self.lockpos_thresholds[index] = value
+            self._request(index, 'set_threshold', value)
+
+    def set_confidence_margin(self, value):
+        """Set the binary threshold switching margin for both eyes"""
+        self._request_all('set_confidence_margin', value)
+
+    def set_gaze_filter(self, hysteresis=None, dwell_ms=None, vote_window=None):
+        """Configure the in/out of threshold debouncing of both eyes"""
+        self._request_all('set_gaze_filter', hysteresis, dwell_ms, vote_window)
+
+    def set_zoom(self, value, center=None):
+        """Set the zoom factor and zoom center for both eyes"""
+        self._request_all('set_zoom', value, center)
+
+    def lock_position(self):
+        """Lock the current position of both eyes as their reference points"""
+        locked = self._request_all('lock_position')
+        self.is_position_locked = all(locked)
+
+    def is_eye_in_position(self):
+        """Check if both eyes are in their calibrated positions
+
+        Returns:
+            bool: True if every eye is in position, False otherwise
+        """
+        if not self.is_position_locked or not self.is_opened():
+            return False
+
+        return self.is_pupil_pos_within_threshold
+
+    def release(self):
+        """Stop the worker processes and release the cameras"""
+        for conn in self._conns:
+            try:
+                conn.send(('release',))
+            except (BrokenPipeError, OSError):
+                pass
+        for worker in self._workers:
+            worker.join(timeout=2)
+            if worker.is_alive():
+                worker.terminate()
+        for conn in self._conns:
+            conn.close()
+        self._conns = []
+        self._workers = []
+        self.cameras_opened = [False] * self.num_eyes
+
+        if self._shm is not None:
+            del self._display
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
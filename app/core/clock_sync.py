@@ -0,0 +1,168 @@
+"""
+Estimation of the Arduino clock relative to the host clock.
+"""
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+class ClockSync:
+    """Maps the Arduino's millis() onto the host clock, NTP style.
+
+    Each sync exchange records the host time the request was written (t0), the
+    device time in the reply and the host time the reply was received (t1). The
+    device read its clock somewhere within [t0, t1], so the midpoint is paired with
+    it and half the round trip bounds the error. Exchanges delayed by the USB stack
+    or a busy reader thread have long round trips, so only the fastest samples in
+    the window are used: the offset comes from them, and once they span
+    min_drift_span seconds the drift of the Arduino's crystal is fitted to them
+    with least squares.
+
+    millis() wraps after 49.7 days. Device times are unwrapped here, so the mapping
+    stays continuous while the board keeps running.
+    """
+
+    DEVICE_WRAP_MS = 2 ** 32
+
+    def __init__(self, window=32, rtt_margin=0.001, min_drift_span=10.0, clock=time.perf_counter):
+        """
+        Args:
+            window: Number of recent sync samples kept
+            rtt_margin: Seconds above the fastest round trip for a sample to be used
+            min_drift_span: Seconds the used samples must span before drift is estimated
+            clock: Host clock in seconds, must be the clock observations are stamped with
+        """
+        self.rtt_margin = rtt_margin
+        self.min_drift_span = min_drift_span
+        self.clock = clock
+        self._samples = deque(maxlen=window)  # (host midpoint s, device s, round trip s)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget all samples, e.g. after reconnecting since the board may have been reset."""
+        with self._lock:
+            self._samples.clear()
+            self._last_raw_ms = None
+            self._wraps = 0
+            # (host reference s, device time at the reference s, device seconds per host second,
+            #  last raw millis(), wraps), replaced as a whole
+            self._model = None
+            self.min_rtt = None
+            self.samples_used = 0
+
+    @property
+    def synced(self):
+        return self._model is not None
+
+    def add_sample(self, sent_at, device_ms, received_at):
+        """Record one sync exchange.
+
+        Args:
+            sent_at: Host time the sync request was written
+            device_ms: Device millis() in the reply
+            received_at: Host time the reply was received
+        """
+        if received_at < sent_at:
+            return
+
+        with self._lock:
+            device_ms = self._unwrap(device_ms)
+            self._samples.append(((sent_at + received_at) / 2, device_ms / 1000, received_at - sent_at))
+            self._fit()
+
+    def _unwrap(self, device_ms):
+        if self._last_raw_ms is not None and device_ms < self._last_raw_ms - self.DEVICE_WRAP_MS // 2:
+            self._wraps += 1
+        self._last_raw_ms = device_ms
+        return device_ms + self._wraps * self.DEVICE_WRAP_MS
+
+    def _fit(self):
+        samples = np.array(self._samples)
+        host, device, rtt = samples[:, 0], samples[:, 1], samples[:, 2]
+
+        self.min_rtt = float(rtt.min())
+        best = rtt <= self.min_rtt + self.rtt_margin
+        host, device = host[best], device[best]
+        self.samples_used = int(best.sum())
+
+        # Reference at the newest sample used, so the estimate is freshest where it is used
+        host_ref = host[-1]
+        rate = 1.0
+        if host[-1] - host[0] >= self.min_drift_span:
+            dx = host - host.mean()
+            rate = float(np.dot(dx, device - device.mean()) / np.dot(dx, dx))
+        device_ref = float(np.mean(device - rate * (host - host_ref)))
+
+        # Replaced as a whole, readers on other threads never see a half updated model
+        self._model = (float(host_ref), device_ref, rate, self._last_raw_ms, self._wraps)
+
+    def to_host(self, device_ms):
+        """Convert a device timestamp to host time.
+
+        Args:
+            device_ms: Device millis() value, as received
+
+        Returns:
+            float: Host clock time in seconds, None before the first sync
+        """
+        model = self._model
+        if model is None:
+            return None
+        host_ref, device_ref, rate, last_raw, wraps = model
+
+        # Unwrap relative to the last sync, the timestamp may be from either side of a wrap
+        half = self.DEVICE_WRAP_MS // 2
+        if device_ms < last_raw - half:
+            wraps += 1
+        elif device_ms > last_raw + half:
+            wraps -= 1
+        device_ms += wraps * self.DEVICE_WRAP_MS
+        return host_ref + (device_ms / 1000 - device_ref) / rate
+
+    def to_device(self, host_time=None):
+        """Convert a host time to the device clock.
+
+        Args:
+            host_time: Host clock time in seconds, defaults to now
+
+        Returns:
+            float: Device time in milliseconds (unwrapped), None before the first sync
+        """
+        model = self._model
+        if model is None:
+            return None
+        host_ref, device_ref, rate = model[:3]
+        if host_time is None:
+            host_time = self.clock()
+        return (device_ref + (host_time - host_ref) * rate) * 1000
+
+    @property
+    def offset(self):
+        """Device minus host clock in seconds at the newest sample, None before the first sync."""
+        model = self._model
+        return None if model is None else model[1] - model[0]
+
+    @property
+    def drift_ppm(self):
+        """How much faster the device clock runs than the host clock, in parts per million."""
+        model = self._model
+        return None if model is None else (model[2] - 1) * 1e6
+
+    @property
+    def uncertainty_ms(self):
+        """Bound on the offset error from the fastest round trip, in milliseconds."""
+        return None if self.min_rtt is None else self.min_rtt / 2 * 1000
+
+    def summary(self):
+        """Current estimate and the samples it is based on."""
+        return {
+            'synced': self.synced,
+            'offset_s': self.offset,
+            'drift_ppm': self.drift_ppm,
+            'uncertainty_ms': self.uncertainty_ms,
+            'samples': len(self._samples),
+            'samples_used': self.samples_used,
+        }
@@ -0,0 +1,126 @@
+"""
+Background sender for commands posted from the frame processing path.
+"""
+import itertools
+import threading
+import time
+from collections import deque, OrderedDict
+
+from app.core.serial_metrics import LatencyHistogram
+
+
+class CommandOutbox(threading.Thread):
+    """Sends commands to the Arduino on its own thread.
+
+    post() only takes a lock and returns, so a stalled USB-serial adapter delays the
+    commands but never the caller. Commands posted with a coalesce key replace any
+    command with the same key that has not been sent yet, e.g. only the latest gaze
+    state matters. The queue is bounded, when it is full the oldest command is dropped.
+    """
+
+    def __init__(self, tracker, max_pending=16, history=100):
+        """
+        Args:
+            tracker: ArduinoTracker whose send_command is called
+            max_pending: Maximum number of commands waiting to be sent
+            history: Number of recent sends kept for diagnostics
+        """
+        super().__init__(name="arduino-outbox", daemon=True)
+        self.tracker = tracker
+        self.max_pending = max_pending
+        self._pending = OrderedDict()  # key -> (command, posted at, on_failure), oldest first
+        self._unique_keys = itertools.count()
+        self._condition = threading.Condition()
+        self._stop_requested = False
+
+        # Diagnostics
+        self.posted = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.failures = 0
+        self.last_error = None
+        self.queue_wait = LatencyHistogram()  # Posted to send started, ms
+        self.send_time = LatencyHistogram()   # Duration of send_command, ms
+        self.recent = deque(maxlen=history)   # (command, posted at, sent at, result)
+
+    def post(self, command, coalesce_key=None, on_failure=None):
+        """Queue a command for sending, without blocking.
+
+        Args:
+            command: Command accepted by ArduinoTracker.send_command
+            coalesce_key: Commands with the same key replace each other while queued
+            on_failure: Called with the command, on the outbox thread, if sending fails
+        """
+        key = ('unique', next(self._unique_keys)) if coalesce_key is None else coalesce_key
+        with self._condition:
+            if self._stop_requested:
+                return
+            self.posted += 1
+            if key in self._pending:
+                # Keep the queue position, replace the command
+                self.coalesced += 1
+                self._pending[key] = (command, time.perf_counter(), on_failure)
+            else:
+                if len(self._pending) >= self.max_pending:
+                    self._pending.popitem(last=False)
+                    self.dropped += 1
+                self._pending[key] = (command, time.perf_counter(), on_failure)
+            self._condition.notify()
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    def stop(self, timeout=1):
+        """Stop the thread, commands not yet sent are discarded."""
+        with self._condition:
+            self._stop_requested = True
+            self._pending.clear()
+            self._condition.notify()
+        if self is not threading.current_thread() and self.is_alive():
+            self.join(timeout)
+
+    def run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._stop_requested:
+                    self._condition.wait()
+                if self._stop_requested:
+                    return
+                _, (command, posted_at, on_failure) = self._pending.popitem(last=False)
+
+            started_at = time.perf_counter()
+            try:
+                result = self.tracker.send_command(command)
+            except Exception as e:
+                # Keep the thread alive whatever the transport does
+                result = 0
+                self.last_error = e
+            finished_at = time.perf_counter()
+
+            self.queue_wait.record((started_at - posted_at) * 1000)
+            self.send_time.record((finished_at - started_at) * 1000)
+            self.recent.append((command, posted_at, finished_at, result))
+
+            if result == 1:
+                self.sent += 1
+            else:
+                self.failures += 1
+                print(f"Outbox failed to send command {command!r}")
+                if on_failure:
+                    on_failure(command)
+
+    def summary(self):
+        """Counters and timing of the outbox."""
+        return {
+            'posted': self.posted,
+            'sent': self.sent,
+            'coalesced': self.coalesced,
+            'dropped': self.dropped,
+            'failures': self.failures,
+            'pending': self.pending,
+            'last_error': repr(self.last_error) if self.last_error else None,
+            'queue_wait': self.queue_wait.summary(),
+            'send_time': self.send_time.summary(),
+        }
@@ -0,0 +1,208 @@
+"""
+Background monitoring and recovery of the Arduino serial link.
+"""
+import random
+import threading
+import time
+from collections import deque
+
+
+class ConnectionWatchdog(threading.Thread):
+    """Watches an ArduinoTracker's link and reconnects it when it is lost.
+
+    The link counts as healthy while bytes keep arriving (status messages during a
+    test) or a heartbeat ping is answered when the line has been quiet for
+    heartbeat_interval. A serial error on the reader thread, or no traffic for
+    heartbeat_timeout, counts as lost. The watchdog then reconnects with exponential
+    backoff, first to the same port and then by probing (the board may come back on a
+    different port), and re-syncs the test state from the ping response.
+
+    State changes are reported through on_state_change(state, detail), called on the
+    watchdog thread. States: STATE_CONNECTED, STATE_RECONNECTING, STATE_STOPPED.
+
+    Every sync_interval the watchdog also adds a clock sync exchange, so the drift
+    estimate of tracker.clock_sync keeps up while the link is up. On a link running
+    above the base baud rate, corrupt_frame_limit corrupt frames within
+    corrupt_frame_window seconds bring it back to the base rate once no test is running.
+    """
+
+    STATE_CONNECTED = 'connected'
+    STATE_RECONNECTING = 'reconnecting'
+    STATE_STOPPED = 'stopped'
+
+    def __init__(self, tracker, on_state_change=None, heartbeat_interval=1.0, heartbeat_timeout=3.0,
+                 backoff_initial=0.5, backoff_max=10.0, sync_interval=5.0,
+                 corrupt_frame_limit=3, corrupt_frame_window=10.0):
+        """
+        Args:
+            tracker: ArduinoTracker to watch, must be connected
+            on_state_change: Function (state, detail) called when the state changes
+            heartbeat_interval: Seconds of silence after which a heartbeat ping is sent
+            heartbeat_timeout: Seconds without any received byte after which the link is lost
+            backoff_initial: Seconds before the first reconnect attempt
+            backoff_max: Maximum seconds between reconnect attempts
+            sync_interval: Seconds between clock sync exchanges, None to not sync
+            corrupt_frame_limit: Corrupt frames that make a raised baud rate fall back
+            corrupt_frame_window: Seconds within which corrupt_frame_limit frames must arrive
+        """
+        super().__init__(name="arduino-watchdog", daemon=True)
+        self.tracker = tracker
+        self.on_state_change = on_state_change
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.sync_interval = sync_interval
+        self._last_sync = time.monotonic()
+        self.corrupt_frame_limit = corrupt_frame_limit
+        self.corrupt_frame_window = corrupt_frame_window
+        self._corrupt_frames = deque()  # Times corrupt frames were noticed at a raised rate
+        self._fallback_due = False  # Kept until no test is running
+        self._frames_dropped = getattr(tracker.protocol.framer, 'frames_dropped', 0)
+        self.state = self.STATE_CONNECTED
+        self._stop_event = threading.Event()
+
+        # Diagnostics
+        self.disconnects = 0
+        self.reconnect_attempts = 0
+        self.last_outage = None  # Seconds the last outage lasted
+
+    def stop(self, timeout=2):
+        """Stop watching, does not disconnect the tracker."""
+        self._stop_event.set()
+        if self is not threading.current_thread() and self.is_alive():
+            self.join(timeout)
+
+    def _set_state(self, state, detail=""):
+        self.state = state
+        print(f"Arduino link {state}{': ' + detail if detail else ''}")
+        if self.on_state_change:
+            try:
+                self.on_state_change(state, detail)
+            except Exception as e:
+                print(f"Error in watchdog callback: {e}")
+
+    def run(self):
+        while not self._stop_event.wait(self.heartbeat_interval / 2):
+            problem = self.check_link()
+            if problem:
+                self.recover(problem)
+            else:
+                self.check_errors()
+                self.maintain_clock()
+        self._set_state(self.STATE_STOPPED)
+
+    def maintain_clock(self):
+        """Add a clock sync sample when due, if the firmware supports clock sync."""
+        if not self.sync_interval or time.monotonic() - self._last_sync < self.sync_interval:
+            return
+        self._last_sync = time.monotonic()
+        if self.tracker.clock_sync.synced:
+            self.tracker.sync_clock(samples=1)
+
+    def check_errors(self):
+        """Fall back to the base baud rate if the raised one corrupts frames."""
+        tracker = self.tracker
+        dropped = getattr(tracker.protocol.framer, 'frames_dropped', 0)
+        # The counter restarts with the framer after a reconnect
+        new_errors = max(dropped - self._frames_dropped, 0)
+        self._frames_dropped = dropped
+        if (tracker.link_baud_rate or 0) <= tracker.baud_rate:
+            self._corrupt_frames.clear()
+            self._fallback_due = False
+            return
+
+        now = time.monotonic()
+        self._corrupt_frames.extend([now] * new_errors)
+        while self._corrupt_frames and now - self._corrupt_frames[0] > self.corrupt_frame_window:
+            self._corrupt_frames.popleft()
+        if len(self._corrupt_frames) >= self.corrupt_frame_limit:
+            self._fallback_due = True
+
+        # The firmware doesn't change rate during a test
+        if self._fallback_due and not tracker.is_test_running:
+            print(f"Corrupt frames at {tracker.link_baud_rate} baud, falling back to {tracker.baud_rate}")
+            self._corrupt_frames.clear()
+            self._fallback_due = False
+            tracker.restore_baud()
+            self._frames_dropped = getattr(tracker.protocol.framer, 'frames_dropped', 0)
+
+    def check_link(self):
+        """Check the link once.
+
+        Returns:
+            str: Description of the problem, None if the link is healthy
+        """
+        tracker = self.tracker
+        reader = tracker.reader
+        if not tracker.is_connected() or reader is None:
+            return "port closed"
+        if reader.error is not None:
+            return f"serial error: {reader.error}"
+
+        silence = time.monotonic() - (tracker.protocol.last_received or 0)
+        if silence < self.heartbeat_interval:
+            return None
+
+        # Quiet line, ask for a heartbeat
+        if tracker.ping():
+            return None
+        if time.monotonic() - (tracker.protocol.last_received or 0) >= self.heartbeat_timeout:
+            return f"no response for {self.heartbeat_timeout:.0f}s"
+        return None
+
+    def recover(self, problem):
+        """Reconnect with backoff until the link is back or the watchdog is stopped."""
+        tracker = self.tracker
+        was_running = tracker.is_test_running
+        gaze_command = tracker.prev_command
+        lost_at = time.monotonic()
+
+        self.disconnects += 1
+        self._set_state(self.STATE_RECONNECTING, problem)
+        # Keep the test state, it is re-synced from the board once reconnected
+        tracker.disconnect(keep_state=True)
+
+        delay = self.backoff_initial
+        while not self._stop_event.wait(delay):
+            self.reconnect_attempts += 1
+            if tracker.reconnect():
+                break
+            delay = min(delay * 2, self.backoff_max) * random.uniform(0.8, 1.2)
+        else:
+            return
+
+        self.last_outage = time.monotonic() - lost_at
+        self._set_state(self.STATE_CONNECTED, self.resync(was_running, gaze_command))
+
+    def resync(self, was_running, gaze_command):
+        """Restore session state after reconnecting.
+
+        Args:
+            was_running: Whether a test was running when the link was lost
+            gaze_command: Last gaze command sent before the link was lost
+
+        Returns:
+            str: Description of the restored state
+        """
+        tracker = self.tracker
+        status = tracker.ping() or ""
+
+        # The board forgot the gaze state if it was reset, send it again
+        if gaze_command:
+            tracker.post_command(gaze_command, coalesce_key='gaze')
+
+        if not was_running:
+            tracker.is_test_running = False
+            return f"reconnected after {self.last_outage:.1f}s"
+        if "Running" in status:
+            tracker.is_test_running = True
+            return f"reconnected after {self.last_outage:.1f}s, test still running"
+        if "Ended" in status:
+            # Finished while we were away, results can still be fetched
+            tracker.is_test_running = False
+            return f"reconnected after {self.last_outage:.1f}s, test ended meanwhile"
+
+        # The board was reset, the test is gone
+        tracker.is_test_running = False
+        return f"reconnected after {self.last_outage:.1f}s, test was lost (board reset)"
@@ -0,0 +1,185 @@
+"""
+Background bring-up of the camera and the Arduino, off the GUI thread.
+"""
+import threading
+import time
+
+
+class DeviceConnector(threading.Thread):
+    """Opens the camera and connects the Arduino in parallel.
+
+    The camera is opened on its own worker thread while this thread connects the
+    Arduino, so the slower of the two sets the connection time instead of their sum.
+    The camera counts as ready once it delivered a processed frame. The eye tracker is
+    built without an Arduino, the owner attaches it once both are done.
+
+    Callbacks are called on the worker threads, pass Qt signal emit methods to have
+    them delivered on the GUI thread:
+    - on_progress(device, message) as each step starts, device 'camera' or 'arduino'
+    - on_camera_ready(connector) once the camera delivered its first frame, or failed
+    - on_finished(connector) once both devices are done
+
+    cancel() stops waiting for the camera's first frame. Opening the camera and probing
+    the serial ports cannot be interrupted, both are bounded by their own timeouts. The
+    devices opened by a cancelled connector are left for the owner to release in
+    on_finished, so they always have a single owner.
+    """
+
+    def __init__(self, open_camera, connect_arduino, on_progress=None, on_camera_ready=None,
+                 on_finished=None, first_frame_timeout=5.0):
+        """
+        Args:
+            open_camera: Function returning an eye tracker with its camera opened
+            connect_arduino: Function returning an ArduinoTracker, connected or not
+            on_progress: Function (device, message) called as each step starts
+            on_camera_ready: Function (connector) called once the camera delivered a frame or failed
+            on_finished: Function (connector) called once both devices are done
+            first_frame_timeout: Seconds to wait for the camera's first frame
+        """
+        super().__init__(name="device-connector", daemon=True)
+        self.open_camera = open_camera
+        self.connect_arduino = connect_arduino
+        self.on_progress = on_progress
+        self.on_camera_ready = on_camera_ready
+        self.on_finished = on_finished
+        self.first_frame_timeout = first_frame_timeout
+        self._cancel_event = threading.Event()
+
+        # Results, read by the owner in on_camera_ready and on_finished
+        self.eye_tracker = None
+        self.arduino_tracker = None
+        self.camera_ok = False  # True once the camera delivered a frame
+        self.errors = {}  # Device -> message of the exception that stopped its bring-up
+        self.timings = {}  # Device -> seconds its bring-up took
+
+    def cancel(self):
+        """Stop waiting for the devices, on_finished is still called."""
+        self._cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def _notify(self, callback, *args):
+        if callback:
+            try:
+                callback(*args)
+            except Exception as e:
+                print(f"Device connector callback error: {e}")
+
+    def run(self):
+        camera = threading.Thread(target=self._bring_up_camera, name="camera-connector", daemon=True)
+        camera.start()
+        self._bring_up_arduino()
+        camera.join()
+        print(f"Devices up in {', '.join(f'{device} {seconds:.2f}s' for device, seconds in self.timings.items())}")
+        self._notify(self.on_finished, self)
+
+    def _bring_up_camera(self):
+        """Open the camera and wait for its first processed frame."""
+        start = time.monotonic()
+        self._notify(self.on_progress, 'camera', "Opening camera...")
+        try:
+            self.eye_tracker = self.open_camera()
+        except Exception as e:
+            print(f"Camera initialization error: {e}")
+            self.errors['camera'] = str(e)
+
+        if self.eye_tracker is not None and self.eye_tracker.is_opened():
+            self._notify(self.on_progress, 'camera', "Waiting for the first frame...")
+            deadline = start + self.first_frame_timeout
+            while not self.cancelled and time.monotonic() < deadline:
+                if self.eye_tracker.get_processed_frame() is not None:
+                    self.camera_ok = True
+                    break
+                time.sleep(0.01)
+
+        self.timings['camera'] = time.monotonic() - start
+        self._notify(self.on_progress, 'camera', "Camera ready" if self.camera_ok else "Camera not available")
+        # From here on only the owner reads frames
+        self._notify(self.on_camera_ready, self)
+
+    def _bring_up_arduino(self):
+        """Find and connect the Arduino."""
+        start = time.monotonic()
+        self._notify(self.on_progress, 'arduino', "Connecting to Arduino...")
+        try:
+            self.arduino_tracker = self.connect_arduino()
+        except Exception as e:
+            print(f"Arduino initialization error: {e}")
+            self.errors['arduino'] = str(e)
+
+        self.timings['arduino'] = time.monotonic() - start
+        connected = self.arduino_tracker is not None and self.arduino_tracker.is_connected()
+        self._notify(self.on_progress, 'arduino', "Arduino connected" if connected else "Arduino not found")
+
+
+class CameraWarmer(threading.Thread):
+    """Opens the camera ahead of time and keeps it streaming until it is taken.
+
+    The first frames through the pipeline are slow: the camera settles its exposure,
+    and OpenCV allocates its buffers and starts its thread pools on first use. The
+    warmer pays for that while nothing else is happening, e.g. on the welcome view.
+    It processes warmup_frames frames back to back, then one frame every
+    keep_alive_interval, so the camera keeps streaming and the code paths stay hot.
+
+    take() hands the tracker over, stop() releases it.
+    """
+
+    def __init__(self, open_camera, warmup_frames=5, keep_alive_interval=0.1):
+        """
+        Args:
+            open_camera: Function returning an eye tracker with its camera opened
+            warmup_frames: Frames processed back to back after opening, at least 1
+            keep_alive_interval: Seconds between the frames processed after the warm-up
+        """
+        super().__init__(name="camera-warmer", daemon=True)
+        self.open_camera = open_camera
+        self.warmup_frames = max(int(warmup_frames), 1)
+        self.keep_alive_interval = keep_alive_interval
+        self.eye_tracker = None
+        self.warm = False  # True once warmup_frames frames were processed
+        self._handed_over = False
+        self._stop_event = threading.Event()
+
+    def take(self):
+        """Stop warming and hand the tracker over, waits for the camera to open.
+
+        Returns:
+            The eye tracker, or None if its camera did not open
+        """
+        self._handed_over = True
+        self._stop_event.set()
+        if self is not threading.current_thread() and self.is_alive():
+            self.join()
+        if self.eye_tracker is not None and not self.eye_tracker.is_opened():
+            self.eye_tracker.release()
+            return None
+        return self.eye_tracker
+
+    def stop(self):
+        """Stop warming, the tracker is released by the warmer thread."""
+        self._stop_event.set()
+
+    def run(self):
+        start = time.monotonic()
+        try:
+            self.eye_tracker = self.open_camera()
+        except Exception as e:
+            print(f"Camera pre-warm error: {e}")
+            return
+
+        frames = 0
+        while not self._stop_event.is_set() and self.eye_tracker.is_opened():
+            if self.eye_tracker.get_processed_frame() is None:
+                self._stop_event.wait(0.01)
+                continue
+            frames += 1
+            if not self.warm and frames >= self.warmup_frames:
+                self.warm = True
+                print(f"Camera warm after {frames} frames in {time.monotonic() - start:.2f}s")
+            if self.warm:
+                self._stop_event.wait(self.keep_alive_interval)
+
+        if not self._handed_over:
+            self.eye_tracker.release()
@@ -0,0 +1,154 @@
+"""
+Columnar log of the timestamped events streamed by the Arduino during a test.
+"""
+import threading
+
+import numpy as np
+
+from app.core.binary_codec import (
+    EVENT_NAMES, EVENT_TEST_START, EVENT_POINT_MOVED, EVENT_LASER_ON, EVENT_LASER_OFF,
+    EVENT_BUTTON_HIT, EVENT_WRONG_PRESS, EVENT_LOOK_AWAY, EVENT_OVERFLOW
+)
+
+
+class EventLog:
+    """Device events stored column-wise in one NumPy structured array.
+
+    Each event keeps its device timestamp and, once the clock is synced, the host
+    time it maps to, so events line up with camera observations. The array grows by
+    doubling, appending is amortised O(1) and analytics run vectorised over columns.
+    """
+
+    DTYPE = np.dtype([
+        ('device_ms', '<u4'),
+        ('event_type', '<u1'),
+        ('point', '<u2'),
+        ('arg', '<i2'),
+        ('host_time', '<f8'),  # NaN before the clock was synced
+    ])
+
+    def __init__(self, capacity=256):
+        """
+        Args:
+            capacity: Initial number of events allocated
+        """
+        self._data = np.zeros(capacity, dtype=self.DTYPE)
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    def clear(self):
+        """Forget all events, e.g. when a new test starts."""
+        with self._lock:
+            self._size = 0
+
+    def append(self, record, host_time=None):
+        """Add an event.
+
+        Args:
+            record: Event record (binary_codec.EVENT_DTYPE)
+            host_time: Host clock time of the event, None if the clock is not synced
+        """
+        with self._lock:
+            if self._size == len(self._data):
+                grown = np.zeros(2 * len(self._data), dtype=self.DTYPE)
+                grown[:self._size] = self._data
+                self._data = grown
+
+            self._data[self._size] = (
+                record['device_ms'], record['event_type'], record['point'], record['arg'],
+                np.nan if host_time is None else host_time,
+            )
+            self._size += 1
+
+    @property
+    def records(self):
+        """Copy of the events so far, in arrival order."""
+        with self._lock:
+            return self._data[:self._size].copy()
+
+    def of_type(self, event_type, records=None):
+        """Events of one type."""
+        records = self.records if records is None else records
+        return records[records['event_type'] == event_type]
+
+    def progress(self):
+        """Test progress reconstructed from the events, in the status document layout."""
+        records = self.records
+        types = records['event_type']
+        starts = records[(types == EVENT_TEST_START) | (types == EVENT_POINT_MOVED)]
+        hits = int(np.count_nonzero(types == EVENT_BUTTON_HIT))
+        return {
+            'test_status': "Test Running",
+            'points_shown': int(np.count_nonzero(types == EVENT_POINT_MOVED)),
+            'total_points': int(starts['arg'][-1]) if len(starts) else 0,
+            'clicks': hits + int(np.count_nonzero(types == EVENT_WRONG_PRESS)),
+            'hits': hits,
+        }
+
+    def reaction_times(self, records=None):
+        """Milliseconds from laser onset to the hit, for every point that was hit.
+
+        Returns:
+            numpy array of reaction times in device milliseconds
+        """
+        return self.point_reaction_times(records)[1]
+
+    def point_reaction_times(self, records=None):
+        """Reaction times together with the points they were measured at.
+
+        Returns:
+            tuple: (points, reaction times in device milliseconds), numpy arrays
+        """
+        records = self.records if records is None else records
+        onsets = self.of_type(EVENT_LASER_ON, records)
+        hits = self.of_type(EVENT_BUTTON_HIT, records)
+        if not len(onsets) or not len(hits):
+            return np.empty(0, dtype=np.uint16), np.empty(0)
+
+        # Latest onset before each hit, it must be for the same point
+        index = np.searchsorted(onsets['device_ms'], hits['device_ms'], side='right') - 1
+        valid = index >= 0
+        index = np.clip(index, 0, None)
+        valid &= onsets['point'][index] == hits['point']
+        reaction = (hits['device_ms'][valid].astype(np.int64) - onsets['device_ms'][index][valid]).astype(np.float64)
+        return hits['point'][valid], reaction
+
+    def look_aways_during_stimulus(self, records=None):
+        """Number of look-aways that started while the laser was on."""
+        records = self.records if records is None else records
+        onsets = self.of_type(EVENT_LASER_ON, records)['device_ms']
+        offsets = self.of_type(EVENT_LASER_OFF, records)['device_ms']
+        look_aways = self.of_type(EVENT_LOOK_AWAY, records)['device_ms']
+        if not len(onsets) or not len(look_aways):
+            return 0
+
+        # The laser turns off at the first LASER_OFF after its onset
+        off_index = np.searchsorted(offsets, onsets, side='left')
+        ends = np.full(len(onsets), np.inf)
+        ends[off_index < len(offsets)] = offsets[off_index[off_index < len(offsets)]]
+
+        on_index = np.searchsorted(onsets, look_aways, side='right') - 1
+        during = (on_index >= 0) & (look_aways < ends[np.clip(on_index, 0, None)])
+        return int(np.count_nonzero(during))
+
+    def summary(self):
+        """Event counts and response analytics of the test."""
+        records = self.records
+        types = records['event_type']
+        reaction = self.reaction_times(records)
+        return {
+            'events': len(records),
+            'counts': {name: int(np.count_nonzero(types == event_type)) for event_type, name in EVENT_NAMES.items()},
+            'lost': int(self.of_type(EVENT_OVERFLOW, records)['arg'].sum()),
+            'reaction_ms': {
+                'count': len(reaction),
+                'mean': float(reaction.mean()) if len(reaction) else None,
+                'median': float(np.median(reaction)) if len(reaction) else None,
+                'min': float(reaction.min()) if len(reaction) else None,
+                'max': float(reaction.max()) if len(reaction) else None,
+            },
+            'look_aways_during_stimulus': self.look_aways_during_stimulus(records),
+        }
@@ -0,0 +1,301 @@
+"""
+Fixation stability metrics computed from the per-frame pupil positions of a test.
+
+    dispersion            RMS distance of the pupil from its mean position, pixels
+    bcea                  Bivariate contour ellipse area holding 68.2% of the positions, pixels^2
+    time out of threshold Seconds the pupil was farther than the threshold from the locked position
+    fixation losses       Runs of frames out of threshold lasting at least min_loss seconds
+    drift                 Speed of the least-squares linear trend of the position, pixels/s
+    blinks                Runs of frames without a pupil lasting blink_min to blink_max seconds
+
+Only frames after the position was locked count. Each frame lasts until the next
+one, capped at max_gap so a stalled camera does not count as a long fixation loss;
+the last frame has no duration. A frame without a pupil ends a fixation loss.
+
+fixation_metrics() computes everything at once over arrays, e.g. a stored session,
+with vectorised NumPy. FixationAnalytics keeps running sums and run states so the
+same metrics are available during a test at O(1) cost per frame.
+"""
+import math
+
+import numpy as np
+
+from app.core.session_store import FLAG_PUPIL, FLAG_LOCKED, FLAG_WITHIN
+
+BCEA_PROBABILITY = 0.682
+BCEA_K = -math.log(1 - BCEA_PROBABILITY)
+
+MAX_GAP = 0.25
+MIN_LOSS = 0.1
+BLINK_MIN = 0.05
+BLINK_MAX = 0.5
+
+
+def _runs(mask):
+    """Start and end (exclusive) indices of the runs of True in a boolean array."""
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], mask.astype(np.int8), [0]))))
+    return edges[0::2], edges[1::2]
+
+
+def _position_metrics(n, sum_x, sum_y, sum_xx, sum_yy, sum_xy, sum_t, sum_tt, sum_tx, sum_ty):
+    """Dispersion, BCEA and drift from the sums of the (shifted) positions and times."""
+    if n < 2:
+        return {'dispersion': None, 'sd_x': None, 'sd_y': None, 'bcea': None, 'drift': None}
+
+    var_x = max(sum_xx / n - (sum_x / n) ** 2, 0.0)
+    var_y = max(sum_yy / n - (sum_y / n) ** 2, 0.0)
+    cov_xy = sum_xy / n - (sum_x / n) * (sum_y / n)
+    sd_x, sd_y = math.sqrt(var_x), math.sqrt(var_y)
+    # 2 pi k sx sy sqrt(1 - rho^2), with sx sy rho = cov
+    bcea = 2 * math.pi * BCEA_K * math.sqrt(max(var_x * var_y - cov_xy ** 2, 0.0))
+
+    var_t = sum_tt / n - (sum_t / n) ** 2
+    drift = None
+    if var_t > 0:
+        slope_x = (sum_tx / n - (sum_t / n) * (sum_x / n)) / var_t
+        slope_y = (sum_ty / n - (sum_t / n) * (sum_y / n)) / var_t
+        drift = math.hypot(slope_x, slope_y)
+
+    return {
+        'dispersion': math.sqrt(var_x + var_y),
+        'sd_x': sd_x,
+        'sd_y': sd_y,
+        'bcea': bcea,
+        'drift': drift,
+    }
+
+
+def _loss_summary(durations):
+    durations = np.asarray(durations, dtype=np.float64)
+    return {
+        'count': len(durations),
+        'total': float(durations.sum()),
+        'mean': float(durations.mean()) if len(durations) else None,
+        'max': float(durations.max()) if len(durations) else None,
+    }
+
+
+def fixation_metrics(times, x, y, within, locked=None, max_gap=MAX_GAP, min_loss=MIN_LOSS,
+                     blink_min=BLINK_MIN, blink_max=BLINK_MAX):
+    """Fixation stability metrics of a sequence of frames.
+
+    Args:
+        times: Frame times in seconds, in order
+        x: Pupil x per frame, NaN without a pupil
+        y: Pupil y per frame, NaN without a pupil
+        within: Whether the pupil was within the threshold, per frame
+        locked: Whether the position was locked, per frame, None if always
+        max_gap: Longest duration a single frame counts for, seconds
+        min_loss: Shortest time out of threshold counted as a fixation loss, seconds
+        blink_min: Shortest time without a pupil counted as a blink, seconds
+        blink_max: Longest time without a pupil counted as a blink, seconds
+
+    Returns:
+        dict: See FixationAnalytics.summary
+    """
+    times = np.asarray(times, dtype=np.float64)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    within = np.asarray(within, dtype=bool)
+    locked = np.ones(len(times), dtype=bool) if locked is None else np.asarray(locked, dtype=bool)
+
+    # A frame processed twice has the same timestamp, count it once
+    fresh = np.diff(times, prepend=-np.inf) > 0
+    times, x, y, within = times[fresh], x[fresh], y[fresh], within[fresh]
+    locked = locked[fresh]
+    times, x, y, within = times[locked], x[locked], y[locked], within[locked]
+
+    duration = np.minimum(np.diff(times, append=times[-1:]), max_gap) if len(times) else np.empty(0)
+    # Cumulative durations, a run from start to end lasts elapsed[end] - elapsed[start]
+    elapsed = np.concatenate(([0.0], np.cumsum(duration)))
+
+    pupil = ~np.isnan(x) & ~np.isnan(y)
+    out = pupil & ~within
+
+    starts, ends = _runs(out)
+    losses = elapsed[ends] - elapsed[starts]
+    losses = losses[losses >= min_loss]
+
+    starts, ends = _runs(~pupil)
+    missing = elapsed[ends] - elapsed[starts]
+    blinks = int(np.count_nonzero((missing >= blink_min) & (missing <= blink_max)))
+
+    n = int(np.count_nonzero(pupil))
+    if n:
+        # Shifted to the first sample, the sums stay exact for perf_counter() sized times
+        t = times[pupil] - times[pupil][0]
+        px = x[pupil] - x[pupil][0]
+        py = y[pupil] - y[pupil][0]
+        position = _position_metrics(
+            n, px.sum(), py.sum(), px @ px, py @ py, px @ py, t.sum(), t @ t, t @ px, t @ py
+        )
+    else:
+        position = _position_metrics(0, *([0.0] * 9))
+
+    tracked = float(duration[pupil].sum())
+    out_time = float(duration[out].sum())
+    return {
+        'frames': len(times),
+        'duration': float(elapsed[-1]),
+        **position,
+        'time_out_of_threshold': out_time,
+        'out_of_threshold_fraction': out_time / tracked if tracked else None,
+        'fixation_losses': _loss_summary(losses),
+        'blinks': blinks,
+    }
+
+
+def session_fixation_metrics(records, eye=0, **kwargs):
+    """Fixation stability metrics of stored observations.
+
+    Args:
+        records: OBSERVATION_DTYPE records, e.g. SessionReader.observations
+        eye: Eye index in binocular mode
+        **kwargs: Thresholds passed to fixation_metrics
+
+    Returns:
+        dict: See FixationAnalytics.summary
+    """
+    records = records[records['eye'] == eye]
+    flags = records['flags']
+    return fixation_metrics(
+        records['host_time'],
+        np.where(flags & FLAG_PUPIL, records['pupil_x'], np.nan),
+        np.where(flags & FLAG_PUPIL, records['pupil_y'], np.nan),
+        (flags & FLAG_WITHIN) != 0,
+        (flags & FLAG_LOCKED) != 0,
+        **kwargs,
+    )
+
+
+class FixationAnalytics:
+    """Fixation stability metrics updated frame by frame during a test.
+
+    Keeps running sums of the positions and times, for dispersion, BCEA and drift,
+    and the state of the current out-of-threshold and pupil-missing runs. update()
+    and summary() are O(1), whatever the length of the test, and summary() gives
+    the same values as fixation_metrics() over the same frames.
+    """
+
+    def __init__(self, max_gap=MAX_GAP, min_loss=MIN_LOSS, blink_min=BLINK_MIN, blink_max=BLINK_MAX):
+        """
+        Args:
+            max_gap: Longest duration a single frame counts for, seconds
+            min_loss: Shortest time out of threshold counted as a fixation loss, seconds
+            blink_min: Shortest time without a pupil counted as a blink, seconds
+            blink_max: Longest time without a pupil counted as a blink, seconds
+        """
+        self.max_gap = max_gap
+        self.min_loss = min_loss
+        self.blink_min = blink_min
+        self.blink_max = blink_max
+        self.reset()
+
+    def reset(self):
+        """Forget all frames, e.g. when a new test starts."""
+        self.frames = 0
+        self.duration = 0.0
+        self._last = None  # (time, has pupil, out of threshold) of the previous frame
+        self._origin = None  # (time, x, y) the position sums are shifted by
+        self._sums = [0.0] * 9  # x, y, xx, yy, xy, t, tt, tx, ty
+        self._pupil_frames = 0
+        self.tracked_time = 0.0
+        self.out_time = 0.0
+        self._loss_run = 0.0  # Duration of the current out-of-threshold run
+        self._missing_run = 0.0  # Duration of the current run without a pupil
+        self._losses = []
+        self.blinks = 0
+
+    def update(self, observation):
+        """Add the observation of a frame (see EyeTracker._build_observation).
+
+        Args:
+            observation: Observation dict, ignored if None, not locked, or already added
+        """
+        if not observation or not observation.get('is_position_locked'):
+            return
+        timestamp = observation.get('timestamp')
+        if timestamp is None or (self._last is not None and timestamp <= self._last[0]):
+            return
+        pupil = observation.get('pupil_center')
+        self.add(timestamp, pupil, bool(observation.get('within_threshold')))
+
+    def add(self, timestamp, pupil, within):
+        """Add a locked frame.
+
+        Args:
+            timestamp: Frame time in seconds, later than the previous frame
+            pupil: (x, y) of the pupil, None if not found
+            within: Whether the pupil was within the threshold
+        """
+        if self._last is not None:
+            self._close_frame(min(timestamp - self._last[0], self.max_gap))
+
+        has_pupil = pupil is not None
+        out = has_pupil and not within
+        if has_pupil:
+            x, y = float(pupil[0]), float(pupil[1])
+            if self._origin is None:
+                self._origin = (timestamp, x, y)
+            t, px, py = timestamp - self._origin[0], x - self._origin[1], y - self._origin[2]
+            for index, value in enumerate((px, py, px * px, py * py, px * py, t, t * t, t * px, t * py)):
+                self._sums[index] += value
+            self._pupil_frames += 1
+
+        # Runs end when a frame of another kind arrives
+        if not out and self._loss_run:
+            self._end_loss()
+        if has_pupil and self._missing_run:
+            self._end_missing()
+        self._last = (timestamp, has_pupil, out)
+        self.frames += 1
+
+    def _close_frame(self, duration):
+        """The previous frame lasted duration seconds."""
+        _, has_pupil, out = self._last
+        self.duration += duration
+        if has_pupil:
+            self.tracked_time += duration
+        else:
+            self._missing_run += duration
+        if out:
+            self.out_time += duration
+            self._loss_run += duration
+
+    def _end_loss(self):
+        if self._loss_run >= self.min_loss:
+            self._losses.append(self._loss_run)
+        self._loss_run = 0.0
+
+    def _end_missing(self):
+        if self.blink_min <= self._missing_run <= self.blink_max:
+            self.blinks += 1
+        self._missing_run = 0.0
+
+    @property
+    def current_loss(self):
+        """Seconds the pupil has been out of threshold, 0 while within."""
+        return self._loss_run
+
+    def summary(self):
+        """Metrics of the frames so far.
+
+        Returns:
+            dict: frames, duration (s), dispersion, sd_x, sd_y (pixels), bcea (pixels^2),
+                  drift (pixels/s), time_out_of_threshold (s), out_of_threshold_fraction,
+                  fixation_losses {count, total, mean, max} (s) and blinks.
+                  Position metrics are None with fewer than two pupil frames.
+        """
+        losses = list(self._losses)
+        if self._loss_run >= self.min_loss:
+            losses.append(self._loss_run)
+        blinks = self.blinks + (self.blink_min <= self._missing_run <= self.blink_max)
+        return {
+            'frames': self.frames,
+            'duration': self.duration,
+            **_position_metrics(self._pupil_frames, *self._sums),
+            'time_out_of_threshold': self.out_time,
+            'out_of_threshold_fraction': self.out_time / self.tracked_time if self.tracked_time else None,
+            'fixation_losses': _loss_summary(losses),
+            'blinks': int(blinks),
+        }
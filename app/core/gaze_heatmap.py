@@ -0,0 +1,160 @@
+"""
+2D histogram of the pupil's offsets from the locked position, for display.
+"""
+import numpy as np
+
+# Colour map anchors, from few to many frames in a bin (RGB)
+HEATMAP_COLORS = np.array([
+    [48, 18, 59],
+    [40, 120, 220],
+    [30, 200, 140],
+    [250, 210, 40],
+    [220, 40, 20],
+], dtype=np.float64)
+
+
+def colour_lut(colors=HEATMAP_COLORS):
+    """256 entry RGBA lookup table interpolating the colour anchors, entry 0 transparent."""
+    positions = np.linspace(0, 255, len(colors))
+    lut = np.empty((256, 4), dtype=np.uint8)
+    for channel in range(3):
+        lut[:, channel] = np.interp(np.arange(256), positions, colors[:, channel]).astype(np.uint8)
+    lut[:, 3] = 255
+    lut[0] = 0
+    return lut
+
+
+class GazeHeatmap:
+    """Counts of the pupil offsets from the locked position on a fixed grid.
+
+    Adding a frame increments one bin, O(1). The grid covers [-extent, extent)
+    pixels on both axes, offsets beyond it are only counted. render() colours the
+    bins on a log scale and only recolours the bins changed since the previous call,
+    unless the maximum count changed, so its cost is bounded by the grid size and
+    never depends on the number of frames.
+    """
+
+    def __init__(self, extent=96, bins=48):
+        """
+        Args:
+            extent: Largest offset shown, in frame pixels
+            bins: Number of bins along each axis
+        """
+        self.extent = float(extent)
+        self.bins = bins
+        self.bin_size = 2 * self.extent / bins
+        self._lut = colour_lut()
+        self.clear()
+
+    def clear(self):
+        """Forget all frames, e.g. when a new test starts."""
+        self.counts = np.zeros((self.bins, self.bins), dtype=np.uint32)  # [row (y), column (x)]
+        self.total = 0
+        self.outside = 0
+        self.max_count = 0
+        self.version = 0  # Changes whenever the counts do
+        self._last_timestamp = None
+        self._image = np.zeros((self.bins, self.bins, 4), dtype=np.uint8)
+        self._levels = np.zeros((self.bins, self.bins), dtype=np.uint8)
+        self._rendered_max = 0
+        self._dirty = set()
+
+    def add(self, dx, dy):
+        """Count one offset from the locked position, in frame pixels (y down)."""
+        self.total += 1
+        column = int((dx + self.extent) // self.bin_size)
+        row = int((dy + self.extent) // self.bin_size)
+        if not (0 <= column < self.bins and 0 <= row < self.bins):
+            self.outside += 1
+            return
+        count = self.counts[row, column] + 1
+        self.counts[row, column] = count
+        if count > self.max_count:
+            self.max_count = int(count)
+        self._dirty.add(row * self.bins + column)
+        self.version += 1
+
+    def add_many(self, dx, dy):
+        """Count many offsets at once, e.g. from a stored session.
+
+        Args:
+            dx, dy: Arrays of offsets in frame pixels, NaN entries are skipped
+        """
+        dx = np.asarray(dx, dtype=np.float64)
+        dy = np.asarray(dy, dtype=np.float64)
+        valid = ~np.isnan(dx) & ~np.isnan(dy)
+        columns = np.floor((dx[valid] + self.extent) / self.bin_size).astype(np.int64)
+        rows = np.floor((dy[valid] + self.extent) / self.bin_size).astype(np.int64)
+        inside = (columns >= 0) & (columns < self.bins) & (rows >= 0) & (rows < self.bins)
+        self.total += int(np.count_nonzero(valid))
+        self.outside += int(np.count_nonzero(~inside))
+        flat = rows[inside] * self.bins + columns[inside]
+        self.counts += np.bincount(flat, minlength=self.bins ** 2).reshape(self.bins, self.bins).astype(np.uint32)
+        self.max_count = int(self.counts.max())
+        self._rendered_max = -1  # Recolour everything
+        self.version += 1
+
+    def update(self, observation):
+        """Count the offset of a frame's pupil (see EyeTracker._build_observation).
+
+        Args:
+            observation: Observation dict, ignored without a pupil or locked position,
+                         or if the frame was already counted
+        """
+        if not observation:
+            return
+        pupil = observation.get('pupil_center')
+        locked = observation.get('locked_position')
+        timestamp = observation.get('timestamp')
+        if pupil is None or locked is None or timestamp == self._last_timestamp:
+            return
+        self._last_timestamp = timestamp
+        self.add(pupil[0] - locked[0], pupil[1] - locked[1])
+
+    def render(self):
+        """The bins coloured on a log scale of their counts.
+
+        Returns:
+            numpy array (bins, bins, 4) RGBA uint8, rows top to bottom. The array is
+            reused, copy it to keep an image across calls.
+        """
+        if self.max_count == 0:
+            self._image[:] = 0
+        elif self.max_count != self._rendered_max:
+            # The scale changed, every bin's colour does
+            scale = 255 / np.log1p(self.max_count)
+            self._levels[:] = np.ceil(np.log1p(self.counts) * scale).clip(0, 255)
+            self._image[:] = self._lut[self._levels]
+        elif self._dirty:
+            flat = np.fromiter(self._dirty, dtype=np.int64, count=len(self._dirty))
+            rows, columns = np.divmod(flat, self.bins)
+            scale = 255 / np.log1p(self.max_count)
+            levels = np.ceil(np.log1p(self.counts[rows, columns]) * scale).clip(0, 255).astype(np.uint8)
+            self._levels[rows, columns] = levels
+            self._image[rows, columns] = self._lut[levels]
+        self._rendered_max = self.max_count
+        self._dirty.clear()
+        return self._image
+
+    def to_dict(self):
+        """JSON-serialisable form, only the bins with counts are listed."""
+        flat = np.flatnonzero(self.counts)
+        return {
+            'extent': self.extent,
+            'bins': self.bins,
+            'total': self.total,
+            'outside': self.outside,
+            'cells': np.column_stack((flat, self.counts.ravel()[flat])).tolist(),  # [bin index, count]
+        }
+
+    @classmethod
+    def from_dict(cls, document):
+        """Heatmap saved with to_dict."""
+        heatmap = cls(document['extent'], document['bins'])
+        cells = np.asarray(document['cells'], dtype=np.int64).reshape(-1, 2)
+        heatmap.counts.ravel()[cells[:, 0]] = cells[:, 1]
+        heatmap.total = document['total']
+        heatmap.outside = document['outside']
+        heatmap.max_count = int(heatmap.counts.max())
+        heatmap.version = 1
+        return heatmap
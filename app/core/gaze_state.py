@@ -0,0 +1,116 @@
+"""
+Debounced in/out of threshold decision for the locked pupil position.
+"""
+import time
+from collections import deque
+
+from app.core.serial_metrics import LatencyHistogram
+
+
+class GazeStateMachine:
+    """Decides whether the pupil is within threshold of the locked position.
+
+    A single frame comparison against one threshold chatters when the pupil sits
+    near the boundary. Three filters are applied instead, each optional:
+
+    - Hysteresis: leaving the "within" state needs distance > threshold, returning
+      to it needs distance < threshold - hysteresis.
+    - Vote: the frame's verdict is the majority of the last vote_window frames.
+    - Dwell: the voted state must persist for dwell_ms before the decision changes.
+
+    The look-away latency is bounded by dwell_ms plus the frames needed to win the
+    vote. The delay actually added to each transition (from the first frame in
+    the vote window favouring it to the switch) is recorded in self.latency.
+    """
+
+    def __init__(self, threshold=48, hysteresis=0, dwell_ms=0, vote_window=1, clock=time.perf_counter):
+        """
+        Args:
+            threshold: Distance in pixels above which the pupil is out of threshold
+            hysteresis: Pixels below threshold the distance must fall to count as within again
+            dwell_ms: Milliseconds a new state must persist before it is reported
+            vote_window: Number of frames voting on the state, 1 to decide per frame
+            clock: Clock in seconds used when update is not given a timestamp
+        """
+        self.threshold = threshold
+        self.hysteresis = hysteresis
+        self.dwell_ms = dwell_ms
+        self.clock = clock
+        self.latency = LatencyHistogram()
+        self.set_vote_window(vote_window)
+        self.reset()
+
+    def reset(self, within=True):
+        """Start over in the given state, e.g. after the position is locked again."""
+        self.within = within
+        self._votes.clear()
+        self._vote_times.clear()
+        self._out_votes = 0
+        self._pending_since = None
+        self.transitions = 0
+        self.suppressed = 0  # Candidate transitions that did not last long enough
+        self.latency.reset()
+
+    def set_vote_window(self, frames):
+        self.vote_window = max(1, int(frames))
+        self._votes = deque(maxlen=self.vote_window)
+        self._vote_times = deque(maxlen=self.vote_window)
+        self._out_votes = 0
+
+    @property
+    def reenter_threshold(self):
+        """Distance below which an out of threshold pupil counts as within again."""
+        return max(0, self.threshold - self.hysteresis)
+
+    def update(self, distance, timestamp=None):
+        """Feed one frame's distance from the locked position.
+
+        Args:
+            distance: Euclidean distance in pixels
+            timestamp: Frame time in seconds, defaults to the clock
+
+        Returns:
+            tuple: (within, changed), the decided state and whether it changed on this frame
+        """
+        now = self.clock() if timestamp is None else timestamp
+
+        # Hysteresis, the threshold that applies depends on the current state
+        if self.within:
+            frame_out = distance > self.threshold
+        else:
+            frame_out = distance >= self.reenter_threshold
+
+        # Majority vote over the last frames, kept as a running count
+        if len(self._votes) == self._votes.maxlen:
+            self._out_votes -= self._votes[0]
+        self._votes.append(frame_out)
+        self._vote_times.append(now)
+        self._out_votes += frame_out
+        voted_within = self._out_votes * 2 <= len(self._votes) if self.within else self._out_votes * 2 < len(self._votes)
+
+        if voted_within == self.within:
+            if self._pending_since is not None:
+                self.suppressed += 1
+                self._pending_since = None
+            return self.within, False
+
+        # Dwell, the new state must hold for dwell_ms
+        if self._pending_since is None:
+            self._pending_since = now
+        if (now - self._pending_since) * 1000 < self.dwell_ms:
+            return self.within, False
+
+        first_vote = min(t for t, out in zip(self._vote_times, self._votes) if out != voted_within)
+        self.latency.record((now - min(first_vote, self._pending_since)) * 1000)
+        self.within = voted_within
+        self._pending_since = None
+        self.transitions += 1
+        return self.within, True
+
+    def summary(self):
+        """Transition counts and added decision latency."""
+        return {
+            'transitions': self.transitions,
+            'suppressed': self.suppressed,
+            'latency': self.latency.summary(),
+        }
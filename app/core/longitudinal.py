@@ -0,0 +1,146 @@
+"""
+Trends across the tests of a patient, for follow-up comparisons.
+
+Session trends are least-squares slopes of the summary metrics over time. Point
+trends are computed per test location, identified by (pattern, eye, point index),
+since only tests of the same pattern and eye show the same point at the same place.
+All slopes are per year, and all groups are reduced at once with np.bincount.
+"""
+from datetime import datetime
+
+import numpy as np
+
+SECONDS_PER_YEAR = 365.25 * 24 * 3600
+
+
+def _years(started):
+    """ISO start times as years since the first one."""
+    seconds = np.array([datetime.fromisoformat(value).timestamp() for value in started], dtype=np.float64)
+    return (seconds - seconds.min()) / SECONDS_PER_YEAR if len(seconds) else seconds
+
+
+def _slope(t, x):
+    """Least-squares slope of x over t, None with fewer than two distinct times or values."""
+    valid = ~np.isnan(x)
+    t, x = t[valid], x[valid]
+    if len(t) < 2 or np.ptp(t) == 0:
+        return None
+    t = t - t.mean()
+    return float(t @ (x - x.mean()) / (t @ t))
+
+
+def _grouped_slopes(groups, count, t, x):
+    """Least-squares slope of x over t within each group, NaN where undefined.
+
+    Args:
+        groups: Group index of each sample, 0 to count - 1
+        count: Number of groups
+        t, x: Samples, NaN x are left out
+    """
+    valid = ~np.isnan(x)
+    groups, t, x = groups[valid], t[valid], x[valid]
+    n = np.bincount(groups, minlength=count).astype(np.float64)
+    sum_t = np.bincount(groups, t, minlength=count)
+    sum_x = np.bincount(groups, x, minlength=count)
+    sum_tt = np.bincount(groups, t * t, minlength=count)
+    sum_tx = np.bincount(groups, t * x, minlength=count)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        var_t = sum_tt - sum_t * sum_t / n
+        slopes = (sum_tx - sum_t * sum_x / n) / var_t
+    slopes[(n < 2) | ~(var_t > 1e-12)] = np.nan
+    return slopes
+
+
+def _value(value):
+    """JSON-friendly float, None for NaN."""
+    return None if value is None or np.isnan(value) else float(value)
+
+
+def compute_trends(sessions, responses):
+    """Per-session and per-point trends of a patient's tests.
+
+    Args:
+        sessions: Session dicts with id, started, pattern, eye, accuracy and mean_reaction_ms
+        responses: Response dicts with session, point, hit, servo1, servo2 and reaction_ms
+
+    Returns:
+        dict: 'sessions' in chronological order, 'session_trend' with the accuracy and
+              reaction time slopes per year, and 'points', one entry per test location
+              with its hit rate, reaction time and their slopes per year, worst first
+    """
+    sessions = sorted(sessions, key=lambda session: (session['started'], session['id']))
+    years = _years([session['started'] for session in sessions])
+    accuracy = np.array([session['accuracy'] for session in sessions], dtype=np.float64)
+    reaction = np.array([
+        np.nan if session['mean_reaction_ms'] is None else session['mean_reaction_ms'] for session in sessions
+    ], dtype=np.float64)
+
+    session_trend = {
+        'tests': len(sessions),
+        'first': sessions[0]['started'] if sessions else None,
+        'last': sessions[-1]['started'] if sessions else None,
+        'accuracy_per_year': _slope(years, accuracy),
+        'mean_reaction_ms_per_year': _slope(years, reaction),
+        'accuracy_change': float(accuracy[-1] - accuracy[0]) if len(sessions) > 1 else None,
+    }
+
+    points = []
+    if responses:
+        session_years = {session['id']: year for session, year in zip(sessions, years)}
+        session_keys = {session['id']: (session['pattern'] or '', session['eye'] or '') for session in sessions}
+        known = [response for response in responses if response['session'] in session_years]
+        keys = [(*session_keys[response['session']], response['point']) for response in known]
+        unique_keys = sorted(set(keys))
+        key_index = {key: index for index, key in enumerate(unique_keys)}
+        count = len(unique_keys)
+
+        groups = np.array([key_index[key] for key in keys], dtype=np.int64)
+        t = np.array([session_years[response['session']] for response in known], dtype=np.float64)
+        hit = np.array([response['hit'] for response in known], dtype=np.float64)
+        rt = np.array([
+            np.nan if response['reaction_ms'] is None else response['reaction_ms'] for response in known
+        ], dtype=np.float64)
+
+        tests = np.bincount(groups, minlength=count)
+        hits = np.bincount(groups, hit, minlength=count)
+        rt_valid = ~np.isnan(rt)
+        rt_count = np.bincount(groups[rt_valid], minlength=count)
+        rt_sum = np.bincount(groups[rt_valid], rt[rt_valid], minlength=count)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rt_mean = rt_sum / rt_count
+        hit_slopes = _grouped_slopes(groups, count, t, hit)
+        rt_slopes = _grouped_slopes(groups, count, t, rt)
+
+        # Latest response and servo angles of each location
+        order = np.lexsort((t, groups))
+        last = order[np.r_[np.flatnonzero(np.diff(groups[order])), len(order) - 1]]
+
+        for index, (pattern, eye, point) in enumerate(unique_keys):
+            latest = known[last[index]]
+            points.append({
+                'pattern': pattern,
+                'eye': eye,
+                'point': int(point),
+                'servo1': latest['servo1'],
+                'servo2': latest['servo2'],
+                'tests': int(tests[index]),
+                'hit_rate': float(hits[index] / tests[index]),
+                'hit_rate_per_year': _value(hit_slopes[index]),
+                'mean_reaction_ms': _value(rt_mean[index]),
+                'reaction_ms_per_year': _value(rt_slopes[index]),
+                'last_hit': bool(latest['hit']),
+            })
+        # Locations losing sensitivity fastest first, then the least often seen
+        points.sort(key=lambda entry: (
+            entry['hit_rate_per_year'] if entry['hit_rate_per_year'] is not None else 0.0, entry['hit_rate']
+        ))
+
+    return {
+        'sessions': [
+            {key: session[key] for key in ('id', 'started', 'pattern', 'eye', 'points_shown', 'hits', 'accuracy',
+                                           'mean_reaction_ms', 'false_presses', 'look_aways') if key in session}
+            for session in sessions
+        ],
+        'session_trend': session_trend,
+        'points': points,
+    }
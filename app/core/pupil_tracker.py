@@ -1,14 +1,14 @@
 import cv2
 import numpy as np
 import math
-import tkinter as tk
 import os
-from tkinter import filedialog
 import time
 import gc
 
 from app.core.arduino_tracker import ArduinoTracker
 from app.core.pupil_tracker_utils import EyeTrackerUtils
+from app.core.gaze_state import GazeStateMachine
+from app.utils.config import DEFAULT_CONFIG
 # FOR PROFILLING
 """
 # Add your app directory to path (adjust as needed)
@@ -25,10 +25,19 @@ class EyeTracker():
     TEST_VIDEO = 1
     KERNEL_SIZE = 5
     
-    def __init__(self, arduino_tracker=None):
-        """Initialize the eye tracker"""
+    def __init__(self, arduino_tracker=None, camera_source=0, tracking_config=None):
+        """Initialize the eye tracker
+        
+        Args:
+            arduino_tracker: ArduinoTracker to send in/out of threshold commands to, or None
+            camera_source: Camera index (or video path) passed to cv2.VideoCapture
+            tracking_config: The 'eye_tracking' config section, lock threshold and look-away
+                             debouncing. None for the defaults of DEFAULT_CONFIG
+        """
+        tracking_config = tracking_config or DEFAULT_CONFIG['eye_tracking']
         self.tracker = arduino_tracker
         self.cap = None
+        self.camera_source = camera_source
 
         # Video input path 
         self.vid_input = self.CAMERA_FEED
@@ -36,9 +45,9 @@ class EyeTracker():
         # Configuration parameters
         # self.threshold_value = 15  # Default threshold value (no clue)
         self.zoom_factor = 1 # Video feed zoom factor
-        self.lockpos_threshold = 48 # Allowable distance between pupil position and initial calibrated position. (Euclid dist)
+        self.lockpos_threshold = tracking_config['lockpos_threshold'] # Allowable distance between pupil position and initial calibrated position. (Euclid dist)
         self.zoom_center = None 
-        self.confidence_margin_for_switching_bin_threshold = 2
+        self.confidence_margin_for_switching_bin_threshold = tracking_config['threshold_switch_confidence_margin']
         
         # State tracking
         self.pupil_center_pos = None # Tracks the center of the pupil (center of darkest area)
@@ -47,7 +56,15 @@ class EyeTracker():
         self.distance_between_pupilpos_and_lockpos = 0 # Tracks the distance between the pupil pos in the current frame with the initial calibrated position
         self.is_pupil_pos_within_threshold = True # True if the distance between the pupil pos current frame within the set threshold. i.e. False if too far, user is looking away
         self.prev_command = 'L'
+        self.gaze_state = GazeStateMachine( # Debounces the in/out of threshold decision sent to the Arduino
+            threshold=self.lockpos_threshold,
+            hysteresis=tracking_config['gaze_hysteresis'],
+            dwell_ms=tracking_config['gaze_dwell_ms'],
+            vote_window=tracking_config['gaze_vote_window']
+        )
         self.frame_count = 0
+        self.frame_time = None # time.perf_counter() when the current frame was read, Arduino timestamps map onto this clock
+        self.observation = None # Detection results of the latest frame, painted as overlays by the GUI
 
         self.prev_threshold_index = 0 # Tracks the grayscale threshold used. There are 3 grayscale thresholds used, for differing degree of strictness. 1 - light, 2 - medium, 3 - heavy (strict). The threshold used is dynamically determined to give best fitted pupil.
 
@@ -135,27 +152,48 @@ class EyeTracker():
                 self.distance_between_pupilpos_and_lockpos =  math.dist(self.locked_position, self.pupil_center_pos) 
                 frame = self.lockpos(frame, selected_contours)
 
-        test_frame = frame.copy()
-        
+        ellipse = None
         if selected_contours:
             optimised_contours = [EyeTrackerUtils.optimize_contours_by_angle(selected_contours, gray_frame)]
             
             if optimised_contours and not isinstance(optimised_contours[0], list) and len(optimised_contours[0]) > 5:
                 ellipse = cv2.fitEllipse(optimised_contours[0])
                 final_rotated_rect = ellipse
-                center_x, center_y = map(int, ellipse[0])
-                cv2.circle(test_frame, (center_x, center_y), 3, (255, 255, 0), -1)
-
-                if self.is_position_locked == False:
-                    cv2.ellipse(test_frame, ellipse, (255, 0, 0), 2)
 
         else:
             optimised_contours = []
 
+        # Overlays are drawn by the GUI painter from this observation, the frame itself is left untouched
+        self.observation = self._build_observation(frame, ellipse)
+
         del dilated_image, contours, hierachy, reduced_contours, final_contours 
 
-        # Return the test_frame which has all the visualizations
-        return test_frame, final_rotated_rect, optimised_contours, prev_threshold_index
+        # Return the raw frame, visualizations are described by self.observation
+        return frame, final_rotated_rect, optimised_contours, prev_threshold_index
+
+    def _build_observation(self, frame, ellipse):
+        """Describe the current frame's detection for overlay painting
+        
+        Args:
+            frame: Frame the detection was made on (after crop and zoom)
+            ellipse: Fitted pupil ellipse ((cx, cy), (w, h), angle) or None
+            
+        Returns:
+            dict: Observation in frame pixel coordinates
+        """
+        height, width = frame.shape[:2]
+        return {
+            'timestamp': self.frame_time,
+            'frame_size': (width, height),
+            'pupil_center': self.pupil_center_pos,
+            'ellipse': ellipse,
+            'is_position_locked': self.is_position_locked,
+            'locked_position': self.locked_position if self.is_position_locked else None,
+            'lockpos_threshold': self.lockpos_threshold,
+            'reenter_threshold': self.gaze_state.reenter_threshold,
+            'distance': self.distance_between_pupilpos_and_lockpos,
+            'within_threshold': self.is_pupil_pos_within_threshold,
+        }
 
     # Finds the pupil in an individual frame and returns the center point
     def _process_single_frame(self, frame):
@@ -173,6 +211,7 @@ class EyeTracker():
         # Find the darkest point (pupil center)
         self.pupil_center_pos = EyeTrackerUtils.get_darkest_area_vectorized(frame)
         if self.pupil_center_pos is None:
+            self.observation = self._build_observation(frame, None)
             return frame  # Return original frame if no darkest point found
         
         # Convert to grayscale
@@ -192,7 +231,7 @@ class EyeTracker():
         # Check if we have a locked position to track
         self.locked_position = self.locked_position if self.is_position_locked else -1
         
-        # Process frames with your existing method - get the processed frame with visualizations
+        # Process frames with your existing method - get the frame and fitted pupil
         processed_frame, pupil_rotated_rect, final_contours, threshold_index = self.process_frames(
             self.prev_threshold_index, 
             self.confidence_margin_for_switching_bin_threshold,
@@ -208,11 +247,19 @@ class EyeTracker():
         
         del gray_frame, thresholded_image_strict, thresholded_image_medium, thresholded_image_relaxed
         
-        # Return the processed frame with visualizations
+        # Return the processed frame, overlays are described by self.observation
         return processed_frame
 
+    def is_opened(self):
+        """Check if the camera is open"""
+        return self.cap is not None and self.cap.isOpened()
+
     def get_processed_frame(self):
-        """Get current frame with processing applied - called by GUI timer"""
+        """Get current frame with processing applied - called by GUI timer
+        
+        The returned frame is not drawn on, the detection for it is available
+        in self.observation for the GUI to paint as overlays.
+        """
         if not self.cap or not self.cap.isOpened():
             return None
         
@@ -220,6 +267,7 @@ class EyeTracker():
         if not ret:
             return None
         
+        self.frame_time = time.perf_counter()
         self.frame_count += 1
         
         # Apply all processing steps and return the processed frame
@@ -234,10 +282,7 @@ class EyeTracker():
     def _initialize_camera(self):
         """Initialize the webcam"""
         try:
-            if self.vid_input:
-                self.cap = cv2.VideoCapture(0)  # Use default camera // NOT FIXED need to think of some realtive path maybe idk
-            else:
-                self.cap = cv2.VideoCapture(0)  # Use default camera
+            self.cap = cv2.VideoCapture(self.camera_source)  # Default camera is 0
 
             self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 2048)
             self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 1080)
@@ -262,60 +307,51 @@ class EyeTracker():
             lockpos_threshold: Maximum allowed distance
             
         Returns:
-            processed_frame
+            frame, unmodified. The in/out status is painted by the GUI from self.observation
         """        
         # Only process if we have contours
         if not final_contours:
             return frame
+        
+        # Debounced decision, chattering near the threshold is filtered out
+        within, _ = self.gaze_state.update(self.distance_between_pupilpos_and_lockpos, self.frame_time)
             
         # Check if pupil is within allowed distance from reference point
-        if self.distance_between_pupilpos_and_lockpos > self.lockpos_threshold:
-            # Pupil is outside threshold - draw red ellipse
-            self.is_pupil_pos_within_threshold = False
-            frame = EyeTrackerUtils.fit_and_draw_ellipses(frame, final_contours[0], (255, 0, 0))
-            command = 'H'
-
-            
-            # Send command to Arduino if tracker is available AND if command is different from previous command (for efficiency) 
-            if self.tracker and self.tracker.is_connected() and command != self.prev_command:
-                result = self.tracker.send_command(command)
-
-                # Add ack cmd checker??
-                
-                if result == 1:
-                    print("OUT OF THRESHOLD command sent and acknowledged")
-                    self.prev_command = command
-                elif result == 2:
-                    print("Error: Program ended by Arduino")
-                    return frame  # Signal to main loop to exit
-                else:
-                    print("Failed to send OUT OF THRESHOLD command")
-                    
-            # print("Out of threshold")
-        else:
-            # Pupil is within threshold - draw green ellipse
-            self.is_pupil_pos_within_threshold = True
-            frame = EyeTrackerUtils.fit_and_draw_ellipses(frame, final_contours[0], (0, 255, 0))
-            command = 'L'
-            
-            # Send command to Arduino if tracker is available
-            if self.tracker and self.tracker.is_connected() and command != self.prev_command:
-                result = self.tracker.send_command(command)
-                
-                if result == 1:
-                    print("WITHIN THRESHOLD command sent and acknowledged")
-                    self.prev_command = command
-                elif result == 2:
-                    print("Program ended by Arduino")
-                    return frame
-                else:
-                    print("Failed to send WITHIN THRESHOLD command")
+        self.is_pupil_pos_within_threshold = within
+        command = 'L' if within else 'H'
+        
+        # Queue command for the Arduino if tracker is available AND if command is different from previous command (for efficiency).
+        # The outbox thread does the serial write, so a stalled port never stalls the frame loop
+        if self.tracker and command != self.prev_command:
+            if self.tracker.post_command(command, coalesce_key='gaze', on_failure=self._on_command_failed):
+                self.prev_command = command
             
         return frame
     
+    def _on_command_failed(self, command):
+        """Called by the outbox thread when a gaze command could not be sent, resend on the next frame"""
+        if self.prev_command == command:
+            self.prev_command = None
+    
     def set_threshold(self, value):
         """Set the threshold value based on slider in GUI"""
         self.lockpos_threshold = value
+        self.gaze_state.threshold = value
+
+    def set_gaze_filter(self, hysteresis=None, dwell_ms=None, vote_window=None):
+        """Configure the debouncing of the in/out of threshold decision
+        
+        Args:
+            hysteresis: Pixels below the threshold the pupil must return to count as within again
+            dwell_ms: Milliseconds a new state must persist before it is sent to the Arduino
+            vote_window: Number of frames voting on the state, 1 to decide per frame
+        """
+        if hysteresis is not None:
+            self.gaze_state.hysteresis = hysteresis
+        if dwell_ms is not None:
+            self.gaze_state.dwell_ms = dwell_ms
+        if vote_window is not None:
+            self.gaze_state.set_vote_window(vote_window)
 
     def set_confidence_margin(self, value):
         """Set the threshold value based on slider in GUI"""
@@ -347,6 +383,7 @@ class EyeTracker():
             
         self.locked_position = EyeTrackerUtils.get_darkest_area_optimised(frame)
         self.is_position_locked = True
+        self.gaze_state.reset()
     
     def is_eye_in_position(self):
         """Check if eye is in the calibrated position
@@ -385,6 +422,10 @@ class EyeTracker():
     #Prompts the user to select a video file if the hardcoded path is not found
     #This is just for my debugging convenience :)
     def select_video(self):
+        # Debug only, kept out of the module imports so the app never loads tkinter
+        import tkinter as tk
+        from tkinter import filedialog
+        
         root = tk.Tk()
         root.withdraw()  # Hide the main window
 
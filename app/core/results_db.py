@@ -0,0 +1,516 @@
+"""
+Local SQLite database of test results: patients, sessions, per-point responses.
+
+    patients            one row per patient ID entered before a test
+    sessions            one row per test, with its summary metrics and the full results as JSON
+    responses           one row per point shown: hit, servo angles, reaction time
+    patient_aggregates  cached longitudinal trends of each patient (see longitudinal.py)
+
+The database runs in WAL mode, so the results view can read while a test is being
+written. Writes are queued to a ResultsWriter thread that commits whatever has
+accumulated in one transaction; finishing a test never waits for the disk.
+Session lists are paged by keyset ((started, id) of the last row shown), so every
+page is one index range scan however many sessions are stored.
+
+Triggers bump a patient's revision whenever one of their sessions or responses is
+inserted, changed or deleted. Cached trends are kept with the revision they were
+computed at, so they are recomputed only after the patient's sessions changed.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+
+from app.core.longitudinal import compute_trends
+
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS patients (
+    id INTEGER PRIMARY KEY,
+    patient_id TEXT NOT NULL UNIQUE,
+    created TEXT NOT NULL,
+    revision INTEGER NOT NULL DEFAULT 0  -- Bumped by the triggers below
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    patient INTEGER REFERENCES patients(id),
+    started TEXT NOT NULL,              -- ISO 8601, sorts by time
+    eye TEXT,
+    pattern TEXT,
+    points_shown INTEGER NOT NULL,
+    hits INTEGER NOT NULL,
+    clicks INTEGER NOT NULL,
+    false_presses INTEGER NOT NULL,
+    look_aways INTEGER NOT NULL,
+    accuracy REAL NOT NULL,             -- Percent of the points shown that were hit
+    mean_reaction_ms REAL,              -- NULL without device events
+    session_path TEXT,                  -- Session recording, see session_store
+    results TEXT NOT NULL               -- Results document as JSON
+);
+CREATE INDEX IF NOT EXISTS sessions_by_patient ON sessions (patient, started);
+CREATE INDEX IF NOT EXISTS sessions_by_date ON sessions (started);
+CREATE TABLE IF NOT EXISTS responses (
+    session INTEGER NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+    point INTEGER NOT NULL,
+    hit INTEGER NOT NULL,
+    servo1 INTEGER,                     -- NULL for the firmware's built-in points
+    servo2 INTEGER,
+    reaction_ms REAL,
+    PRIMARY KEY (session, point)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS patient_aggregates (
+    patient INTEGER PRIMARY KEY REFERENCES patients(id) ON DELETE CASCADE,
+    revision INTEGER NOT NULL,          -- patients.revision the trends were computed at
+    computed TEXT NOT NULL,
+    trends TEXT NOT NULL                -- compute_trends() result as JSON
+);
+CREATE TRIGGER IF NOT EXISTS sessions_inserted AFTER INSERT ON sessions WHEN NEW.patient IS NOT NULL
+BEGIN
+    UPDATE patients SET revision = revision + 1 WHERE id = NEW.patient;
+END;
+CREATE TRIGGER IF NOT EXISTS sessions_updated AFTER UPDATE ON sessions
+BEGIN
+    UPDATE patients SET revision = revision + 1 WHERE id IN (OLD.patient, NEW.patient);
+END;
+CREATE TRIGGER IF NOT EXISTS sessions_deleted AFTER DELETE ON sessions WHEN OLD.patient IS NOT NULL
+BEGIN
+    UPDATE patients SET revision = revision + 1 WHERE id = OLD.patient;
+END;
+-- Responses are inserted with their session, which already bumped the revision
+CREATE TRIGGER IF NOT EXISTS responses_updated AFTER UPDATE ON responses
+BEGIN
+    UPDATE patients SET revision = revision + 1
+    WHERE id IN (SELECT patient FROM sessions WHERE id IN (OLD.session, NEW.session));
+END;
+CREATE TRIGGER IF NOT EXISTS responses_deleted AFTER DELETE ON responses
+BEGIN
+    UPDATE patients SET revision = revision + 1 WHERE id = (SELECT patient FROM sessions WHERE id = OLD.session);
+END;
+"""
+
+SESSION_COLUMNS = (
+    "s.id, p.patient_id, s.started, s.eye, s.pattern, s.points_shown, s.hits, s.clicks, "
+    "s.false_presses, s.look_aways, s.accuracy, s.mean_reaction_ms, s.session_path"
+)
+
+
+def get_database_path():
+    """Get the default path of the results database"""
+    if os.name == 'nt':  # Windows
+        data_dir = os.path.join(os.environ['APPDATA'], 'EyeTracker')
+    else:  # macOS, Linux
+        data_dir = os.path.join(os.path.expanduser('~'), '.config', 'eyetracker')
+    os.makedirs(data_dir, exist_ok=True)
+    return os.path.join(data_dir, 'results.db')
+
+
+def _connect(path):
+    # Autocommit, the writer opens its transactions explicitly
+    connection = sqlite3.connect(path, timeout=5, isolation_level=None)
+    connection.row_factory = sqlite3.Row
+    connection.execute("PRAGMA foreign_keys = ON")
+    # Commits in WAL mode only append to the log, NORMAL skips the fsync per commit
+    connection.execute("PRAGMA synchronous = NORMAL")
+    return connection
+
+
+def summarise_results(results):
+    """Summary metrics of a results document, as shown in the results view.
+
+    Args:
+        results: Results dict from ArduinoTracker.get_test_results
+
+    Returns:
+        dict: points_shown, hits, clicks, false_presses, look_aways, accuracy, mean_reaction_ms
+    """
+    points_shown = results.get('points_shown', 0)
+    clicks = results.get('clicks', 0)
+    hits = (results.get('click_pattern') or '').count('1')
+    events = results.get('events') or {}
+    reaction = events.get('reaction_ms') or {}
+    return {
+        'points_shown': points_shown,
+        'hits': hits,
+        'clicks': clicks,
+        'false_presses': max(clicks - hits, 0),
+        'look_aways': results.get('out_of_thres_counter', 0),
+        'accuracy': hits / points_shown * 100 if points_shown else 0.0,
+        'mean_reaction_ms': reaction.get('mean'),
+    }
+
+
+class ResultsWriter(threading.Thread):
+    """Applies queued database writes on its own thread, in batches.
+
+    post() only takes a lock and returns a Future. The thread takes everything
+    queued, up to max_batch operations, and runs it in a single transaction, so a
+    burst of writes costs one commit. Each operation runs under its own savepoint,
+    one that fails is rolled back and reported through its Future only.
+    """
+
+    def __init__(self, path, max_batch=256, batch_delay=0.05):
+        """
+        Args:
+            path: Database file
+            max_batch: Maximum number of operations committed together
+            batch_delay: Seconds to wait for more operations once one is queued
+        """
+        super().__init__(name="results-writer", daemon=True)
+        self.path = path
+        self.max_batch = max_batch
+        self.batch_delay = batch_delay
+        self._pending = []  # (operation, future), oldest first
+        self._busy = False
+        self._condition = threading.Condition()
+        self._stop_requested = False
+
+        # Diagnostics
+        self.batches = 0
+        self.written = 0
+        self.failures = 0
+
+    def post(self, operation):
+        """Queue a write, without blocking.
+
+        Args:
+            operation: Called with the writer's connection inside the transaction
+
+        Returns:
+            Future: Resolves to the operation's return value once committed
+        """
+        future = Future()
+        with self._condition:
+            if self._stop_requested:
+                future.set_exception(RuntimeError("Results database is closed"))
+                return future
+            self._pending.append((operation, future))
+            self._condition.notify_all()
+        return future
+
+    def flush(self, timeout=None):
+        """Wait until every queued write is committed.
+
+        Returns:
+            bool: True if the queue drained within the timeout
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._pending and not self._busy, timeout)
+
+    def stop(self, timeout=5):
+        """Commit the queued writes and stop the thread."""
+        with self._condition:
+            self._stop_requested = True
+            self._condition.notify_all()
+        if self is not threading.current_thread() and self.is_alive():
+            self.join(timeout)
+
+    def run(self):
+        connection = _connect(self.path)
+        try:
+            while True:
+                with self._condition:
+                    while not self._pending and not self._stop_requested:
+                        self._condition.wait()
+                    if not self._pending:
+                        return
+                    # Let a burst of writes accumulate into the same transaction
+                    deadline = time.monotonic() + self.batch_delay
+                    while (len(self._pending) < self.max_batch and not self._stop_requested
+                           and time.monotonic() < deadline):
+                        self._condition.wait(deadline - time.monotonic())
+                    batch = self._pending[:self.max_batch]
+                    del self._pending[:self.max_batch]
+                    self._busy = True
+
+                self._write(connection, batch)
+
+                with self._condition:
+                    self._busy = False
+                    self._condition.notify_all()
+        finally:
+            connection.close()
+
+    def _write(self, connection, batch):
+        outcomes = []
+        try:
+            connection.execute("BEGIN")
+            for operation, future in batch:
+                connection.execute("SAVEPOINT operation")
+                try:
+                    outcomes.append((future, operation(connection), None))
+                    connection.execute("RELEASE operation")
+                except Exception as e:
+                    connection.execute("ROLLBACK TO operation")
+                    connection.execute("RELEASE operation")
+                    outcomes.append((future, None, e))
+            connection.execute("COMMIT")
+        except sqlite3.Error as e:
+            # The whole transaction is lost, e.g. the disk is full
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            outcomes = [(future, None, e) for _, future in batch]
+
+        self.batches += 1
+        for future, result, error in outcomes:
+            if error is None:
+                self.written += 1
+                future.set_result(result)
+            else:
+                self.failures += 1
+                print(f"Results database write failed: {error}")
+                future.set_exception(error)
+
+
+class ResultsDatabase:
+    """Patients, sessions and per-point responses of every test.
+
+    Writes go through a ResultsWriter thread and return Futures. Reads run on the
+    caller's thread, each thread gets its own connection, and in WAL mode they see
+    the last committed state without waiting for the writer.
+    """
+
+    def __init__(self, path=None, max_batch=256, batch_delay=0.05):
+        """
+        Args:
+            path: Database file, None for get_database_path()
+            max_batch: Maximum number of writes committed in one transaction
+            batch_delay: Seconds the writer waits for more writes before committing
+        """
+        self.path = path or get_database_path()
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
+        connection = self._connection()
+        # WAL mode is persistent, it is kept by the database file
+        connection.execute("PRAGMA journal_mode = WAL")
+        version = connection.execute("PRAGMA user_version").fetchone()[0]
+        if version > SCHEMA_VERSION:
+            raise sqlite3.DatabaseError(
+                f"{self.path} has schema version {version}, newer than this version of the application"
+            )
+        if version == 1:
+            connection.execute("ALTER TABLE patients ADD COLUMN revision INTEGER NOT NULL DEFAULT 0")
+        connection.executescript(SCHEMA)
+        connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+        self.writer = ResultsWriter(self.path, max_batch, batch_delay)
+        self.writer.start()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = _connect(self.path)
+            self._local.connection = connection
+            with self._connections_lock:
+                self._connections.append(connection)
+        return connection
+
+    def record_session(self, results, patient_id=None, started=None, eye=None, pattern=None, plan=None,
+                       reactions=None):
+        """Queue a finished test for writing, without blocking.
+
+        Args:
+            results: Results dict from ArduinoTracker.get_test_results
+            patient_id: Patient the test was run on, None if not entered
+            started: datetime of the test start, None for now
+            eye: Eye tested, 'left' or 'right'
+            pattern: Test pattern, e.g. '24-2', or 'builtin'
+            plan: StimulusPlan that was run, for the servo angles of each point
+            reactions: (points, reaction times in ms), see EventLog.point_reaction_times
+
+        Returns:
+            Future: Resolves to the session's row ID once committed
+        """
+        # Everything is copied here, the writer thread never touches the caller's objects
+        summary = summarise_results(results)
+        started = (started or datetime.now()).isoformat(timespec='seconds')
+        document = json.dumps(results, default=str)
+        reaction_by_point = {int(point): float(ms) for point, ms in zip(*(reactions or ((), ())))}
+        servos = plan.points[['servo1', 'servo2']].tolist() if plan is not None else []
+        responses = [
+            (
+                point,
+                int(click == '1'),
+                *(servos[point] if point < len(servos) else (None, None)),
+                reaction_by_point.get(point),
+            )
+            for point, click in enumerate(results.get('click_pattern') or '')
+        ]
+
+        def write(connection):
+            patient = None
+            if patient_id:
+                connection.execute(
+                    "INSERT OR IGNORE INTO patients (patient_id, created) VALUES (?, ?)",
+                    (patient_id, started),
+                )
+                patient = connection.execute(
+                    "SELECT id FROM patients WHERE patient_id = ?", (patient_id,)
+                ).fetchone()[0]
+            cursor = connection.execute(
+                "INSERT INTO sessions (patient, started, eye, pattern, points_shown, hits, clicks, "
+                "false_presses, look_aways, accuracy, mean_reaction_ms, session_path, results) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    patient, started, eye, pattern,
+                    summary['points_shown'], summary['hits'], summary['clicks'], summary['false_presses'],
+                    summary['look_aways'], summary['accuracy'], summary['mean_reaction_ms'],
+                    results.get('session'), document,
+                ),
+            )
+            session = cursor.lastrowid
+            connection.executemany(
+                "INSERT INTO responses (session, point, hit, servo1, servo2, reaction_ms) VALUES (?, ?, ?, ?, ?, ?)",
+                [(session, *response) for response in responses],
+            )
+            return session
+
+        return self.writer.post(write)
+
+    def page_sessions(self, patient_id=None, since=None, until=None, page_size=50, cursor=None):
+        """One page of sessions, newest first.
+
+        Args:
+            patient_id: Only the sessions of this patient, None for all
+            since: Only sessions started at or after this datetime
+            until: Only sessions started before this datetime
+            page_size: Maximum number of sessions returned
+            cursor: next_cursor of the previous page, None for the first page
+
+        Returns:
+            tuple: (list of session dicts, next_cursor or None on the last page)
+        """
+        conditions = []
+        parameters = []
+        if patient_id:
+            conditions.append("p.patient_id = ?")
+            parameters.append(patient_id)
+        if since is not None:
+            conditions.append("s.started >= ?")
+            parameters.append(since.isoformat(timespec='seconds'))
+        if until is not None:
+            conditions.append("s.started < ?")
+            parameters.append(until.isoformat(timespec='seconds'))
+        if cursor is not None:
+            conditions.append("(s.started, s.id) < (?, ?)")
+            parameters.extend(cursor)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        rows = self._connection().execute(
+            f"SELECT {SESSION_COLUMNS} FROM sessions s LEFT JOIN patients p ON p.id = s.patient "
+            f"{where} ORDER BY s.started DESC, s.id DESC LIMIT ?",
+            (*parameters, page_size + 1),
+        ).fetchall()
+        sessions = [dict(row) for row in rows[:page_size]]
+        next_cursor = None
+        if len(rows) > page_size:
+            next_cursor = (sessions[-1]['started'], sessions[-1]['id'])
+        return sessions, next_cursor
+
+    def count_sessions(self, patient_id=None):
+        """Number of sessions, of one patient or of all."""
+        if patient_id:
+            row = self._connection().execute(
+                "SELECT COUNT(*) FROM sessions s JOIN patients p ON p.id = s.patient WHERE p.patient_id = ?",
+                (patient_id,),
+            ).fetchone()
+        else:
+            row = self._connection().execute("SELECT COUNT(*) FROM sessions").fetchone()
+        return row[0]
+
+    def get_session(self, session_id):
+        """A session with its full results document, None if there is no such session."""
+        row = self._connection().execute(
+            f"SELECT {SESSION_COLUMNS}, s.results FROM sessions s LEFT JOIN patients p ON p.id = s.patient "
+            "WHERE s.id = ?",
+            (session_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        session = dict(row)
+        session['results'] = json.loads(session['results'])
+        return session
+
+    def session_responses(self, session_id):
+        """Per-point responses of a session, in point order."""
+        rows = self._connection().execute(
+            "SELECT point, hit, servo1, servo2, reaction_ms FROM responses WHERE session = ? ORDER BY point",
+            (session_id,),
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def patient_trends(self, patient_id):
+        """Longitudinal trends of a patient's tests, see longitudinal.compute_trends.
+
+        Served from the cache unless the patient's sessions changed since it was
+        computed, the recomputed trends are written back through the writer thread.
+
+        Returns:
+            dict: Trends with 'patient_id', 'revision' and 'cached', None for an unknown patient
+        """
+        connection = self._connection()
+        row = connection.execute(
+            "SELECT p.id, p.revision, a.revision AS cached_revision, a.trends FROM patients p "
+            "LEFT JOIN patient_aggregates a ON a.patient = p.id WHERE p.patient_id = ?",
+            (patient_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        if row['cached_revision'] == row['revision']:
+            trends = json.loads(row['trends'])
+            trends['cached'] = True
+            return trends
+
+        patient, revision = row['id'], row['revision']
+        sessions = [dict(session) for session in connection.execute(
+            "SELECT id, started, pattern, eye, points_shown, hits, accuracy, mean_reaction_ms, "
+            "false_presses, look_aways FROM sessions WHERE patient = ? ORDER BY started",
+            (patient,),
+        )]
+        responses = [dict(response) for response in connection.execute(
+            "SELECT r.session, r.point, r.hit, r.servo1, r.servo2, r.reaction_ms FROM responses r "
+            "JOIN sessions s ON s.id = r.session WHERE s.patient = ?",
+            (patient,),
+        )]
+        trends = compute_trends(sessions, responses)
+        trends['patient_id'] = patient_id
+        trends['revision'] = revision
+        document = json.dumps(trends)
+
+        def write(connection):
+            # Sessions may have changed since, the revision keeps such trends stale
+            connection.execute(
+                "INSERT OR REPLACE INTO patient_aggregates (patient, revision, computed, trends) VALUES (?, ?, ?, ?)",
+                (patient, revision, datetime.now().isoformat(timespec='seconds'), document),
+            )
+        self.writer.post(write)
+
+        trends['cached'] = False
+        return trends
+
+    def patients(self):
+        """All patient IDs, sorted."""
+        rows = self._connection().execute("SELECT patient_id FROM patients ORDER BY patient_id").fetchall()
+        return [row[0] for row in rows]
+
+    def flush(self, timeout=None):
+        """Wait until the queued writes are committed."""
+        return self.writer.flush(timeout)
+
+    def close(self):
+        """Commit the queued writes and close the database."""
+        self.writer.stop()
+        with self._connections_lock:
+            for connection in self._connections:
+                try:
+                    connection.close()
+                except sqlite3.ProgrammingError:
+                    # Connections of other threads can only be closed there
+                    pass
+            self._connections.clear()
+        self._local = threading.local()
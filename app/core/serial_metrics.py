@@ -0,0 +1,215 @@
+"""
+Latency instrumentation for the Arduino serial link.
+
+Every command written is timestamped. Commands the firmware acknowledges (the
+threshold commands) wait in a FIFO of outstanding commands until their ack
+arrives, and request/response commands (ping, start test, ...) are timed by the
+driver when their response is matched. Round-trip times, the time spent blocked
+in write + flush and the outstanding-command depth are kept in fixed-bucket
+histograms, so recording is O(1) and safe to do from the reader thread.
+"""
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+class LatencyHistogram:
+    """Histogram of durations in milliseconds with log-spaced buckets.
+
+    Buckets span min_ms to max_ms, values outside are counted in the first or
+    last bucket. Exact min, max and mean are tracked alongside.
+    """
+
+    def __init__(self, min_ms=0.05, max_ms=10000.0, buckets_per_decade=20):
+        decades = np.log10(max_ms) - np.log10(min_ms)
+        self.edges = np.logspace(np.log10(min_ms), np.log10(max_ms), int(decades * buckets_per_decade) + 1)
+        self.counts = np.zeros(len(self.edges) + 1, dtype=np.int64)
+        self.reset()
+
+    def reset(self):
+        self.counts[:] = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def record(self, value_ms):
+        """Add one duration in milliseconds."""
+        self.counts[np.searchsorted(self.edges, value_ms)] += 1
+        self.count += 1
+        self.total += value_ms
+        self.min = value_ms if self.min is None else min(self.min, value_ms)
+        self.max = value_ms if self.max is None else max(self.max, value_ms)
+
+    def percentile(self, q):
+        """Estimate the q-th percentile (0-100) from the buckets.
+
+        Returns:
+            float: Upper edge of the bucket holding the percentile, None if empty
+        """
+        if not self.count:
+            return None
+        index = int(np.searchsorted(np.cumsum(self.counts), q / 100 * self.count))
+        upper = self.edges[min(index, len(self.edges) - 1)]
+        return float(min(upper, self.max))
+
+    def summary(self):
+        """Return count, mean, min, p50, p95, p99 and max."""
+        if not self.count:
+            return {'count': 0}
+        return {
+            'count': self.count,
+            'mean': self.total / self.count,
+            'min': self.min,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'max': self.max,
+        }
+
+
+class SerialMetrics:
+    """Round-trip, write-blocking and queue-depth statistics of a serial link."""
+
+    def __init__(self, ack_timeout=1.0, clock=time.perf_counter):
+        """
+        Args:
+            ack_timeout: Seconds after which an unacknowledged command is counted as lost
+            clock: Monotonic clock in seconds
+        """
+        self.ack_timeout = ack_timeout
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._outstanding = deque()  # (command, sent time) awaiting an ack, oldest first
+
+        self.rtt = {}  # command name -> LatencyHistogram
+        self.write_block = LatencyHistogram()
+        self.commands_sent = 0
+        self.acks_received = 0
+        self.lost = 0
+        self.unmatched_acks = 0
+        self.max_outstanding = 0
+        self.last_rtt_ms = None
+
+    def reset(self):
+        with self._lock:
+            self._outstanding.clear()
+            self.rtt = {}
+            self.write_block.reset()
+            self.commands_sent = self.acks_received = self.lost = self.unmatched_acks = 0
+            self.max_outstanding = 0
+            self.last_rtt_ms = None
+
+    @property
+    def outstanding(self):
+        """Number of commands waiting for an acknowledgement."""
+        return len(self._outstanding)
+
+    def _record_rtt(self, name, value_ms):
+        if name not in self.rtt:
+            self.rtt[name] = LatencyHistogram()
+        self.rtt[name].record(value_ms)
+        self.last_rtt_ms = value_ms
+
+    def _expire(self, now):
+        while self._outstanding and now - self._outstanding[0][1] > self.ack_timeout:
+            self._outstanding.popleft()
+            self.lost += 1
+
+    def command_sent(self, name, sent_at, write_seconds, expects_ack=False):
+        """Record a command written to the port.
+
+        Args:
+            name: Command name the round trip is recorded under
+            sent_at: Clock time the write started
+            write_seconds: Time spent blocked in write and flush
+            expects_ack: If True, the command waits for an ack in the outstanding FIFO
+        """
+        with self._lock:
+            self.commands_sent += 1
+            self.write_block.record(write_seconds * 1000)
+            self._expire(sent_at)
+            if expects_ack:
+                self._outstanding.append((name, sent_at))
+                self.max_outstanding = max(self.max_outstanding, len(self._outstanding))
+
+    def ack_received(self, name=None, received_at=None):
+        """Match an acknowledgement to the oldest outstanding command.
+
+        Args:
+            name: Acknowledged command if the ack names it, outstanding commands
+                  before it were not acknowledged and are counted as lost
+            received_at: Clock time the ack was received, defaults to now
+        """
+        received_at = self.clock() if received_at is None else received_at
+        with self._lock:
+            self.acks_received += 1
+            self._expire(received_at)
+            while self._outstanding:
+                sent_name, sent_at = self._outstanding.popleft()
+                if name is None or sent_name == name:
+                    self._record_rtt(sent_name, (received_at - sent_at) * 1000)
+                    return
+                self.lost += 1
+            self.unmatched_acks += 1
+
+    def response_received(self, name, sent_at, received_at=None):
+        """Record the round trip of a command answered with a response."""
+        received_at = self.clock() if received_at is None else received_at
+        with self._lock:
+            self._record_rtt(name, (received_at - sent_at) * 1000)
+
+    def summary(self):
+        """Return a dict of all statistics, safe to call from any thread."""
+        with self._lock:
+            self._expire(self.clock())
+            return {
+                'rtt': {name: histogram.summary() for name, histogram in self.rtt.items()},
+                'write_block': self.write_block.summary(),
+                'commands_sent': self.commands_sent,
+                'acks_received': self.acks_received,
+                'lost': self.lost,
+                'unmatched_acks': self.unmatched_acks,
+                'outstanding': len(self._outstanding),
+                'max_outstanding': self.max_outstanding,
+                'last_rtt_ms': self.last_rtt_ms,
+            }
+
+    def format_summary(self, name=None):
+        """One-line summary for the GUI and the log.
+
+        Args:
+            name: Command to report round trips for, None for all commands together
+        """
+        summary = self.summary()
+        if name is None:
+            rtt = self._combined_rtt()
+        else:
+            rtt = summary['rtt'].get(name, {'count': 0})
+
+        if rtt['count']:
+            text = f"RTT p50 {rtt['p50']:.1f} ms, p95 {rtt['p95']:.1f} ms, max {rtt['max']:.1f} ms"
+        else:
+            text = "RTT n/a"
+
+        write_block = summary['write_block']
+        if write_block['count']:
+            text += f" | write p95 {write_block['p95']:.2f} ms"
+        text += f" | outstanding {summary['outstanding']} (max {summary['max_outstanding']})"
+        if summary['lost']:
+            text += f" | {summary['lost']} unacked"
+        return text
+
+    def _combined_rtt(self):
+        with self._lock:
+            combined = LatencyHistogram()
+            for histogram in self.rtt.values():
+                combined.counts += histogram.counts
+                combined.count += histogram.count
+                combined.total += histogram.total
+                if histogram.count:
+                    combined.min = histogram.min if combined.min is None else min(combined.min, histogram.min)
+                    combined.max = histogram.max if combined.max is None else max(combined.max, histogram.max)
+            return combined.summary()
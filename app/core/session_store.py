@@ -0,0 +1,581 @@
+"""
+On-disk store of a test session: per-frame observations and device events.
+
+A session is a directory holding one file per stream and a small JSON index:
+
+    session.json       start time, clock origin, record counts, metadata and results
+    observations.bin   OBSERVATION_DTYPE records, one per processed frame (per eye)
+    events.bin         EventLog.DTYPE records, one per device event
+    frames.bin         FRAME_DTYPE records, where each camera frame is in frames.jpg
+    frames.jpg         Camera frames, each JPEG encoded on its own, when frames are recorded
+
+Each stream file starts with a HEADER_SIZE byte header (magic, then the record
+dtype as JSON, padded with spaces) followed by fixed-width little-endian records.
+Files are only ever appended to, so writing a frame costs one buffered write, and
+a crashed session is still readable: the record count is taken from the file size.
+Readers memory-map the records and slice them by time without parsing anything.
+Every frame is a keyframe, so replaying from any point decodes a single JPEG.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+from app.core.event_log import EventLog
+
+MAGIC = b'ETSTORE1'
+HEADER_SIZE = 1024
+INDEX_FILE = 'session.json'
+FRAME_DATA_FILE = 'frames.jpg'
+
+# Flags of observation records
+FLAG_PUPIL = 0x01      # A pupil center was found
+FLAG_ELLIPSE = 0x02    # An ellipse was fitted
+FLAG_LOCKED = 0x04     # The gaze position was calibrated
+FLAG_WITHIN = 0x08     # The pupil was within the threshold
+
+OBSERVATION_DTYPE = np.dtype([
+    ('host_time', '<f8'),  # time.perf_counter() of the frame, the clock device events are mapped onto
+    ('eye', '<u1'),        # 0, or the camera slot in binocular mode
+    ('flags', '<u1'),
+    ('pupil_x', '<f4'),    # Frame pixels, NaN without a pupil
+    ('pupil_y', '<f4'),
+    ('ellipse_x', '<f4'),  # Fitted ellipse, NaN without one
+    ('ellipse_y', '<f4'),
+    ('ellipse_w', '<f4'),
+    ('ellipse_h', '<f4'),
+    ('ellipse_angle', '<f4'),
+    ('distance', '<f4'),   # Pupil to calibrated position, pixels
+    ('threshold', '<f4'),
+    ('locked_x', '<f4'),   # Calibrated position, NaN before calibration
+    ('locked_y', '<f4'),
+])
+
+FRAME_DTYPE = np.dtype([
+    ('host_time', '<f8'),  # Timestamp of the frame's observation
+    ('offset', '<u8'),     # Position of the JPEG in frames.jpg
+    ('size', '<u4'),
+    ('width', '<u2'),
+    ('height', '<u2'),
+    ('eyes', '<u1'),       # Number of eyes side by side in the frame
+])
+
+STREAMS = {
+    'observations': OBSERVATION_DTYPE,
+    'events': EventLog.DTYPE,
+    'frames': FRAME_DTYPE,
+}
+
+
+def get_sessions_dir():
+    """Get the default directory sessions are stored in"""
+    if os.name == 'nt':  # Windows
+        sessions_dir = os.path.join(os.environ['APPDATA'], 'EyeTracker', 'sessions')
+    else:  # macOS, Linux
+        sessions_dir = os.path.join(os.path.expanduser('~'), '.config', 'eyetracker', 'sessions')
+    os.makedirs(sessions_dir, exist_ok=True)
+    return sessions_dir
+
+
+def list_sessions(root=None):
+    """Session directories under root, oldest first.
+
+    Args:
+        root: Directory holding the sessions, None for get_sessions_dir()
+
+    Returns:
+        list: Paths of the session directories
+    """
+    root = root or get_sessions_dir()
+    if not os.path.isdir(root):
+        return []
+    return sorted(
+        os.path.join(root, name) for name in os.listdir(root)
+        if os.path.isfile(os.path.join(root, name, INDEX_FILE))
+    )
+
+
+def _stream_header(name, dtype):
+    description = json.dumps({'stream': name, 'descr': np.lib.format.dtype_to_descr(dtype)}).encode()
+    if len(MAGIC) + len(description) > HEADER_SIZE:
+        raise ValueError(f"Record layout of {name} does not fit the header")
+    return (MAGIC + description).ljust(HEADER_SIZE, b' ')
+
+
+def _read_stream_header(path):
+    with open(path, 'rb') as file:
+        header = file.read(HEADER_SIZE)
+    if len(header) < HEADER_SIZE or not header.startswith(MAGIC):
+        raise ValueError(f"{path} is not a session stream")
+    description = json.loads(header[len(MAGIC):].decode().strip())
+    return np.lib.format.descr_to_dtype(description['descr'])
+
+
+def _write_json(path, document):
+    """Replace a JSON file atomically, a crash leaves the old or the new version."""
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as file:
+        json.dump(document, file, indent=2, default=str)
+    os.replace(temporary, path)
+
+
+def record_observation(record, frame_size=None):
+    """Observation dict of a stored observation record, as painted by paint_tracking_overlay.
+
+    Args:
+        record: OBSERVATION_DTYPE record
+        frame_size: (width, height) of the frame the observation is in
+    """
+    flags = int(record['flags'])
+    names = record.dtype.names
+    # Sessions recorded before the calibrated position was stored do not have it
+    locked_position = None
+    if flags & FLAG_LOCKED and 'locked_x' in names and not np.isnan(record['locked_x']):
+        locked_position = (float(record['locked_x']), float(record['locked_y']))
+    ellipse = None
+    if flags & FLAG_ELLIPSE:
+        ellipse = (
+            (float(record['ellipse_x']), float(record['ellipse_y'])),
+            (float(record['ellipse_w']), float(record['ellipse_h'])),
+            float(record['ellipse_angle']),
+        )
+    threshold = float(record['threshold'])
+    return {
+        'timestamp': float(record['host_time']),
+        'frame_size': frame_size,
+        'pupil_center': (float(record['pupil_x']), float(record['pupil_y'])) if flags & FLAG_PUPIL else None,
+        'ellipse': ellipse,
+        'is_position_locked': bool(flags & FLAG_LOCKED),
+        'locked_position': locked_position,
+        'lockpos_threshold': threshold,
+        'reenter_threshold': threshold,
+        'distance': None if np.isnan(record['distance']) else float(record['distance']),
+        'within_threshold': bool(flags & FLAG_WITHIN),
+    }
+
+
+class TimeIndex:
+    """Finds the last record at or before a time in constant time.
+
+    The time range is cut into buckets, each holding the index of the last record
+    before the bucket starts. A lookup reads one bucket and steps over the records
+    inside it, at most the number of records per bucket whatever the length of
+    the recording. Times must be in increasing order.
+    """
+
+    def __init__(self, times, bucket=0.1):
+        """
+        Args:
+            times: Record times in seconds, in increasing order
+            bucket: Bucket width in seconds
+        """
+        self.times = np.asarray(times, dtype=np.float64)
+        self.bucket = bucket
+        self.start = float(self.times[0]) if len(self.times) else 0.0
+        count = int((self.times[-1] - self.start) / bucket) + 1 if len(self.times) else 0
+        edges = self.start + np.arange(count) * bucket
+        self.first = np.searchsorted(self.times, edges, side='right') - 1
+
+    def __len__(self):
+        return len(self.times)
+
+    def at(self, time):
+        """Index of the last record at or before time, -1 if there is none."""
+        if not len(self.times) or time < self.start:
+            return -1
+        index = int(self.first[min(int((time - self.start) / self.bucket), len(self.first) - 1)])
+        while index + 1 < len(self.times) and self.times[index + 1] <= time:
+            index += 1
+        return index
+
+
+class FrameEncoder(threading.Thread):
+    """JPEG encodes camera frames for a SessionWriter on its own thread.
+
+    post() copies the frame and returns, encoding never delays the frame loop. If
+    encoding falls behind, frames beyond max_pending are dropped and counted.
+    """
+
+    def __init__(self, writer, quality=75, max_pending=8):
+        """
+        Args:
+            writer: SessionWriter the encoded frames are appended to
+            quality: JPEG quality, 0 to 100
+            max_pending: Maximum number of frames waiting to be encoded
+        """
+        super().__init__(name="session-frames", daemon=True)
+        self.writer = writer
+        self.parameters = [cv2.IMWRITE_JPEG_QUALITY, int(quality)]
+        self.max_pending = max_pending
+        self._pending = deque()
+        self._condition = threading.Condition()
+        self._stop_requested = False
+        self.dropped = 0
+
+    def post(self, frame, host_time, eyes=1):
+        with self._condition:
+            if self._stop_requested:
+                return
+            if len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                return
+            # The tracker may reuse the frame buffer
+            self._pending.append((frame.copy(), host_time, eyes))
+            self._condition.notify()
+
+    def stop(self, timeout=5):
+        """Encode the frames still queued, then stop the thread."""
+        with self._condition:
+            self._stop_requested = True
+            self._condition.notify()
+        if self is not threading.current_thread() and self.is_alive():
+            self.join(timeout)
+
+    def run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._stop_requested:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+                frame, host_time, eyes = self._pending.popleft()
+
+            ok, encoded = cv2.imencode('.jpg', frame, self.parameters)
+            if ok:
+                self.writer._append_frame(encoded.tobytes(), frame.shape[1], frame.shape[0], host_time, eyes)
+            else:
+                self.dropped += 1
+
+
+class SessionWriter:
+    """Appends the observations and events of one test to a new session directory.
+
+    Appending packs the values into a preallocated record and writes its bytes to a
+    buffered file, O(1) per frame. Observations come from the frame loop and events
+    from the serial reader thread, each stream has its own lock.
+    """
+
+    def __init__(self, root=None, metadata=None, clock=time.perf_counter, frame_quality=None, frame_rate=30):
+        """
+        Args:
+            root: Directory to create the session in, None for get_sessions_dir()
+            metadata: JSON-serialisable description of the session (settings, device, ...)
+            clock: Clock observation and event times are on
+            frame_quality: JPEG quality camera frames are recorded at, None to not record frames
+            frame_rate: Most frames recorded per second, the observations of every frame are kept
+        """
+        root = root or get_sessions_dir()
+        started = datetime.now()
+        self.path = os.path.join(root, started.strftime('%Y%m%d-%H%M%S-%f'))
+        os.makedirs(self.path)
+
+        self.index = {
+            'version': 1,
+            'started': started.isoformat(),
+            'origin': clock(),  # Clock time of the session start, times are relative to it when read
+            'streams': {name: {'file': f'{name}.bin', 'records': 0} for name in STREAMS},
+            'metadata': metadata or {},
+            'results': None,
+            'closed': None,
+        }
+        _write_json(os.path.join(self.path, INDEX_FILE), self.index)
+
+        self._files = {}
+        self._records = {}
+        self._locks = {}
+        for name, dtype in STREAMS.items():
+            file = open(os.path.join(self.path, f'{name}.bin'), 'ab')
+            file.write(_stream_header(name, dtype))
+            self._files[name] = file
+            self._records[name] = np.zeros(1, dtype=dtype)
+            self._locks[name] = threading.Lock()
+        self.counts = {name: 0 for name in STREAMS}
+
+        self._frame_data = None
+        self._frame_offset = 0
+        self._frame_interval = 1 / frame_rate
+        self._last_frame_time = None
+        self.encoder = None
+        if frame_quality is not None:
+            self._frame_data = open(os.path.join(self.path, FRAME_DATA_FILE), 'ab')
+            self.encoder = FrameEncoder(self, frame_quality)
+            self.encoder.start()
+
+    def append_observation(self, observation, eye=0):
+        """Store the observation of one frame (see EyeTracker._build_observation).
+
+        Args:
+            observation: Observation dict, ignored if None or without a timestamp
+            eye: Eye index in binocular mode
+        """
+        if not observation or observation.get('timestamp') is None:
+            return
+
+        with self._locks['observations']:
+            record = self._records['observations']
+            record['host_time'] = observation['timestamp']
+            record['eye'] = eye
+            pupil = observation.get('pupil_center')
+            ellipse = observation.get('ellipse')
+            record['flags'] = (
+                (FLAG_PUPIL if pupil is not None else 0)
+                | (FLAG_ELLIPSE if ellipse is not None else 0)
+                | (FLAG_LOCKED if observation.get('is_position_locked') else 0)
+                | (FLAG_WITHIN if observation.get('within_threshold') else 0)
+            )
+            record['pupil_x'], record['pupil_y'] = pupil if pupil is not None else (np.nan, np.nan)
+            if ellipse is not None:
+                (record['ellipse_x'], record['ellipse_y']), (record['ellipse_w'], record['ellipse_h']), \
+                    record['ellipse_angle'] = ellipse
+            else:
+                for name in ('ellipse_x', 'ellipse_y', 'ellipse_w', 'ellipse_h', 'ellipse_angle'):
+                    record[name] = np.nan
+            distance = observation.get('distance')
+            record['distance'] = np.nan if distance is None else distance
+            threshold = observation.get('lockpos_threshold')
+            record['threshold'] = np.nan if threshold is None else threshold
+            locked = observation.get('locked_position') if observation.get('is_position_locked') else None
+            record['locked_x'], record['locked_y'] = locked if locked is not None else (np.nan, np.nan)
+            self._append('observations', record)
+
+    def append_frame(self, frame, host_time, eyes=1):
+        """Queue a camera frame for recording, ignored unless frames are recorded.
+
+        Args:
+            frame: Frame the observations of host_time are in (numpy array)
+            host_time: Timestamp of the frame's observation
+            eyes: Number of eyes side by side in the frame
+        """
+        if self.encoder is None or frame is None or host_time is None:
+            return
+        if self._last_frame_time is not None and host_time - self._last_frame_time < self._frame_interval:
+            return
+        self._last_frame_time = host_time
+        self.encoder.post(frame, host_time, eyes)
+
+    def _append_frame(self, data, width, height, host_time, eyes):
+        """Store an encoded frame, called on the encoder thread."""
+        with self._locks['frames']:
+            if self._frame_data is None:
+                return
+            self._frame_data.write(data)
+            self._records['frames'][0] = (host_time, self._frame_offset, len(data), width, height, eyes)
+            self._frame_offset += len(data)
+            self._append('frames', self._records['frames'])
+
+    def append_event(self, record, host_time=None):
+        """Store a device event.
+
+        Args:
+            record: Event record (binary_codec.EVENT_DTYPE)
+            host_time: Host clock time of the event, None if the clock is not synced
+        """
+        with self._locks['events']:
+            stored = self._records['events']
+            stored[0] = (
+                record['device_ms'], record['event_type'], record['point'], record['arg'],
+                np.nan if host_time is None else host_time,
+            )
+            self._append('events', stored)
+
+    def on_message(self, message):
+        """Subscriber for ArduinoTracker.subscribe, stores the device events."""
+        if isinstance(message, dict) and 'event' in message:
+            self.append_event(message['event'], message.get('host_time'))
+
+    def _append(self, name, record):
+        file = self._files.get(name)
+        if file is None:
+            return
+        file.write(record.tobytes())
+        self.counts[name] += 1
+
+    def close(self, results=None):
+        """Flush the streams and complete the index.
+
+        Args:
+            results: Test results to keep with the session
+        """
+        if self.encoder is not None:
+            self.encoder.stop()
+            self.index['frames_dropped'] = self.encoder.dropped
+        if self._frame_data is not None:
+            with self._locks['frames']:
+                self._frame_data.close()
+                self._frame_data = None
+        for name, file in list(self._files.items()):
+            with self._locks[name]:
+                file.close()
+                self._files.pop(name)
+        for name, count in self.counts.items():
+            self.index['streams'][name]['records'] = count
+        self.index['results'] = results
+        self.index['closed'] = datetime.now().isoformat()
+        _write_json(os.path.join(self.path, INDEX_FILE), self.index)
+
+
+class SessionReader:
+    """Memory-mapped read access to a stored session.
+
+    Streams are mapped read-only and returned as NumPy structured arrays, no record is
+    parsed or copied until used. Times passed to the slicing methods are seconds since
+    the session started.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path: Session directory created by SessionWriter
+        """
+        self.path = path
+        with open(os.path.join(path, INDEX_FILE)) as file:
+            self.index = json.load(file)
+        self.origin = self.index['origin']
+        self._streams = {}
+        self._time_indexes = {}
+        self._frames = None
+        self._frame_data = None
+
+    @property
+    def metadata(self):
+        return self.index['metadata']
+
+    @property
+    def results(self):
+        return self.index['results']
+
+    def stream(self, name):
+        """All records of a stream, memory-mapped.
+
+        The count comes from the file size, so records appended until a crash are
+        included and a partly written last record is not.
+        """
+        if name not in self.index['streams']:
+            # Recorded before the stream existed
+            return np.empty(0, dtype=STREAMS[name])
+        if name not in self._streams:
+            path = os.path.join(self.path, self.index['streams'][name]['file'])
+            dtype = _read_stream_header(path)
+            count = (os.path.getsize(path) - HEADER_SIZE) // dtype.itemsize
+            if count > 0:
+                self._streams[name] = np.memmap(path, dtype=dtype, mode='r', offset=HEADER_SIZE, shape=(count,))
+            else:
+                self._streams[name] = np.empty(0, dtype=dtype)
+        return self._streams[name]
+
+    @property
+    def observations(self):
+        return self.stream('observations')
+
+    @property
+    def events(self):
+        return self.stream('events')
+
+    @property
+    def frames(self):
+        """Frame records, only those whose JPEG was completely written."""
+        if self._frames is None:
+            records = self.stream('frames')
+            data_path = os.path.join(self.path, FRAME_DATA_FILE)
+            data_size = os.path.getsize(data_path) if os.path.exists(data_path) else 0
+            count = int(np.searchsorted(records['offset'] + records['size'], data_size, side='right'))
+            self._frames = records[:count]
+        return self._frames
+
+    @property
+    def has_frames(self):
+        return len(self.frames) > 0
+
+    def frame_image(self, index):
+        """Decode a recorded frame.
+
+        Args:
+            index: Index of the frame record
+
+        Returns:
+            numpy array: The frame, as it was shown, or None if it cannot be decoded
+        """
+        if self._frame_data is None:
+            self._frame_data = np.memmap(os.path.join(self.path, FRAME_DATA_FILE), dtype=np.uint8, mode='r')
+        record = self.frames[index]
+        start = int(record['offset'])
+        return cv2.imdecode(self._frame_data[start:start + int(record['size'])], cv2.IMREAD_UNCHANGED)
+
+    def frame_at(self, time):
+        """Index of the frame shown at time seconds since the session start, -1 before the first.
+
+        Constant time, see TimeIndex.
+        """
+        if 'frames' not in self._time_indexes:
+            self._time_indexes['frames'] = TimeIndex(self.frames['host_time'])
+        return self._time_indexes['frames'].at(self.origin + time)
+
+    def observation_at(self, time, eye=0):
+        """Latest observation of an eye at or before time seconds since the session start.
+
+        Constant time, see TimeIndex.
+
+        Returns:
+            OBSERVATION_DTYPE record, or None before the eye's first observation
+        """
+        key = ('observations', eye)
+        if key not in self._time_indexes:
+            records = self.observations
+            positions = np.flatnonzero(records['eye'] == eye)
+            self._time_indexes[key] = (TimeIndex(records['host_time'][positions]), positions)
+        time_index, positions = self._time_indexes[key]
+        index = time_index.at(self.origin + time)
+        return self.observations[positions[index]] if index >= 0 else None
+
+    @property
+    def duration(self):
+        """Seconds from the session start to the last observation or event."""
+        ends = [self.observations['host_time'][-1]] if len(self.observations) else []
+        event_times = self.events['host_time']
+        if len(event_times) and not np.isnan(event_times).all():
+            ends.append(np.nanmax(event_times))
+        return float(max(ends) - self.origin) if ends else 0.0
+
+    def observations_between(self, start=None, end=None):
+        """Observations in [start, end) seconds since the session start.
+
+        Frames are stored in time order, the range is found by binary search on the
+        mapped time column, so only the pages of the returned records are read.
+        """
+        records = self.observations
+        times = records['host_time']
+        first = 0 if start is None else int(np.searchsorted(times, self.origin + start, side='left'))
+        last = len(records) if end is None else int(np.searchsorted(times, self.origin + end, side='left'))
+        return records[first:last]
+
+    def events_between(self, start=None, end=None):
+        """Events in [start, end) seconds since the session start.
+
+        Events without a host time (clock not synced) are never in a range.
+        """
+        records = self.events
+        times = records['host_time'] - self.origin
+        inside = ~np.isnan(times)
+        if start is not None:
+            inside &= times >= start
+        if end is not None:
+            inside &= times < end
+        return records[inside]
+
+    def close(self):
+        """Unmap the streams."""
+        self._streams.clear()
+        self._time_indexes.clear()
+        self._frames = None
+        self._frame_data = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
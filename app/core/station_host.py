@@ -0,0 +1,300 @@
+import os
+import time
+import queue
+import multiprocessing
+
+import cv2
+
+from app.core.arduino_tracker import ArduinoTracker
+from app.core.pupil_tracker import EyeTracker
+
+# Commands the host can send to a station
+STATION_COMMANDS = ('lock_position', 'set_threshold', 'set_confidence_margin', 'start_test', 'stop_test')
+
+
+def _collect_results(arduino):
+    """Results and per-point reaction times of the test that just finished on a station"""
+    results = arduino.get_test_results()
+    reactions = arduino.protocol.events.point_reaction_times() if results else None
+    return results, reactions
+
+
+def _publish(status_queue, snapshot):
+    """Publish a station snapshot without blocking on a slow host.
+
+    When the queue is full the oldest unread snapshot is dropped, so the host always
+    gets the newest preview and test status.
+    """
+    try:
+        status_queue.put_nowait(snapshot)
+        return
+    except queue.Full:
+        pass
+    try:
+        status_queue.get_nowait()
+    except queue.Empty:
+        pass
+    try:
+        status_queue.put_nowait(snapshot)
+    except queue.Full:
+        pass
+
+
+def _station_worker(spec, core, command_queue, status_queue, stop_event):
+    """Run one station's tracker pipeline and serial link in its own process.
+
+    Each station owns its camera, Arduino and EyeTracker, so a stalled camera or serial
+    port blocks only this process. Frames are processed continuously; when processing a
+    frame exceeds the latency budget the next buffered frame is dropped so the station
+    always works on the freshest frame instead of falling further behind.
+
+    Args:
+        spec: Station dict with name, camera_index, arduino_port, latency_budget_ms, preview_fps,
+              tracking (eye_tracking config section), binary_protocol and link_baud_rates
+        core: CPU core to pin this station to, or None
+        command_queue: Queue of (command, args) tuples from the host
+        status_queue: Queue the latest station snapshot is published on
+        stop_event: Event set by the host to stop the station
+    """
+    # One core per station, so OpenCV should not spread its own threads over the others
+    cv2.setNumThreads(1)
+    if core is not None and hasattr(os, 'sched_setaffinity'):
+        try:
+            os.sched_setaffinity(0, {core})
+        except OSError as e:
+            print(f"{spec['name']}: could not pin to core {core}: {e}")
+
+    arduino = ArduinoTracker(
+        auto_connect=False,
+        baud_rate=spec['baud_rate'],
+        binary_protocol=spec['binary_protocol'],
+        link_baud_rates=spec['link_baud_rates']
+    )
+    if spec['arduino_port']:
+        arduino.connect_to_port(spec['arduino_port'])
+        arduino.start_watchdog()
+
+    eye = EyeTracker(
+        arduino_tracker=arduino if arduino.is_connected() else None,
+        camera_source=spec['camera_index'],
+        tracking_config=spec['tracking']
+    )
+
+    budget = spec['latency_budget_ms'] / 1000
+    preview_interval = 1 / spec['preview_fps']
+    preview_size = tuple(spec['preview_size'])
+
+    frame_times = []
+    overruns = 0
+    frames = 0
+    last_preview_time = 0
+    last_status_poll = 0
+    test_status = 'Ready'
+    test_number = 0 # Counts the tests started, so the host records each finished test once
+    test_started = None
+    results = None
+    reactions = None
+
+    try:
+        while not stop_event.is_set():
+            # Host commands are handled between frames
+            while True:
+                try:
+                    command, args = command_queue.get_nowait()
+                except queue.Empty:
+                    break
+
+                if command == 'start_test':
+                    if arduino.start_test():
+                        test_status = 'Running'
+                        test_number += 1
+                        test_started = time.time()
+                        results, reactions = None, None
+                elif command == 'stop_test':
+                    arduino.stop_test()
+                    results, reactions = _collect_results(arduino)
+                    test_status = 'Finished'
+                elif command in STATION_COMMANDS:
+                    getattr(eye, command)(*args)
+
+            # Poll the test progress while a test runs. The watchdog's resync clears
+            # is_test_running when the test ended during an outage, that ends it too
+            now = time.time()
+            if test_status == 'Running' and now - last_status_poll > 0.5:
+                last_status_poll = now
+                if not arduino.is_test_running or arduino.get_test_status()['test_status'] == 'Finished':
+                    results, reactions = _collect_results(arduino)
+                    test_status = 'Finished'
+
+            start_time = time.perf_counter()
+            frame = eye.get_processed_frame()
+            elapsed = time.perf_counter() - start_time
+
+            if frame is None:
+                time.sleep(0.05)
+                continue
+
+            frames += 1
+            frame_times.append(elapsed)
+            if len(frame_times) > 60:
+                frame_times.pop(0)
+
+            # Enforce the latency budget by skipping the stale frame in the capture buffer
+            if elapsed > budget:
+                overruns += 1
+                eye.cap.grab()
+
+            if now - last_preview_time >= preview_interval:
+                last_preview_time = now
+                snapshot = {
+                    'name': spec['name'],
+                    'time': now,
+                    'preview': cv2.resize(frame, preview_size, interpolation=cv2.INTER_AREA),
+                    'observation': eye.observation,
+                    'latency_ms': 1000 * sum(frame_times) / len(frame_times),
+                    'overruns': overruns,
+                    'frames': frames,
+                    'arduino_connected': arduino.is_connected(),
+                    'within_threshold': eye.is_eye_in_position(),
+                    'locked': eye.is_position_locked,
+                    'test_status': test_status,
+                    'test_number': test_number,
+                    'test_started': test_started,
+                    'results': results,
+                    'reactions': reactions,
+                }
+                _publish(status_queue, snapshot)
+    finally:
+        eye.release()
+        arduino.disconnect()
+
+
+class StationHost:
+    """Runs several test stations, each a (camera, Arduino) pair, from one machine.
+
+    Every station runs in its own process so stations are isolated from each other and
+    their detection work is spread over the available cores, one core per station in
+    round-robin order. The host only exchanges small messages with the stations: commands
+    going in and preview snapshots coming out, never blocking on either.
+    """
+
+    def __init__(self, stations, latency_budget_ms=33, preview_fps=10, preview_size=(320, 240),
+                 stall_timeout=2.0, baud_rate=115200, tracking_config=None, binary_protocol=True,
+                 link_baud_rates=None):
+        """Initialize the station host
+
+        Args:
+            stations: List of station dicts with name, camera_index and arduino_port
+            latency_budget_ms: Per-frame processing budget for each station
+            preview_fps: Rate at which stations publish previews to the host
+            preview_size: Size (width, height) of the preview frames
+            stall_timeout: Seconds without a snapshot before a station is reported as stalled
+            baud_rate: Baud rate for the stations' serial links
+            tracking_config: The 'eye_tracking' config section used by every station, None for the defaults
+            binary_protocol: If True, switch the stations' Arduinos to binary frames
+            link_baud_rates: Faster rates to negotiate on the stations' links, None to stay at baud_rate
+        """
+        self.stall_timeout = stall_timeout
+        self.specs = []
+        for index, station in enumerate(stations):
+            self.specs.append({
+                'name': station.get('name', f"Station {index + 1}"),
+                'camera_index': station.get('camera_index', index),
+                'arduino_port': station.get('arduino_port'),
+                'latency_budget_ms': station.get('latency_budget_ms', latency_budget_ms),
+                'preview_fps': preview_fps,
+                'preview_size': preview_size,
+                'baud_rate': baud_rate,
+                'tracking': dict(tracking_config) if tracking_config else None,
+                'binary_protocol': binary_protocol,
+                'link_baud_rates': list(link_baud_rates or []),
+            })
+
+        self._context = multiprocessing.get_context('spawn')
+        self._processes = []
+        self._command_queues = []
+        self._status_queues = []
+        self._stop_event = self._context.Event()
+        self.snapshots = [None] * len(self.specs)
+        self._last_seen = [None] * len(self.specs)
+
+    def assign_cores(self):
+        """Spread stations over the CPU cores in round-robin order
+
+        Returns:
+            list: Core index for each station, or None where pinning is unsupported
+        """
+        if not hasattr(os, 'sched_setaffinity'):
+            return [None] * len(self.specs)
+
+        cores = sorted(os.sched_getaffinity(0))
+        return [cores[index % len(cores)] for index in range(len(self.specs))]
+
+    def start(self):
+        """Start one process per station"""
+        for spec, core in zip(self.specs, self.assign_cores()):
+            command_queue = self._context.Queue()
+            status_queue = self._context.Queue(maxsize=2)
+            process = self._context.Process(
+                target=_station_worker,
+                args=(spec, core, command_queue, status_queue, self._stop_event),
+                name=spec['name'],
+                daemon=True,
+            )
+            process.start()
+            self._processes.append(process)
+            self._command_queues.append(command_queue)
+            self._status_queues.append(status_queue)
+        self._started_at = time.time()
+
+    def send(self, station, command, *args):
+        """Queue a command for a station, handled between that station's frames
+
+        Args:
+            station: Station index
+            command: One of STATION_COMMANDS
+            args: Arguments for the command
+        """
+        if command not in STATION_COMMANDS:
+            raise ValueError(f"Unknown station command: {command}")
+        self._command_queues[station].put((command, args))
+
+    def poll(self):
+        """Collect the latest snapshot of every station without blocking
+
+        Returns:
+            list: Latest snapshot dict per station (None before the first one), each with
+                  a 'stalled' flag set when the station has gone quiet
+        """
+        now = time.time()
+        for index, status_queue in enumerate(self._status_queues):
+            while True:
+                try:
+                    self.snapshots[index] = status_queue.get_nowait()
+                    self._last_seen[index] = now
+                except queue.Empty:
+                    break
+
+            if self.snapshots[index] is not None:
+                self.snapshots[index]['stalled'] = self.is_stalled(index)
+            elif self.is_stalled(index):
+                # Never delivered a frame, e.g. its camera failed to open
+                self.snapshots[index] = {'name': self.specs[index]['name'], 'stalled': True}
+
+        return self.snapshots
+
+    def is_stalled(self, station):
+        """Check if a station has stopped publishing snapshots"""
+        last_seen = self._last_seen[station] or self._started_at
+        return time.time() - last_seen > self.stall_timeout or not self._processes[station].is_alive()
+
+    def stop(self):
+        """Stop all stations and release their devices"""
+        self._stop_event.set()
+        for process in self._processes:
+            process.join(timeout=3)
+            if process.is_alive():
+                process.terminate()
+        self._processes = []
+        self._command_queues = []
+        self._status_queues = []
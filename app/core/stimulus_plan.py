@@ -0,0 +1,155 @@
+"""
+Stimulus plans: the sequence of points, and their timing, shown during a test.
+"""
+import numpy as np
+
+from app.core.binary_codec import PLAN_POINT_DTYPE
+
+# Grid spacing and extent of the Humphrey patterns, in degrees of visual angle.
+# Both use a 6 degree grid offset 3 degrees from the meridians.
+GRID_STEP = 6
+GRID_OFFSET = 3
+PATTERNS = {
+    # Points within the 24 degree field, plus the two nasal step points at 27 degrees
+    '24-2': {'max_radius_sq': 21 ** 2 + 9 ** 2, 'nasal_step': True},
+    # Points within the 30 degree field
+    '30-2': {'max_radius_sq': 27 ** 2 + 9 ** 2, 'nasal_step': False},
+}
+
+
+def grid_degrees(pattern='24-2', eye='right'):
+    """Test locations of a standard pattern.
+
+    Args:
+        pattern: '24-2' (54 points) or '30-2' (76 points)
+        eye: 'right' or 'left', decides on which side the nasal step points are
+
+    Returns:
+        numpy array (N, 2) of (x, y) in degrees, x to the patient's right, y up
+    """
+    if pattern not in PATTERNS:
+        raise ValueError(f"Unknown pattern {pattern!r}, expected one of {', '.join(PATTERNS)}")
+    spec = PATTERNS[pattern]
+
+    axis = np.arange(-27, 28, GRID_STEP)
+    x, y = np.meshgrid(axis, axis[::-1])
+    x, y = x.ravel(), y.ravel()
+    inside = x ** 2 + y ** 2 <= spec['max_radius_sq']
+    if spec['nasal_step']:
+        # The nasal field is on the left of a right eye's field
+        nasal_x = -27 if eye == 'right' else 27
+        inside |= (x == nasal_x) & (np.abs(y) == GRID_OFFSET)
+    return np.column_stack((x[inside], y[inside]))
+
+
+class StimulusPlan:
+    """An ordered list of stimuli, uploaded to the Arduino at test start.
+
+    Each stimulus is a PLAN_POINT_DTYPE record: the two servo angles, the delay
+    before the laser fires, the laser on time and the total time at the point.
+    The Arduino only buffers a few points ahead (see ArduinoTracker.load_plan), so
+    plans are not limited by its SRAM, only by the size of its hit bitmap.
+    """
+
+    def __init__(self, points):
+        """
+        Args:
+            points: Array of PLAN_POINT_DTYPE records, in presentation order
+        """
+        self.points = np.asarray(points, dtype=PLAN_POINT_DTYPE)
+
+    def __len__(self):
+        return len(self.points)
+
+    @classmethod
+    def from_servo_angles(cls, angles, pre_fire_ms=500, laser_ms=2000, point_ms=5000):
+        """Plan with the same timing for every point, e.g. the firmware's built-in points.
+
+        Args:
+            angles: Sequence of (servo1, servo2) angles
+            pre_fire_ms: Milliseconds from arriving at a point to the laser firing
+            laser_ms: Milliseconds the laser is on
+            point_ms: Milliseconds from arriving at a point to moving on
+        """
+        points = np.zeros(len(angles), dtype=PLAN_POINT_DTYPE)
+        angles = np.asarray(angles).reshape(-1, 2)
+        points['servo1'] = angles[:, 0]
+        points['servo2'] = angles[:, 1]
+        points['pre_fire_ms'] = pre_fire_ms
+        points['laser_ms'] = laser_ms
+        points['point_ms'] = point_ms
+        return cls(points)
+
+    @classmethod
+    def from_grid(cls, pattern='24-2', eye='right', servo_center=(100, 35), servo_scale=(1.0, 1.0),
+                  laser_duration=0.5, minimum_interval=0.2, maximum_interval=1.0,
+                  response_window=1.0, seed=None):
+        """Plan for a standard perimetry pattern, in random order.
+
+        Args:
+            pattern: '24-2' or '30-2'
+            eye: Eye being tested, 'right' or 'left'
+            servo_center: (servo1, servo2) angles pointing at fixation
+            servo_scale: Servo degrees per degree of visual angle, (vertical for servo1,
+                         horizontal for servo2), negative to flip an axis
+            laser_duration: Seconds each stimulus is shown
+            minimum_interval: Shortest random delay in seconds before a stimulus
+            maximum_interval: Longest random delay in seconds before a stimulus
+            response_window: Seconds after the stimulus to wait for a press
+            seed: Random seed for the order and intervals, None for a new order every test
+        """
+        rng = np.random.default_rng(seed)
+        degrees = rng.permutation(grid_degrees(pattern, eye))
+
+        points = np.zeros(len(degrees), dtype=PLAN_POINT_DTYPE)
+        points['servo1'] = np.rint(servo_center[0] - degrees[:, 1] * servo_scale[0]).clip(0, 180)
+        points['servo2'] = np.rint(servo_center[1] - degrees[:, 0] * servo_scale[1]).clip(0, 180)
+        pre_fire_ms = np.rint(rng.uniform(minimum_interval, maximum_interval, len(points)) * 1000)
+        laser_ms = round(laser_duration * 1000)
+        points['pre_fire_ms'] = pre_fire_ms
+        points['laser_ms'] = laser_ms
+        points['point_ms'] = pre_fire_ms + laser_ms + round(response_window * 1000)
+        return cls(points)
+
+    @classmethod
+    def from_config(cls, test_config):
+        """Plan for the config's test section, None for the firmware's built-in points."""
+        pattern = test_config.get('pattern', 'builtin')
+        if pattern == 'builtin':
+            return None
+        return cls.from_grid(
+            pattern=pattern,
+            eye=test_config['eye'],
+            servo_center=test_config['servo_center'],
+            servo_scale=test_config['servo_scale'],
+            laser_duration=test_config['point_duration'],
+            minimum_interval=test_config['minimum_interval'],
+            maximum_interval=test_config['maximum_interval'],
+            response_window=test_config['response_window'],
+            seed=test_config.get('seed'),
+        )
+
+    def validate(self, max_points=None):
+        """Check the plan can be run by the device.
+
+        Args:
+            max_points: Largest plan the device accepts, as reported by it
+
+        Raises:
+            ValueError: If the plan is empty, too large or has inconsistent timing
+        """
+        if not len(self.points):
+            raise ValueError("Stimulus plan is empty")
+        if max_points is not None and len(self.points) > max_points:
+            raise ValueError(f"Stimulus plan has {len(self.points)} points, the device accepts at most {max_points}")
+        if np.any(self.points['point_ms'] < self.points['pre_fire_ms'].astype(np.int64) + self.points['laser_ms']):
+            raise ValueError("Stimulus plan has points that move on before their laser is off")
+
+    @property
+    def duration(self):
+        """Total test time in seconds, without the device's lead-in."""
+        return float(self.points['point_ms'].sum()) / 1000
+
+    def chunk(self, start, count):
+        """Points [start, start + count) as bytes for the device."""
+        return self.points[start:start + count].tobytes()
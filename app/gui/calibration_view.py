@@ -3,12 +3,13 @@ Calibration view for the EyeTracker application
 """
 from PyQt6.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QLabel, 
-    QPushButton, QSlider, QGroupBox, QSizePolicy
+    QPushButton, QSlider, QGroupBox, QSizePolicy, QLineEdit
 )
 from PyQt6.QtCore import Qt, QTimer, pyqtSignal, QRect, QPoint
 from PyQt6.QtGui import QImage, QPixmap, QPainter, QColor, QPen
 
 from app.gui.widgets.video_widget import VideoWidget
+from app.gui.widgets.tracking_overlay import paint_tracking_overlay
 from app.gui.widgets.help_popup import HelpPopup
 
 class CalibrationView(QWidget):
@@ -33,6 +34,12 @@ class CalibrationView(QWidget):
 
         # Binary Threshold Switch Margin 
         self.confidence_margin = 2 # Default Margin
+
+        # Look-away debouncing
+        gaze_config = parent.config['eye_tracking'] if parent and hasattr(parent, 'config') else {}
+        self.gaze_hysteresis = gaze_config.get('gaze_hysteresis', 6)
+        self.gaze_dwell_ms = gaze_config.get('gaze_dwell_ms', 100)
+        self.gaze_vote_window = gaze_config.get('gaze_vote_window', 3)
         
         # Zoom region selection
         self.zoom_factor = 1  # Target zoom factor
@@ -95,7 +102,7 @@ class CalibrationView(QWidget):
         self.video_widget.mouseReleaseEvent = self.on_video_mouse_release
         self.video_widget.setFocusPolicy(Qt.FocusPolicy.StrongFocus)
         self.video_widget.keyPressEvent = self.on_video_key_press
-        # Set external paint function to draw zoom overlay
+        # Set external paint function to draw tracking and zoom overlays
         self.video_widget.external_paint = self.on_video_paint
         content_layout.addWidget(self.video_widget, 3)
         
@@ -199,9 +206,59 @@ class CalibrationView(QWidget):
         threshold_layout.addWidget(self.confidence_margin_slider)
         
         self.confidence_margin_label = QLabel(f"Current: {self.confidence_margin}")
-        self.confidence_margin_label.setStyleSheet("font-weight: normal; color: #666;")
+        self.confidence_margin_label.setStyleSheet("font-weight: normal; color: #666; margin-bottom: 10px;")
         threshold_layout.addWidget(self.confidence_margin_label)
         
+        # Look-away Hysteresis
+        hysteresis_label = QLabel("Look-away Hysteresis (px):")
+        hysteresis_label.setStyleSheet("font-weight: normal; margin-top: 5px;")
+        threshold_layout.addWidget(hysteresis_label)
+        
+        self.hysteresis_slider = QSlider(Qt.Orientation.Horizontal)
+        self.hysteresis_slider.setMinimum(0)
+        self.hysteresis_slider.setMaximum(30)
+        self.hysteresis_slider.setValue(self.gaze_hysteresis)
+        self.hysteresis_slider.valueChanged.connect(self.on_hysteresis_changed)
+        threshold_layout.addWidget(self.hysteresis_slider)
+        
+        self.hysteresis_value_label = QLabel(f"Current: {self.gaze_hysteresis}")
+        self.hysteresis_value_label.setStyleSheet("font-weight: normal; color: #666; margin-bottom: 10px;")
+        threshold_layout.addWidget(self.hysteresis_value_label)
+        
+        # Look-away Dwell Time
+        dwell_label = QLabel("Look-away Dwell Time (ms):")
+        dwell_label.setStyleSheet("font-weight: normal; margin-top: 5px;")
+        threshold_layout.addWidget(dwell_label)
+        
+        self.dwell_slider = QSlider(Qt.Orientation.Horizontal)
+        self.dwell_slider.setMinimum(0)
+        self.dwell_slider.setMaximum(500)
+        self.dwell_slider.setSingleStep(10)
+        self.dwell_slider.setPageStep(50)
+        self.dwell_slider.setValue(self.gaze_dwell_ms)
+        self.dwell_slider.valueChanged.connect(self.on_dwell_changed)
+        threshold_layout.addWidget(self.dwell_slider)
+        
+        self.dwell_value_label = QLabel(f"Current: {self.gaze_dwell_ms}")
+        self.dwell_value_label.setStyleSheet("font-weight: normal; color: #666; margin-bottom: 10px;")
+        threshold_layout.addWidget(self.dwell_value_label)
+        
+        # Look-away Vote Frames
+        vote_label = QLabel("Look-away Vote Frames:")
+        vote_label.setStyleSheet("font-weight: normal; margin-top: 5px;")
+        threshold_layout.addWidget(vote_label)
+        
+        self.vote_slider = QSlider(Qt.Orientation.Horizontal)
+        self.vote_slider.setMinimum(1)
+        self.vote_slider.setMaximum(9)
+        self.vote_slider.setValue(self.gaze_vote_window)
+        self.vote_slider.valueChanged.connect(self.on_vote_window_changed)
+        threshold_layout.addWidget(self.vote_slider)
+        
+        self.vote_value_label = QLabel(f"Current: {self.gaze_vote_window}")
+        self.vote_value_label.setStyleSheet("font-weight: normal; color: #666;")
+        threshold_layout.addWidget(self.vote_value_label)
+        
         controls_layout.addWidget(threshold_group)
         
         # Calibration control
@@ -222,6 +279,10 @@ class CalibrationView(QWidget):
         """)
         calibration_layout = QVBoxLayout(calibration_group)
         
+        self.patient_id_input = QLineEdit()
+        self.patient_id_input.setPlaceholderText("Patient ID (optional)")
+        calibration_layout.addWidget(self.patient_id_input)
+        
         self.set_position_btn = QPushButton("Set Position (L)")
         self.set_position_btn.setStyleSheet("""
             QPushButton {
@@ -298,6 +359,39 @@ class CalibrationView(QWidget):
         if self.parent and hasattr(self.parent, 'eye_tracker') and self.parent.eye_tracker:
             self.parent.eye_tracker.set_confidence_margin(value)
     
+    def on_hysteresis_changed(self, value):
+        """Handle look-away hysteresis slider value change"""
+        self.gaze_hysteresis = value
+        self.hysteresis_value_label.setText(f"Current: {value}")
+        self.apply_gaze_filter()
+    
+    def on_dwell_changed(self, value):
+        """Handle look-away dwell time slider value change"""
+        self.gaze_dwell_ms = value
+        self.dwell_value_label.setText(f"Current: {value}")
+        self.apply_gaze_filter()
+    
+    def on_vote_window_changed(self, value):
+        """Handle look-away vote frames slider value change"""
+        self.gaze_vote_window = value
+        self.vote_value_label.setText(f"Current: {value}")
+        self.apply_gaze_filter()
+    
+    def apply_gaze_filter(self):
+        """Send the look-away debouncing settings to the eye tracker and config"""
+        if self.parent and hasattr(self.parent, 'config'):
+            gaze_config = self.parent.config['eye_tracking']
+            gaze_config['gaze_hysteresis'] = self.gaze_hysteresis
+            gaze_config['gaze_dwell_ms'] = self.gaze_dwell_ms
+            gaze_config['gaze_vote_window'] = self.gaze_vote_window
+        
+        if self.parent and hasattr(self.parent, 'eye_tracker') and self.parent.eye_tracker:
+            self.parent.eye_tracker.set_gaze_filter(
+                hysteresis=self.gaze_hysteresis,
+                dwell_ms=self.gaze_dwell_ms,
+                vote_window=self.gaze_vote_window
+            )
+
     def on_zoom_changed(self, value):
         """Handle zoom slider value change"""
         self.zoom_factor = value
@@ -461,6 +555,8 @@ class CalibrationView(QWidget):
     def on_start_test(self):
         """Start the test"""
         if self.parent:
+            # Stored with the results of the test
+            self.parent.patient_id = self.patient_id_input.text().strip() or None
             self.parent.start_test()
     
     def update_video_feed(self):
@@ -469,7 +565,7 @@ class CalibrationView(QWidget):
             frame = self.parent.eye_tracker.get_processed_frame()
 
             if frame is not None:
-                qt_image = self.video_widget.update_frame(frame)
+                qt_image = self.video_widget.update_frame(frame, self.parent.eye_tracker.observation)
 
                 return qt_image
         
@@ -479,7 +575,9 @@ class CalibrationView(QWidget):
         return None
     
     def on_video_paint(self, painter):
-        """Custom paint function for the video widget to overlay zoom selection box"""
+        """Custom paint function for the video widget to overlay tracking results and zoom selection box"""
+        paint_tracking_overlay(painter, self.video_widget, self.video_widget.observation)
+
         # Draw zoom selection box if active
         if self.zoom_selection_active and self.zoom_region:
             # Set up semi-transparent overlay for the non-selected area
@@ -603,6 +701,7 @@ class CalibrationView(QWidget):
         
         # Start video timer when the view is shown
         if self.parent and hasattr(self.parent, 'eye_tracker') and self.parent.eye_tracker:
+            self.apply_gaze_filter()
             self.video_timer.start(8)  # ~120 fps
 
             self.initialise_original_frame()
@@ -0,0 +1,137 @@
+"""
+Comparison view for the EyeTracker application, trends across a patient's tests
+"""
+from PyQt6.QtWidgets import (
+    QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton,
+    QComboBox, QGroupBox, QTableWidget, QTableWidgetItem, QAbstractItemView
+)
+
+
+def _format(value, pattern, empty=""):
+    """Format a number that may be None"""
+    return empty if value is None else pattern.format(value)
+
+
+class ComparisonView(QWidget):
+    """View comparing the tests of one patient over time"""
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.parent = parent
+        self.setup_ui()
+    
+    def setup_ui(self):
+        """Set up the user interface"""
+        main_layout = QVBoxLayout(self)
+        
+        # Patient selection row
+        patient_layout = QHBoxLayout()
+        patient_layout.addWidget(QLabel("Patient"))
+        self.patient_combo = QComboBox()
+        self.patient_combo.activated.connect(lambda index: self.show_patient(self.patient_combo.currentText()))
+        patient_layout.addWidget(self.patient_combo, 1)
+        
+        back_btn = QPushButton("Back to Results")
+        back_btn.clicked.connect(self.back_to_results)
+        patient_layout.addWidget(back_btn)
+        main_layout.addLayout(patient_layout)
+        
+        self.trend_label = QLabel("Select a patient")
+        self.trend_label.setStyleSheet("font-size: 16px; margin: 10px;")
+        self.trend_label.setWordWrap(True)
+        main_layout.addWidget(self.trend_label)
+        
+        # One row per test
+        sessions_group = QGroupBox("Tests")
+        sessions_layout = QVBoxLayout(sessions_group)
+        self.sessions_table = QTableWidget(0, 6)
+        self.sessions_table.setHorizontalHeaderLabels(["Date", "Pattern", "Eye", "Points", "Accuracy", "Mean reaction"])
+        self.sessions_table.horizontalHeader().setStretchLastSection(True)
+        self.sessions_table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        sessions_layout.addWidget(self.sessions_table)
+        main_layout.addWidget(sessions_group, 1)
+        
+        # One row per test location, the ones losing sensitivity fastest first
+        points_group = QGroupBox("Test Locations")
+        points_layout = QVBoxLayout(points_group)
+        self.points_table = QTableWidget(0, 9)
+        self.points_table.setHorizontalHeaderLabels([
+            "Pattern", "Eye", "Point", "Tests", "Hit rate", "Hit rate / year",
+            "Mean reaction", "Reaction / year", "Last test"
+        ])
+        self.points_table.horizontalHeader().setStretchLastSection(True)
+        self.points_table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        points_layout.addWidget(self.points_table)
+        main_layout.addWidget(points_group, 2)
+    
+    def refresh_patients(self, selected=None):
+        """List the patients of the results database"""
+        database = getattr(self.parent, 'results_db', None)
+        self.patient_combo.clear()
+        if not database:
+            self.trend_label.setText("Results database not available")
+            return
+        self.patient_combo.addItems(database.patients())
+        if selected:
+            self.patient_combo.setCurrentText(selected)
+    
+    def show_patient(self, patient_id):
+        """Show the trends of a patient's tests
+        
+        Args:
+            patient_id: Patient ID as entered before the tests
+        """
+        database = getattr(self.parent, 'results_db', None)
+        trends = database.patient_trends(patient_id) if database and patient_id else None
+        if not trends:
+            self.trend_label.setText("No tests stored for this patient")
+            self.sessions_table.setRowCount(0)
+            self.points_table.setRowCount(0)
+            return
+        
+        trend = trends['session_trend']
+        text = f"{trend['tests']} tests from {trend['first'][:10]} to {trend['last'][:10]}."
+        if trend['accuracy_per_year'] is not None:
+            text += f" Accuracy {trend['accuracy_per_year']:+.1f} % per year"
+            if trend['mean_reaction_ms_per_year'] is not None:
+                text += f", mean reaction time {trend['mean_reaction_ms_per_year']:+.0f} ms per year"
+            text += "."
+        self.trend_label.setText(text)
+        
+        self.fill_table(self.sessions_table, [
+            [
+                session['started'].replace('T', ' '),
+                session['pattern'] or "",
+                session['eye'] or "",
+                session['points_shown'],
+                f"{session['accuracy']:.1f}%",
+                _format(session['mean_reaction_ms'], "{:.0f} ms"),
+            ]
+            for session in reversed(trends['sessions'])
+        ])
+        self.fill_table(self.points_table, [
+            [
+                point['pattern'],
+                point['eye'],
+                point['point'],
+                point['tests'],
+                f"{point['hit_rate'] * 100:.0f}%",
+                _format(point['hit_rate_per_year'], "{:+.0%}"),
+                _format(point['mean_reaction_ms'], "{:.0f} ms"),
+                _format(point['reaction_ms_per_year'], "{:+.0f} ms"),
+                "Seen" if point['last_hit'] else "Missed",
+            ]
+            for point in trends['points']
+        ])
+    
+    def fill_table(self, table, rows):
+        """Replace the rows of a table"""
+        table.setRowCount(len(rows))
+        for row, values in enumerate(rows):
+            for column, value in enumerate(values):
+                table.setItem(row, column, QTableWidgetItem(str(value)))
+    
+    def back_to_results(self):
+        """Return to the results view"""
+        if self.parent:
+            self.parent.show_results_view()
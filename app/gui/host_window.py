@@ -0,0 +1,219 @@
+"""
+Operator window for running several test stations from one machine
+"""
+import sqlite3
+from datetime import datetime
+
+from PyQt6.QtWidgets import (
+    QMainWindow, QWidget, QGridLayout, QVBoxLayout, QHBoxLayout,
+    QLabel, QPushButton, QGroupBox, QStatusBar, QLineEdit
+)
+from PyQt6.QtCore import QTimer
+
+from app.core.station_host import StationHost
+from app.core.results_db import ResultsDatabase, summarise_results
+from app.gui.widgets.video_widget import VideoWidget
+from app.gui.widgets.tracking_overlay import paint_tracking_overlay
+
+
+class StationTile(QGroupBox):
+    """Compact preview and controls for one station"""
+
+    def __init__(self, host, index, name, parent=None):
+        super().__init__(name, parent)
+        self.host = host
+        self.index = index
+        self.recorded_test = 0 # test_number of the last test shown and stored
+        self.setup_ui()
+
+    def setup_ui(self):
+        """Set up the user interface"""
+        layout = QVBoxLayout(self)
+
+        self.video_widget = VideoWidget()
+        self.video_widget.setMinimumSize(240, 180)
+        self.video_widget.external_paint = self.on_video_paint
+        layout.addWidget(self.video_widget)
+
+        self.status_label = QLabel("Starting...")
+        self.status_label.setStyleSheet("font-weight: bold;")
+        layout.addWidget(self.status_label)
+
+        self.stats_label = QLabel("")
+        self.stats_label.setStyleSheet("font-size: 12px; color: #666;")
+        layout.addWidget(self.stats_label)
+
+        self.results_label = QLabel("No test finished yet")
+        self.results_label.setStyleSheet("font-size: 12px;")
+        self.results_label.setWordWrap(True)
+        layout.addWidget(self.results_label)
+
+        self.patient_id_input = QLineEdit()
+        self.patient_id_input.setPlaceholderText("Patient ID (optional)")
+        layout.addWidget(self.patient_id_input)
+
+        buttons_layout = QHBoxLayout()
+
+        lock_btn = QPushButton("Lock")
+        lock_btn.clicked.connect(lambda: self.host.send(self.index, 'lock_position'))
+        buttons_layout.addWidget(lock_btn)
+
+        start_btn = QPushButton("Start")
+        start_btn.clicked.connect(lambda: self.host.send(self.index, 'start_test'))
+        buttons_layout.addWidget(start_btn)
+
+        stop_btn = QPushButton("Stop")
+        stop_btn.clicked.connect(lambda: self.host.send(self.index, 'stop_test'))
+        buttons_layout.addWidget(stop_btn)
+
+        layout.addLayout(buttons_layout)
+
+    def patient_id(self):
+        """Patient ID entered for the station, None if empty"""
+        return self.patient_id_input.text().strip() or None
+
+    def show_results(self, summary):
+        """Show the summary of the station's last test
+
+        Args:
+            summary: Summary metrics, see summarise_results
+        """
+        text = (
+            f"Last test: {summary['hits']}/{summary['points_shown']} seen ({summary['accuracy']:.0f}%), "
+            f"{summary['false_presses']} false presses, {summary['look_aways']} look-aways"
+        )
+        if summary['mean_reaction_ms'] is not None:
+            text += f", mean reaction {summary['mean_reaction_ms']:.0f} ms"
+        self.results_label.setText(text)
+
+    def on_video_paint(self, painter):
+        """Overlay the station's tracking results on its preview"""
+        paint_tracking_overlay(painter, self.video_widget, self.video_widget.observation)
+
+    def update_snapshot(self, snapshot):
+        """Show the latest snapshot published by the station"""
+        if snapshot is None:
+            return
+
+        if snapshot['stalled']:
+            self.status_label.setText("STALLED")
+            self.status_label.setStyleSheet("font-weight: bold; color: #F20101;")
+            return
+
+        self.video_widget.update_frame(snapshot['preview'], snapshot['observation'])
+
+        if not snapshot['locked']:
+            status, color = "Not calibrated", "#666"
+        elif snapshot['within_threshold']:
+            status, color = "Eye Position: OK", "green"
+        else:
+            status, color = "Eye Position: OFF CENTER", "red"
+        self.status_label.setText(f"{status} | Test: {snapshot['test_status']}")
+        self.status_label.setStyleSheet(f"font-weight: bold; color: {color};")
+
+        arduino = "Arduino OK" if snapshot['arduino_connected'] else "No Arduino"
+        self.stats_label.setText(
+            f"{snapshot['latency_ms']:.1f} ms/frame | {snapshot['overruns']} over budget | {arduino}"
+        )
+
+
+class HostWindow(QMainWindow):
+    """Operator view showing every station of a multi-station host"""
+
+    def __init__(self, config):
+        super().__init__()
+        self.config = config
+
+        host_config = config['host']
+        self.host = StationHost(
+            host_config['stations'],
+            latency_budget_ms=host_config['latency_budget_ms'],
+            preview_fps=host_config['preview_fps'],
+            stall_timeout=host_config['stall_timeout'],
+            baud_rate=config['arduino']['baud_rate'],
+            tracking_config=config['eye_tracking'],
+            binary_protocol=config['arduino']['binary_protocol'],
+            link_baud_rates=config['arduino']['link_baud_rates'],
+        )
+        self.results_db = self.open_results_db()
+
+        self.setup_ui()
+
+        self.host.start()
+
+        # Timer for collecting station snapshots
+        self.poll_timer = QTimer()
+        self.poll_timer.timeout.connect(self.update_tiles)
+        self.poll_timer.start(int(1000 / host_config['preview_fps']))
+
+    def setup_ui(self):
+        """Set up the user interface"""
+        self.setWindowTitle("EyeTracker - Station Host")
+
+        central_widget = QWidget()
+        self.setCentralWidget(central_widget)
+        grid = QGridLayout(central_widget)
+
+        # Lay the stations out in a roughly square grid
+        columns = max(1, int(len(self.host.specs) ** 0.5 + 0.999))
+        self.tiles = []
+        for index, spec in enumerate(self.host.specs):
+            tile = StationTile(self.host, index, spec['name'])
+            grid.addWidget(tile, index // columns, index % columns)
+            self.tiles.append(tile)
+
+        self.status_bar = QStatusBar()
+        self.setStatusBar(self.status_bar)
+        self.status_bar.showMessage(f"Running {len(self.tiles)} stations")
+
+    def open_results_db(self):
+        """Open the results database, None if it cannot be opened"""
+        try:
+            return ResultsDatabase(self.config['results']['database'])
+        except (OSError, sqlite3.Error) as e:
+            print(f"Results database not available: {e}")
+            return None
+
+    def update_tiles(self):
+        """Refresh every tile with its station's latest snapshot"""
+        for tile, snapshot in zip(self.tiles, self.host.poll()):
+            tile.update_snapshot(snapshot)
+            self.record_finished_test(tile, snapshot)
+
+    def record_finished_test(self, tile, snapshot):
+        """Show a station's finished test and store it as a session, once per test
+
+        Args:
+            tile: StationTile of the station
+            snapshot: Latest snapshot published by the station
+        """
+        if not snapshot or snapshot.get('test_status') != 'Finished' or not snapshot.get('results'):
+            return
+        if snapshot['test_number'] <= tile.recorded_test:
+            return
+        tile.recorded_test = snapshot['test_number']
+
+        results = dict(snapshot['results'], station=tile.title())
+        tile.show_results(summarise_results(results))
+        self.status_bar.showMessage(f"{tile.title()}: test finished")
+
+        if self.results_db:
+            started = snapshot['test_started']
+            # Stations run the Arduino's built-in test, there is no stimulus plan
+            self.results_db.record_session(
+                results,
+                patient_id=tile.patient_id(),
+                started=datetime.fromtimestamp(started) if started else None,
+                eye=self.config['test']['eye'],
+                pattern='builtin',
+                reactions=snapshot['reactions'],
+            )
+
+    def closeEvent(self, event):
+        """Stop the stations on close"""
+        self.poll_timer.stop()
+        self.host.stop()
+        if self.results_db:
+            # Commits the results still queued
+            self.results_db.close()
+        event.accept()
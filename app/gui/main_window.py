@@ -5,26 +5,80 @@ from PyQt6 import QtCore, QtWidgets
 from PyQt6.QtWidgets import (
     QMainWindow, QStackedWidget, QWidget, QVBoxLayout, 
     QPushButton, QLabel, QMessageBox, QStatusBar, QHBoxLayout,
-    QFrame
+    QFrame, QProgressDialog
 )
-from PyQt6.QtCore import Qt, QTimer
+from PyQt6.QtCore import Qt, QTimer, pyqtSignal
 from PyQt6.QtGui import QIcon, QAction, QKeySequence, QFont, QPixmap, QGuiApplication
 
-from app.gui.calibration_view import CalibrationView
-from app.gui.test_view import TestView
-from app.gui.results_view import ResultsView
-from app.core.pupil_tracker import EyeTracker
-from app.core.arduino_tracker import ArduinoTracker
+from app.utils.config import save_config
 
 from app.gui.widgets.help_popup import HelpPopup 
 
+# Views built on first navigation, so OpenCV, pyserial and NumPy load after the window is up.
+# The loaders use plain import statements so PyInstaller still bundles the view modules.
+def _load_calibration_view():
+    from app.gui.calibration_view import CalibrationView
+    return CalibrationView
+
+
+def _load_test_view():
+    from app.gui.test_view import TestView
+    return TestView
+
+
+def _load_results_view():
+    from app.gui.results_view import ResultsView
+    return ResultsView
+
+
+def _load_replay_view():
+    from app.gui.replay_view import ReplayView
+    return ReplayView
+
+
+def _load_comparison_view():
+    from app.gui.comparison_view import ComparisonView
+    return ComparisonView
+
+
+# Attribute name -> function returning the view class
+LAZY_VIEWS = {
+    'calibration_view': _load_calibration_view,
+    'test_view': _load_test_view,
+    'results_view': _load_results_view,
+    'replay_view': _load_replay_view,
+    'comparison_view': _load_comparison_view,
+}
+
+
+def _lazy_view(name):
+    """Property returning a view of LAZY_VIEWS, built by MainWindow.get_view on first access"""
+    return property(lambda window: window.get_view(name))
+
+
 class MainWindow(QMainWindow):
     """Main application window for the EyeTracker application"""
     
+    # Emitted from the connection watchdog thread, delivered on the GUI thread
+    connection_state_changed = pyqtSignal(str, str)
+    # Emitted from the results writer thread once a test is stored, with its session ID
+    session_recorded = pyqtSignal(object)
+    # Emitted from the device connector threads while connecting, see connect_devices
+    device_progress = pyqtSignal(str, str)
+    camera_ready = pyqtSignal(object)
+    devices_connected = pyqtSignal(object)
+    
+    calibration_view = _lazy_view('calibration_view')
+    test_view = _lazy_view('test_view')
+    results_view = _lazy_view('results_view')
+    replay_view = _lazy_view('replay_view')
+    comparison_view = _lazy_view('comparison_view')
+    
     def __init__(self, config):
         super().__init__()
         
         self.config = config
+        self.views = {} # Views of LAZY_VIEWS built so far
 
         # Set Minimum Window Size
         screen_size = QGuiApplication.primaryScreen().availableGeometry()
@@ -52,6 +106,14 @@ class MainWindow(QMainWindow):
         # Initialize core components
         self.eye_tracker = None
         self.arduino_tracker = None
+        self.device_connector = None # DeviceConnector bringing up the devices, None when idle
+        self.connect_dialog = None # Progress dialog of device_connector
+        self.connect_steps = {} # Latest progress message of each device
+        self.cancelled_connectors = [] # Cancelled DeviceConnectors whose devices are not released yet
+        self.camera_warmer = None # CameraWarmer keeping the camera hot on the welcome view, see prewarm_camera
+        self._results_db = None
+        self._results_db_opened = False # Opened on first use, see results_db
+        self.patient_id = None # Entered in the calibration view, stored with the results
         
         # Setup connections and timers
         self.setup_connections()
@@ -190,15 +252,7 @@ class MainWindow(QMainWindow):
         # Create the different views
         self.welcome_view = self.create_welcome_view()
         self.stacked_widget.addWidget(self.welcome_view)
-        
-        self.calibration_view = CalibrationView(self)
-        self.stacked_widget.addWidget(self.calibration_view)
-        
-        self.test_view = TestView(self)
-        self.stacked_widget.addWidget(self.test_view)
-        
-        self.results_view = ResultsView(self)
-        self.stacked_widget.addWidget(self.results_view)
+        # The other views are built by get_view when first shown
         
         # Create status bar
         self.status_bar = QStatusBar()
@@ -218,6 +272,16 @@ class MainWindow(QMainWindow):
         connect_action.triggered.connect(self.connect_devices)
         file_menu.addAction(connect_action)
         
+        # Replay a recorded session
+        replay_action = QAction("&Replay Session", self)
+        replay_action.triggered.connect(lambda: self.show_replay_view())
+        file_menu.addAction(replay_action)
+        
+        # Compare the tests of a patient
+        compare_action = QAction("Patient &History", self)
+        compare_action.triggered.connect(lambda: self.show_comparison_view())
+        file_menu.addAction(compare_action)
+        
         # Exit action
         exit_action = QAction("E&xit", self)
         exit_action.setShortcut(QKeySequence.StandardKey.Quit)
@@ -327,13 +391,90 @@ class MainWindow(QMainWindow):
     
     def setup_connections(self):
         """Set up signal/slot connections"""
-        # Will be implemented as more components are added
-        pass
+        self.connection_state_changed.connect(self.on_connection_state_changed)
+        self.session_recorded.connect(self.on_session_recorded)
+        self.device_progress.connect(self.on_device_progress)
+        self.camera_ready.connect(self.on_camera_ready)
+        self.devices_connected.connect(self.on_devices_connected)
+    
+    def get_view(self, name):
+        """Get a view of LAZY_VIEWS, importing and building it on first use
+        
+        Args:
+            name: Attribute name of the view, e.g. 'test_view'
+            
+        Returns:
+            QWidget: The view, added to the stacked widget
+        """
+        view = self.views.get(name)
+        if view is None:
+            view_class = LAZY_VIEWS[name]()
+            view = view_class(self)
+            self.stacked_widget.addWidget(view)
+            self.views[name] = view
+        return view
+    
+    @property
+    def results_db(self):
+        """Results database, opened on first use, None if it cannot be opened"""
+        if not self._results_db_opened:
+            self._results_db_opened = True
+            self._results_db = self.open_results_db()
+        return self._results_db
+    
+    def open_results_db(self):
+        """Open the results database, None if it cannot be opened"""
+        import sqlite3
+        from app.core.results_db import ResultsDatabase
+        
+        try:
+            return ResultsDatabase(self.config['results']['database'])
+        except (OSError, sqlite3.Error) as e:
+            print(f"Results database not available: {e}")
+            return None
+    
+    def on_session_recorded(self, session_id):
+        """Refresh the results history once a test is stored, if the results view was built"""
+        if 'results_view' in self.views:
+            self.results_view.refresh_history(session_id)
+    
+    def on_connection_state_changed(self, state, detail):
+        """Show the Arduino link state reported by the connection watchdog"""
+        # Only shown in the test view if it was built, it is not built just for this
+        test_view = self.views.get('test_view')
+        if state == 'reconnecting':
+            self.status_bar.showMessage(f"Arduino connection lost ({detail}), reconnecting...")
+            if test_view:
+                test_view.last_action_label.setText("Arduino connection lost, reconnecting...")
+        elif state == 'connected':
+            self.status_bar.showMessage(f"Arduino {detail}")
+            if test_view:
+                test_view.last_action_label.setText(f"Arduino {detail}")
     
     def show_welcome_view(self):
         """Switch to welcome view"""
         self.header_text.setText("Visual Field Test Assistant")
         self.stacked_widget.setCurrentWidget(self.welcome_view)
+        # Once the event loop runs, so the window appears first
+        QTimer.singleShot(0, self.prewarm_camera)
+    
+    def prewarm_camera(self):
+        """Open the camera and run the detector while the welcome view shows, if enabled
+        
+        Connecting then takes over the warm camera, so calibration starts at full frame rate.
+        Not while a cancelled connection may still hold the camera, on_devices_connected
+        calls this again once its devices are released.
+        """
+        if (not self.config['video']['prewarm'] or self.camera_warmer or self.device_connector
+                or self.eye_tracker or self.cancelled_connectors):
+            return
+        from app.core.device_connector import CameraWarmer
+        
+        self.camera_warmer = CameraWarmer(
+            open_camera=self.open_camera,
+            warmup_frames=self.config['video']['prewarm_frames']
+        )
+        self.camera_warmer.start()
     
     def show_calibration_view(self):
         """Switch to calibration view"""
@@ -352,42 +493,219 @@ class MainWindow(QMainWindow):
             self.results_view.set_results(results)
         self.stacked_widget.setCurrentWidget(self.results_view)
     
+    def show_replay_view(self, session_path=None):
+        """Switch to replay view, opening a recorded session if given"""
+        if self.is_test_running:
+            return
+        self.header_text.setText("Session Replay")
+        self.stacked_widget.setCurrentWidget(self.replay_view)
+        if session_path:
+            self.replay_view.open_session(session_path)
+    
+    def show_comparison_view(self, patient_id=None):
+        """Switch to comparison view, showing a patient's trends if given"""
+        if self.is_test_running:
+            return
+        self.header_text.setText("Patient History")
+        self.comparison_view.refresh_patients(patient_id)
+        self.stacked_widget.setCurrentWidget(self.comparison_view)
+        if patient_id:
+            self.comparison_view.show_patient(patient_id)
+    
     def connect_devices(self):
-        """Connect to Arduino and camera"""
-        try:            
-            # Show connecting message
-            self.status_bar.showMessage("Connecting to devices...")
-            
-            # Initialize Arduino tracker with port selection callback
-            self.arduino_tracker = ArduinoTracker(
-                auto_connect=True,
-                baud_rate=self.config['arduino']['baud_rate'],
-                on_detect_callback=self.select_arduino_port,
-                port_identifiers=self.config['arduino']['port_identifiers']
+        """Connect to Arduino and camera in the background
+        
+        The camera and the Arduino are brought up in parallel by a DeviceConnector.
+        The calibration view is shown once the camera delivers its first frame, the
+        Arduino may still be connecting then. A progress dialog allows cancelling.
+        """
+        if self.device_connector or self.is_test_running:
+            return
+        
+        # Loaded on first connection, they pull in OpenCV and pyserial
+        from app.core.device_connector import DeviceConnector
+        
+        self.status_bar.showMessage("Connecting to devices...")
+        self.connect_steps = {'camera': "Waiting...", 'arduino': "Waiting..."}
+        # No maximum, shown as a busy indicator
+        self.connect_dialog = QProgressDialog("Connecting to devices...", "Cancel", 0, 0, self)
+        self.connect_dialog.setWindowTitle("Connecting")
+        self.connect_dialog.setMinimumDuration(0)
+        self.connect_dialog.setAutoReset(False)
+        self.connect_dialog.setAutoClose(False)
+        self.connect_dialog.canceled.connect(self.cancel_connect)
+        self.connect_dialog.show()
+        
+        # The connector takes over the pre-warmed camera, if there is one
+        warmer, self.camera_warmer = self.camera_warmer, None
+        self.device_connector = DeviceConnector(
+            open_camera=lambda: self.take_camera(warmer),
+            connect_arduino=self.connect_arduino,
+            on_progress=self.device_progress.emit,
+            on_camera_ready=self.camera_ready.emit,
+            on_finished=self.devices_connected.emit,
+            first_frame_timeout=self.config['video']['first_frame_timeout']
+        )
+        self.device_connector.start()
+    
+    def open_camera(self):
+        """Build the eye tracker, called on a connector or warmer thread
+        
+        Returns:
+            EyeTracker or BinocularEyeTracker: Tracker without an Arduino, one pipeline per eye in binocular mode
+        """
+        if self.config['binocular']['enabled']:
+            from app.core.binocular_tracker import BinocularEyeTracker
+            return BinocularEyeTracker(
+                arduino_tracker=None,
+                camera_sources=self.config['binocular']['camera_indices'],
+                tracking_config=self.config['eye_tracking']
             )
-            
-            # Initialize eye tracker
-            self.eye_tracker = EyeTracker(arduino_tracker=self.arduino_tracker)
-            
-            if self.arduino_tracker.is_connected():
-                self.is_connected = True
-                self.status_bar.showMessage("Connected to devices")
-                self.show_calibration_view()
-            else:
-                # Arduino connection failed or was cancelled
-                QMessageBox.warning(
-                    self, 
-                    "Connection Error", 
-                    "Could not connect to Arduino device. Please check connections and try again."
-                )
+        
+        from app.core.pupil_tracker import EyeTracker
+        return EyeTracker(
+            arduino_tracker=None,
+            camera_source=self.config['video']['camera_index'],
+            tracking_config=self.config['eye_tracking']
+        )
+    
+    def take_camera(self, warmer):
+        """Take over the camera of a CameraWarmer, or open it if it did not warm up
+        
+        Args:
+            warmer: CameraWarmer started by prewarm_camera, or None
+        """
+        eye_tracker = warmer.take() if warmer else None
+        if eye_tracker is None:
+            return self.open_camera()
+        print("Using the pre-warmed camera")
+        return eye_tracker
+    
+    def connect_arduino(self):
+        """Build the Arduino tracker, called on the device connector thread
+        
+        Returns:
+            ArduinoTracker: Connected, or not if no board answered
+        """
+        from app.core.arduino_tracker import ArduinoTracker
+        
+        # Initialize Arduino tracker with port selection callback
+        return ArduinoTracker(
+            auto_connect=True,
+            baud_rate=self.config['arduino']['baud_rate'],
+            on_detect_callback=self.select_arduino_port,
+            port_identifiers=self.config['arduino']['port_identifiers'],
+            binary_protocol=self.config['arduino']['binary_protocol'],
+            preferred_device=self.config['arduino'].get('last_device'),
+            link_baud_rates=self.config['arduino']['link_baud_rates']
+        )
+    
+    def on_device_progress(self, device, message):
+        """Show the progress of a device in the connect dialog"""
+        if not self.connect_dialog:
+            return
+        self.connect_steps[device] = message
+        self.connect_dialog.setLabelText(
+            f"Camera: {self.connect_steps['camera']}\nArduino: {self.connect_steps['arduino']}"
+        )
+    
+    def on_camera_ready(self, connector):
+        """Start calibration as soon as the camera delivers frames"""
+        if connector is not self.device_connector:
+            return
+        if connector.camera_ok:
+            self.eye_tracker = connector.eye_tracker
+            self.status_bar.showMessage("Camera ready, connecting to Arduino...")
             self.show_calibration_view()
-                
-        except Exception as e:
+    
+    def on_devices_connected(self, connector):
+        """Take over the devices once both are done"""
+        if connector is not self.device_connector:
+            # Cancelled, nobody else holds these devices
+            self.release_devices(connector.eye_tracker, connector.arduino_tracker)
+            if connector in self.cancelled_connectors:
+                self.cancelled_connectors.remove(connector)
+            # The camera is free again
+            if self.stacked_widget.currentWidget() is self.welcome_view:
+                self.prewarm_camera()
+            return
+        self.device_connector = None
+        self.close_connect_dialog()
+        
+        self.arduino_tracker = connector.arduino_tracker
+        self.eye_tracker = connector.eye_tracker
+        if self.eye_tracker:
+            # Gaze decisions go to the Arduino from now on
+            self.eye_tracker.tracker = self.arduino_tracker
+        
+        if connector.errors:
             QMessageBox.critical(
                 self, 
                 "Error", 
-                f"An error occurred while connecting devices: {str(e)}"
+                "An error occurred while connecting devices: " + "; ".join(connector.errors.values())
+            )
+        
+        if self.arduino_tracker and self.arduino_tracker.is_connected():
+            # Remember the board so it is tried first on the next launch
+            if self.arduino_tracker.device != self.config['arduino'].get('last_device'):
+                self.config['arduino']['last_device'] = self.arduino_tracker.device
+                save_config(self.config)
+            
+            self.is_connected = True
+            self.status_bar.showMessage("Connected to devices" if connector.camera_ok else "Connected to Arduino, camera not available")
+            if self.config['arduino']['auto_reconnect']:
+                self.arduino_tracker.start_watchdog(
+                    on_state_change=self.connection_state_changed.emit,
+                    heartbeat_timeout=self.config['arduino']['heartbeat_timeout']
+                )
+        elif not connector.errors:
+            # Arduino connection failed or was cancelled
+            QMessageBox.warning(
+                self, 
+                "Connection Error", 
+                "Could not connect to Arduino device. Please check connections and try again."
             )
+        self.show_calibration_view()
+    
+    def cancel_connect(self):
+        """Cancel connecting, the devices opened so far are released when the connector finishes"""
+        connector = self.device_connector
+        if not connector:
+            return
+        self.device_connector = None
+        self.cancelled_connectors.append(connector)
+        connector.cancel()
+        self.close_connect_dialog()
+        
+        # Calibration may have started on the camera already
+        self.eye_tracker = None
+        self.show_welcome_view()
+        self.status_bar.showMessage("Connection cancelled")
+    
+    def close_connect_dialog(self):
+        """Close the connect progress dialog without cancelling"""
+        dialog = self.connect_dialog
+        if not dialog:
+            return
+        self.connect_dialog = None
+        # Closing a progress dialog emits canceled
+        dialog.canceled.disconnect(self.cancel_connect)
+        dialog.close()
+        dialog.deleteLater()
+    
+    def release_devices(self, eye_tracker, arduino_tracker):
+        """Release devices that are no longer used"""
+        if arduino_tracker:
+            try:
+                arduino_tracker.disconnect()
+            except:
+                pass
+        
+        if eye_tracker:
+            try:
+                eye_tracker.release()
+            except:
+                pass
     
     # Function to allow user to select form multiple arduinos connected, but who would realistically have multiple arduinos connected.
     def select_arduino_port(self, ports):
@@ -533,8 +851,15 @@ class MainWindow(QMainWindow):
     def closeEvent(self, event):
         """Handle application close event"""
         # Clean up resources
+        if self.device_connector:
+            self.device_connector.cancel()
+        
+        if self.camera_warmer:
+            self.camera_warmer.stop()
+        
         if self.arduino_tracker and self.is_connected:
             try:
+                # Also stops the watchdog, so it doesn't reconnect
                 self.arduino_tracker.disconnect()
             except:
                 pass
@@ -545,4 +870,8 @@ class MainWindow(QMainWindow):
             except:
                 pass
         
+        if self._results_db:
+            # Commits the results still queued
+            self.results_db.close()
+        
         event.accept()
\ No newline at end of file
@@ -0,0 +1,277 @@
+"""
+Replay view for the EyeTracker application, plays back a recorded session
+"""
+import os
+import time
+
+import numpy as np
+from PyQt6.QtWidgets import (
+    QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton,
+    QSlider, QComboBox, QListWidget, QListWidgetItem, QGroupBox
+)
+from PyQt6.QtCore import Qt, QTimer
+
+from app.gui.widgets.video_widget import VideoWidget
+from app.gui.widgets.tracking_overlay import paint_tracking_overlay
+from app.core.binary_codec import EVENT_NAMES, EVENT_LOOK_AWAY
+from app.core.binocular_tracker import FRAME_WIDTH, FRAME_HEIGHT
+from app.core.session_store import SessionReader, list_sessions, record_observation
+
+PLAYBACK_SPEEDS = [0.25, 0.5, 1.0, 2.0, 4.0]
+
+
+class ReplayView(QWidget):
+    """View for replaying a recorded session with its stored detections"""
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.parent = parent
+        self.session = None # SessionReader of the open session
+        self.position = 0.0 # Seconds since the session start
+        self.frame_index = None # Index of the frame shown
+        self.eyes = 1 # Eyes recorded in the session
+        self.blank_frame = None # Frame shown under the detections of sessions recorded without frames
+        self.look_away_times = np.empty(0)
+        self.setup_ui()
+        
+        # Timer advancing the playback position
+        self.playback_timer = QTimer()
+        self.playback_timer.timeout.connect(self.advance_playback)
+        self.last_tick = None
+    
+    def setup_ui(self):
+        """Set up the user interface"""
+        main_layout = QVBoxLayout(self)
+        
+        # Session selection row
+        session_layout = QHBoxLayout()
+        self.session_combo = QComboBox()
+        session_layout.addWidget(self.session_combo, 1)
+        
+        open_btn = QPushButton("Open")
+        open_btn.clicked.connect(self.open_selected_session)
+        session_layout.addWidget(open_btn)
+        
+        back_btn = QPushButton("Back to Results")
+        back_btn.clicked.connect(self.back_to_results)
+        session_layout.addWidget(back_btn)
+        main_layout.addLayout(session_layout)
+        
+        # Replayed frame and the session's events
+        content_layout = QHBoxLayout()
+        
+        self.video_widget = VideoWidget()
+        self.video_widget.setMinimumSize(640, 480)
+        self.video_widget.external_paint = self.on_video_paint
+        content_layout.addWidget(self.video_widget, 3)
+        
+        events_group = QGroupBox("Device Events")
+        events_layout = QVBoxLayout(events_group)
+        self.events_list = QListWidget()
+        self.events_list.itemActivated.connect(self.seek_to_event)
+        self.events_list.itemClicked.connect(self.seek_to_event)
+        events_layout.addWidget(self.events_list)
+        
+        self.next_look_away_btn = QPushButton("Next Look-away")
+        self.next_look_away_btn.clicked.connect(self.seek_next_look_away)
+        events_layout.addWidget(self.next_look_away_btn)
+        content_layout.addWidget(events_group, 1)
+        
+        main_layout.addLayout(content_layout)
+        
+        # Timeline
+        self.timeline = QSlider(Qt.Orientation.Horizontal)
+        self.timeline.setRange(0, 0)
+        self.timeline.valueChanged.connect(lambda value: self.seek(value / 1000))
+        main_layout.addWidget(self.timeline)
+        
+        # Playback controls
+        controls_layout = QHBoxLayout()
+        self.play_btn = QPushButton("Play")
+        self.play_btn.clicked.connect(self.toggle_playback)
+        controls_layout.addWidget(self.play_btn)
+        
+        self.speed_combo = QComboBox()
+        for speed in PLAYBACK_SPEEDS:
+            self.speed_combo.addItem(f"{speed:g}x", speed)
+        self.speed_combo.setCurrentIndex(PLAYBACK_SPEEDS.index(1.0))
+        controls_layout.addWidget(self.speed_combo)
+        
+        self.time_label = QLabel("No session open")
+        controls_layout.addWidget(self.time_label, 1)
+        main_layout.addLayout(controls_layout)
+    
+    def refresh_sessions(self):
+        """List the recorded sessions, newest first"""
+        self.session_combo.clear()
+        for path in reversed(list_sessions(self.parent.config['session']['directory'])):
+            self.session_combo.addItem(os.path.basename(path), path)
+    
+    def open_selected_session(self):
+        """Open the session selected in the list"""
+        path = self.session_combo.currentData()
+        if path:
+            self.open_session(path)
+    
+    def open_session(self, path):
+        """Open a recorded session and show its start
+        
+        Args:
+            path: Session directory created by SessionWriter
+        """
+        self.pause()
+        if self.session:
+            self.session.close()
+        try:
+            self.session = SessionReader(path)
+        except (OSError, ValueError, KeyError) as e:
+            self.session = None
+            self.time_label.setText(f"Cannot open session: {e}")
+            return
+        
+        index = self.session_combo.findData(path)
+        if index >= 0:
+            self.session_combo.setCurrentIndex(index)
+        
+        # Eye slots sit side by side, FRAME_WIDTH apart, as the binocular tracker shows them
+        observed = self.session.observations['eye']
+        self.eyes = max(
+            int(observed.max()) + 1 if len(observed) else 1,
+            2 if self.session.metadata.get('binocular') else 1,
+        )
+        self.blank_frame = np.zeros((FRAME_HEIGHT, FRAME_WIDTH * self.eyes), dtype=np.uint8)
+        
+        # Events with a host time can be seeked to
+        events = self.session.events
+        times = events['host_time'] - self.session.origin
+        self.events_list.clear()
+        for event, event_time in zip(events, times):
+            if np.isnan(event_time):
+                continue
+            name = EVENT_NAMES.get(int(event['event_type']), str(event['event_type']))
+            item = QListWidgetItem(f"{event_time:8.3f} s  {name}  point {event['point']}")
+            item.setData(Qt.ItemDataRole.UserRole, float(event_time))
+            self.events_list.addItem(item)
+        look_aways = events['event_type'] == EVENT_LOOK_AWAY
+        self.look_away_times = np.sort(times[look_aways & ~np.isnan(times)])
+        self.next_look_away_btn.setEnabled(len(self.look_away_times) > 0)
+        
+        self.timeline.blockSignals(True)
+        self.timeline.setRange(0, int(self.session.duration * 1000))
+        self.timeline.blockSignals(False)
+        self.frame_index = None
+        self.seek(0.0)
+    
+    def seek(self, position):
+        """Show the session at a time
+        
+        Args:
+            position: Seconds since the session start
+        """
+        if not self.session:
+            return
+        self.position = min(max(position, 0.0), self.session.duration)
+        
+        self.timeline.blockSignals(True)
+        self.timeline.setValue(int(self.position * 1000))
+        self.timeline.blockSignals(False)
+        self.time_label.setText(f"{self.position:.2f} / {self.session.duration:.2f} s")
+        
+        # Only decode when another frame is due, the lookups are constant time
+        if self.session.has_frames:
+            index = max(self.session.frame_at(self.position), 0)
+            if index == self.frame_index:
+                return
+            self.frame_index = index
+            record = self.session.frames[index]
+            frame = self.session.frame_image(index)
+            eyes = int(record['eyes'])
+            frame_time = float(record['host_time']) - self.session.origin
+        else:
+            frame, eyes, frame_time = self.blank_frame, self.eyes, self.position
+        if frame is None:
+            return
+        
+        self.video_widget.update_frame(frame, self.replay_observation(frame, eyes, frame_time))
+    
+    def replay_observation(self, frame, eyes, frame_time):
+        """Observation of the stored detections for a frame, in the layout the trackers produce"""
+        height, width = frame.shape[:2]
+        eye_width = width // eyes
+        observations = []
+        for eye in range(eyes):
+            record = self.session.observation_at(frame_time, eye)
+            observations.append(record_observation(record, (eye_width, height)) if record is not None else None)
+        
+        if eyes == 1:
+            return observations[0]
+        return {
+            'timestamp': frame_time,
+            'frame_size': (width, height),
+            'eyes': [
+                (observation, (eye * eye_width, 0))
+                for eye, observation in enumerate(observations) if observation is not None
+            ],
+        }
+    
+    def on_video_paint(self, painter):
+        """Paint the stored detections over the replayed frame"""
+        paint_tracking_overlay(painter, self.video_widget, self.video_widget.observation)
+    
+    def seek_to_event(self, item):
+        """Jump to the time of a device event"""
+        self.seek(item.data(Qt.ItemDataRole.UserRole))
+    
+    def seek_next_look_away(self):
+        """Jump to the first look-away after the position, wrapping to the first one"""
+        if not len(self.look_away_times):
+            return
+        index = int(np.searchsorted(self.look_away_times, self.position + 1e-3))
+        self.seek(self.look_away_times[index % len(self.look_away_times)])
+    
+    def toggle_playback(self):
+        """Play or pause"""
+        if self.playback_timer.isActive():
+            self.pause()
+        elif self.session:
+            if self.position >= self.session.duration:
+                self.seek(0.0)
+            self.last_tick = time.perf_counter()
+            self.playback_timer.start(15)
+            self.play_btn.setText("Pause")
+    
+    def pause(self):
+        """Stop playing, keep the position"""
+        self.playback_timer.stop()
+        self.play_btn.setText("Play")
+    
+    def advance_playback(self):
+        """Move the position by the time elapsed since the last tick, times the speed"""
+        now = time.perf_counter()
+        speed = self.speed_combo.currentData()
+        position = self.position + (now - self.last_tick) * speed
+        self.last_tick = now
+        self.seek(position)
+        if self.position >= self.session.duration:
+            self.pause()
+    
+    def back_to_results(self):
+        """Return to the results view"""
+        self.pause()
+        if self.parent:
+            self.parent.show_results_view()
+    
+    def showEvent(self, event):
+        """Called when the widget is shown"""
+        super().showEvent(event)
+        current = self.session.path if self.session else None
+        self.refresh_sessions()
+        if current:
+            index = self.session_combo.findData(current)
+            if index >= 0:
+                self.session_combo.setCurrentIndex(index)
+    
+    def hideEvent(self, event):
+        """Called when the widget is hidden"""
+        super().hideEvent(event)
+        self.pause()
@@ -3,12 +3,18 @@ Results view for the EyeTracker application
 """
 from PyQt6.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QLabel, 
-    QPushButton, QGroupBox, QTableWidget, QTableWidgetItem
+    QPushButton, QGroupBox, QTableWidget, QTableWidgetItem, QLineEdit, QAbstractItemView
 )
 from PyQt6.QtCore import Qt
 from PyQt6.QtGui import QFont
 from PyQt6.QtPrintSupport import QPrinter, QPrintDialog
 
+from app.gui.widgets.heatmap_widget import HeatmapWidget
+
+from app.core.fixation_analytics import session_fixation_metrics
+from app.core.gaze_heatmap import GazeHeatmap
+from app.core.session_store import SessionReader
+
 
 class ResultsView(QWidget):
     """View for displaying test results"""
@@ -17,6 +23,8 @@ class ResultsView(QWidget):
         super().__init__(parent)
         self.parent = parent
         self.results = None
+        self.history_cursors = [None] # Cursor of each history page shown so far, for going back
+        self.next_cursor = None
         self.setup_ui()
     
     def setup_ui(self):
@@ -42,15 +50,58 @@ class ResultsView(QWidget):
         
         # Detailed results section
         details_group = QGroupBox("Detailed Results")
-        details_layout = QVBoxLayout(details_group)
+        details_layout = QHBoxLayout(details_group)
         
         self.results_table = QTableWidget(0, 2)
         self.results_table.setHorizontalHeaderLabels(["Metric", "Value"])
         self.results_table.horizontalHeader().setStretchLastSection(True)
-        details_layout.addWidget(self.results_table)
+        details_layout.addWidget(self.results_table, 2)
+        
+        # Where the pupil was relative to the locked position during the test
+        self.heatmap_widget = HeatmapWidget()
+        details_layout.addWidget(self.heatmap_widget, 1)
         
         main_layout.addWidget(details_group)
         
+        # Previous sessions from the results database
+        history_group = QGroupBox("History")
+        history_layout = QVBoxLayout(history_group)
+        
+        self.patient_filter = QLineEdit()
+        self.patient_filter.setPlaceholderText("Filter by patient ID")
+        self.patient_filter.returnPressed.connect(self.refresh_history)
+        history_layout.addWidget(self.patient_filter)
+        
+        self.history_table = QTableWidget(0, 7)
+        self.history_table.setHorizontalHeaderLabels(
+            ["Date", "Patient", "Pattern", "Points", "Hits", "Accuracy", "Mean reaction"]
+        )
+        self.history_table.horizontalHeader().setStretchLastSection(True)
+        self.history_table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.history_table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.history_table.cellDoubleClicked.connect(self.show_history_session)
+        history_layout.addWidget(self.history_table)
+        
+        paging_layout = QHBoxLayout()
+        self.previous_page_btn = QPushButton("Newer")
+        self.previous_page_btn.clicked.connect(self.previous_history_page)
+        paging_layout.addWidget(self.previous_page_btn)
+        
+        self.page_label = QLabel("")
+        self.page_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        paging_layout.addWidget(self.page_label)
+        
+        self.next_page_btn = QPushButton("Older")
+        self.next_page_btn.clicked.connect(self.next_history_page)
+        paging_layout.addWidget(self.next_page_btn)
+        
+        self.compare_btn = QPushButton("Compare Patient's Tests")
+        self.compare_btn.clicked.connect(self.compare_patient)
+        paging_layout.addWidget(self.compare_btn)
+        history_layout.addLayout(paging_layout)
+        
+        main_layout.addWidget(history_group)
+        
         # Buttons row
         buttons_layout = QHBoxLayout()
         
@@ -62,6 +113,11 @@ class ResultsView(QWidget):
         self.save_btn.clicked.connect(self.save_results)
         buttons_layout.addWidget(self.save_btn)
         
+        self.replay_btn = QPushButton("Replay Session")
+        self.replay_btn.setEnabled(False)
+        self.replay_btn.clicked.connect(self.replay_session)
+        buttons_layout.addWidget(self.replay_btn)
+        
         self.new_test_btn = QPushButton("New Test")
         self.new_test_btn.clicked.connect(self.start_new_test)
         buttons_layout.addWidget(self.new_test_btn)
@@ -72,10 +128,18 @@ class ResultsView(QWidget):
         """Set the results to display"""
         self.results = results
         
+        self.replay_btn.setEnabled(bool(results and results.get('session')))
         if not results:
             self.summary_label.setText("No results available")
+            self.heatmap_widget.set_heatmap(None)
             return
         
+        heatmap = results.get('gaze_heatmap')
+        if heatmap:
+            self.heatmap_widget.set_heatmap(GazeHeatmap.from_dict(heatmap), heatmap.get('threshold'))
+        else:
+            self.heatmap_widget.set_heatmap(None)
+        
         # Update summary label
         total_points = results.get('points_shown', 0)
         total_clicks = results.get('clicks', 0)
@@ -120,11 +184,126 @@ class ResultsView(QWidget):
             ("Detection accuracy", f"{accuracy:.1f}%"),
         ]
         
+        # Timing analytics, only available from the device event stream
+        events = results.get('events')
+        if events:
+            reaction = events['reaction_ms']
+            if reaction['count']:
+                metrics.append(("Mean reaction time", f"{reaction['mean']:.0f} ms"))
+                metrics.append(("Reaction time range", f"{reaction['min']:.0f} - {reaction['max']:.0f} ms"))
+            metrics.append(("Looked away during stimulus", events['look_aways_during_stimulus']))
+        
+        # Fixation stability, measured by the camera
+        fixation = self.fixation_summary(results)
+        if fixation and fixation['bcea'] is not None:
+            losses = fixation['fixation_losses']
+            metrics.append(("Gaze dispersion", f"{fixation['dispersion']:.1f} px"))
+            metrics.append(("BCEA (68%)", f"{fixation['bcea']:.0f} px\u00b2"))
+            metrics.append(("Gaze drift", f"{fixation['drift']:.2f} px/s"))
+            metrics.append(("Time out of threshold", f"{fixation['time_out_of_threshold']:.1f} s"))
+            if losses['count']:
+                metrics.append(("Fixation losses", f"{losses['count']} ({losses['total']:.1f} s, longest {losses['max']:.1f} s)"))
+            else:
+                metrics.append(("Fixation losses", 0))
+            metrics.append(("Blinks", fixation['blinks']))
+        
+        if results.get('session'):
+            metrics.append(("Session recording", results['session']))
+        
         for row, (metric, value) in enumerate(metrics):
             self.results_table.insertRow(row)
             self.results_table.setItem(row, 0, QTableWidgetItem(metric))
             self.results_table.setItem(row, 1, QTableWidgetItem(str(value)))
     
+    def fixation_summary(self, results):
+        """Fixation metrics of the results, recomputed from the session recording if the results lack them"""
+        if results.get('fixation'):
+            return results['fixation']
+        if not results.get('session'):
+            return None
+        try:
+            with SessionReader(results['session']) as session:
+                return session_fixation_metrics(session.observations)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Cannot read the session recording: {e}")
+            return None
+    
+    def refresh_history(self, session_id=None):
+        """Show the first page of the history, e.g. after a test was stored"""
+        self.history_cursors = [None]
+        self.load_history_page()
+    
+    def load_history_page(self):
+        """Show the history page starting at the last cursor"""
+        database = getattr(self.parent, 'results_db', None)
+        if not database:
+            self.page_label.setText("Results database not available")
+            self.previous_page_btn.setEnabled(False)
+            self.next_page_btn.setEnabled(False)
+            return
+        
+        patient_id = self.patient_filter.text().strip() or None
+        page_size = self.parent.config['results']['page_size']
+        sessions, self.next_cursor = database.page_sessions(
+            patient_id, page_size=page_size, cursor=self.history_cursors[-1]
+        )
+        
+        self.history_table.setRowCount(len(sessions))
+        for row, session in enumerate(sessions):
+            mean_reaction = session['mean_reaction_ms']
+            values = [
+                session['started'].replace('T', ' '),
+                session['patient_id'] or "",
+                session['pattern'] or "",
+                session['points_shown'],
+                session['hits'],
+                f"{session['accuracy']:.1f}%",
+                f"{mean_reaction:.0f} ms" if mean_reaction is not None else "",
+            ]
+            for column, value in enumerate(values):
+                item = QTableWidgetItem(str(value))
+                item.setData(Qt.ItemDataRole.UserRole, session['id'])
+                self.history_table.setItem(row, column, item)
+        
+        page = len(self.history_cursors)
+        pages = max(1, -(-database.count_sessions(patient_id) // page_size))
+        self.page_label.setText(f"Page {page} of {pages}")
+        self.previous_page_btn.setEnabled(page > 1)
+        self.next_page_btn.setEnabled(self.next_cursor is not None)
+    
+    def next_history_page(self):
+        """Show older sessions"""
+        if self.next_cursor is not None:
+            self.history_cursors.append(self.next_cursor)
+            self.load_history_page()
+    
+    def previous_history_page(self):
+        """Show newer sessions"""
+        if len(self.history_cursors) > 1:
+            self.history_cursors.pop()
+            self.load_history_page()
+    
+    def show_history_session(self, row, column):
+        """Show the results of a stored session"""
+        session_id = self.history_table.item(row, column).data(Qt.ItemDataRole.UserRole)
+        session = self.parent.results_db.get_session(session_id)
+        if session:
+            self.set_results(session['results'])
+    
+    def compare_patient(self):
+        """Show the trends of the patient filtered by, or of the selected session"""
+        patient_id = self.patient_filter.text().strip()
+        row = self.history_table.currentRow()
+        if not patient_id and row >= 0:
+            patient_id = self.history_table.item(row, 1).text()
+        if self.parent:
+            self.parent.show_comparison_view(patient_id or None)
+    
+    def showEvent(self, event):
+        """Called when the widget is shown"""
+        super().showEvent(event)
+        self.refresh_history()
+    
     def print_results(self):
         """Print the test results"""
         if not self.results:
@@ -183,6 +362,11 @@ class ResultsView(QWidget):
                 from PyQt6.QtWidgets import QMessageBox
                 QMessageBox.critical(self, "Error", f"Error saving results: {str(e)}")
     
+    def replay_session(self):
+        """Replay the recorded session of the results"""
+        if self.parent and self.results and self.results.get('session'):
+            self.parent.show_replay_view(self.results['session'])
+    
     def start_new_test(self):
         """Start a new test"""
         if self.parent:
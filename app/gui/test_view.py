@@ -1,6 +1,8 @@
 """
 Test view for the EyeTracker application
 """
+from datetime import datetime
+
 from PyQt6.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QLabel, 
     QPushButton, QProgressBar, QGroupBox
@@ -9,7 +11,14 @@ from PyQt6.QtCore import Qt, QTimer, pyqtSignal
 from PyQt6.QtGui import QFont
 
 from app.gui.widgets.video_widget import VideoWidget
+from app.gui.widgets.tracking_overlay import paint_tracking_overlay
 from app.gui.widgets.help_popup import HelpPopup
+from app.gui.widgets.heatmap_widget import HeatmapWidget
+from app.core.fixation_analytics import FixationAnalytics
+from app.core.gaze_heatmap import GazeHeatmap
+from app.core.session_store import SessionWriter
+from app.core.stimulus_plan import StimulusPlan
+from app.utils.logger import get_logger
 
 class TestView(QWidget):
     """View for running the visual field test"""
@@ -30,6 +39,10 @@ class TestView(QWidget):
         self.status_timer = QTimer()
         self.status_timer.timeout.connect(self.check_test_status)
         
+        # Timer for redrawing the gaze heatmap, it is updated every frame but shown at 10 fps
+        self.heatmap_timer = QTimer()
+        self.heatmap_timer.timeout.connect(self.heatmap_widget.refresh)
+        
         # Test state
         self.test_points_total = 0
         self.test_points_completed = 0
@@ -43,6 +56,12 @@ class TestView(QWidget):
         self.num_points = 1
         self.click_counter = 0
         self.click_tracker = None
+        self.successful_detections = 0
+        self.session = None # SessionWriter recording the running test
+        self.plan = None # StimulusPlan the running test shows, None for the built-in points
+        self.started_at = None
+        self.fixation = FixationAnalytics() # Fixation stability of the tested eye, updated per frame
+        self.heatmap = None # GazeHeatmap of the tested eye, updated per frame
     
     def setup_ui(self):
         """Set up the user interface"""
@@ -86,6 +105,7 @@ class TestView(QWidget):
         # Video feed
         self.video_widget = VideoWidget()
         self.video_widget.setMinimumSize(640, 480)
+        self.video_widget.external_paint = self.on_video_paint
         content_layout.addWidget(self.video_widget, 3)
         
         # Test status and controls
@@ -127,8 +147,26 @@ class TestView(QWidget):
         self.last_action_label = QLabel("Waiting for test to start...")
         status_group_layout.addWidget(self.last_action_label)
         
+        # Fixation stability so far
+        self.fixation_label = QLabel("Fixation: no data")
+        self.fixation_label.setWordWrap(True)
+        status_group_layout.addWidget(self.fixation_label)
+        
+        # Serial link latency
+        self.link_label = QLabel("Serial link: no data")
+        self.link_label.setStyleSheet("font-size: 12px; color: #666;")
+        self.link_label.setWordWrap(True)
+        status_group_layout.addWidget(self.link_label)
+        
         status_layout.addWidget(status_group)
         
+        # Where the pupil was relative to the locked position
+        heatmap_group = QGroupBox("Gaze Deviation")
+        heatmap_layout = QVBoxLayout(heatmap_group)
+        self.heatmap_widget = HeatmapWidget()
+        heatmap_layout.addWidget(self.heatmap_widget)
+        status_layout.addWidget(heatmap_group)
+        
         # Add spacer
         status_layout.addStretch()
         
@@ -154,7 +192,8 @@ class TestView(QWidget):
         if self.parent and hasattr(self.parent, 'eye_tracker') and self.parent.eye_tracker:
             frame = self.parent.eye_tracker.get_processed_frame()
             if frame is not None:
-                self.video_widget.update_frame(frame)
+                self.video_widget.update_frame(frame, self.parent.eye_tracker.observation)
+                self.record_observations(frame)
                 
                 # Update eye position status
                 if self.parent.eye_tracker.is_eye_in_position():
@@ -164,6 +203,85 @@ class TestView(QWidget):
                     self.eye_position_label.setText("Eye Position: OFF CENTER")
                     self.eye_position_label.setStyleSheet("font-weight: bold; color: red;")
     
+    def record_observations(self, frame=None):
+        """Add the current frame's observations to the fixation analytics and the session, one per eye"""
+        eye_tracker = self.parent.eye_tracker
+        observations = getattr(eye_tracker, 'eye_observations', None) or [eye_tracker.observation]
+        self.fixation.update(observations[0])
+        if self.heatmap:
+            self.heatmap.update(observations[0])
+        if not self.session:
+            return
+        for eye, observation in enumerate(observations):
+            self.session.append_observation(observation, eye)
+        if frame is not None:
+            self.session.append_frame(frame, eye_tracker.observation.get('timestamp'), len(observations))
+    
+    def start_session(self):
+        """Start recording the test to a new session directory"""
+        config = self.parent.config
+        if not config['session']['record']:
+            return
+        tracker = self.parent.arduino_tracker
+        try:
+            self.session = SessionWriter(
+                config['session']['directory'],
+                metadata={
+                    'test': config['test'],
+                    'binocular': config['binocular']['enabled'],
+                    'device': tracker.device if tracker else None,
+                    'firmware': tracker.identity if tracker else None,
+                },
+                frame_quality=config['session']['frame_quality'] if config['session']['frames'] else None,
+                frame_rate=config['session']['frame_rate'],
+            )
+        except OSError as e:
+            get_logger().warning(f"Session not recorded: {e}")
+            return
+        if tracker:
+            tracker.subscribe(self.session.on_message)
+    
+    def close_session(self, results):
+        """Finish the session recording and keep the test results with it"""
+        if not self.session:
+            return None
+        if self.parent.arduino_tracker:
+            self.parent.arduino_tracker.unsubscribe(self.session.on_message)
+        self.session.close(results)
+        get_logger().info(
+            f"Session saved to {self.session.path}: {self.session.counts['observations']} observations, "
+            f"{self.session.counts['events']} events"
+        )
+        path, self.session = self.session.path, None
+        return path
+    
+    def store_results(self, results):
+        """Queue the results for the results database, written on its own thread"""
+        database = self.parent.results_db
+        if not database:
+            return
+        tracker = self.parent.arduino_tracker
+        test_config = self.parent.config['test']
+        future = database.record_session(
+            results,
+            patient_id=self.parent.patient_id,
+            started=self.started_at,
+            eye=test_config['eye'],
+            pattern=test_config['pattern'] if self.plan is not None else 'builtin',
+            plan=self.plan,
+            reactions=tracker.protocol.events.point_reaction_times() if tracker else None,
+        )
+        
+        def on_stored(future):
+            # Called on the writer thread, the signal delivers it to the GUI thread
+            if future.exception() is None:
+                self.parent.session_recorded.emit(future.result())
+        future.add_done_callback(on_stored)
+    
+    def on_video_paint(self, painter):
+        """Custom paint function for the video widget to overlay tracking results"""
+        paint_tracking_overlay(painter, self.video_widget, self.video_widget.observation)
+    
     def check_test_status(self):
         """Check the status of the test from the Arduino"""
         if self.parent and hasattr(self.parent, 'arduino_tracker') and self.parent.arduino_tracker:
@@ -174,6 +292,8 @@ class TestView(QWidget):
             
             # Get current test status, Track test progress in real time, currenly add too much lag
             status = self.parent.arduino_tracker.get_test_status()
+            self.update_link_metrics()
+            self.update_fixation_metrics()
             
             if 'Running' in status['test_status'] and len(status.keys()) > 1:
                 print("here 1")
@@ -182,7 +302,12 @@ class TestView(QWidget):
                 self.points_shown = status.get('points_shown', 0)
                 self.num_points = status.get('total_points', 1)  # avoid divide by zero
                 self.click_counter = status.get('clicks', 0)
-                self.click_tracker = status.get('click_pattern', '')
+                # Binary status frames carry the hit count instead of the click pattern
+                if 'hits' in status:
+                    self.successful_detections = status['hits']
+                else:
+                    self.click_tracker = status.get('click_pattern', '')
+                    self.successful_detections = self.click_tracker.count('1')
 
             elif status['test_status'] in ('Finished', 'Ready'):
                 self.status_timer.stop()
@@ -193,22 +318,105 @@ class TestView(QWidget):
                 self.finish_test()
                 return
             
-            if self.click_tracker:
-                successful_detections = self.click_tracker.count('1')
-                progress = int((self.points_shown / self.num_points) * 100)
-            else:
-                successful_detections = 0
-                progress = 0
+            progress = int((self.points_shown / self.num_points) * 100)
 
             self.progress_bar.setValue(progress)
             self.progress_label.setText(f"Points: {self.points_shown} / {self.num_points}")
 
             self.clicks_label.setText(f"Clicks Made: {self.click_counter}")
-            self.successful_detections_label.setText(f"Successful Detections: {successful_detections}")
+            self.successful_detections_label.setText(f"Successful Detections: {self.successful_detections}")
 
             return
         
     
+    def update_link_metrics(self):
+        """Show round-trip latency of the serial link"""
+        metrics = self.parent.arduino_tracker.protocol.metrics
+        self.link_label.setText(f"Serial link: {metrics.format_summary()}")
+    
+    def log_link_metrics(self):
+        """Write the serial link statistics of the test to the log"""
+        summary = self.parent.arduino_tracker.get_link_metrics()
+        logger = get_logger()
+        logger.info(f"Serial link: {self.parent.arduino_tracker.protocol.metrics.format_summary()}")
+        for name, rtt in summary['rtt'].items():
+            if rtt['count']:
+                logger.info(
+                    f"Serial RTT {name}: n={rtt['count']} mean={rtt['mean']:.2f} p50={rtt['p50']:.2f} "
+                    f"p95={rtt['p95']:.2f} p99={rtt['p99']:.2f} max={rtt['max']:.2f} ms"
+                )
+        logger.info(
+            f"Serial commands: sent={summary['commands_sent']} acked={summary['acks_received']} "
+            f"unacked={summary['lost']} max_outstanding={summary['max_outstanding']} baud={summary['baud_rate']}"
+        )
+        
+        outbox = summary['outbox']
+        if outbox:
+            queue_wait = outbox['queue_wait']
+            message = (
+                f"Serial outbox: posted={outbox['posted']} sent={outbox['sent']} coalesced={outbox['coalesced']} "
+                f"dropped={outbox['dropped']} failures={outbox['failures']}"
+            )
+            if queue_wait['count']:
+                message += f" queue_wait p95={queue_wait['p95']:.2f} max={queue_wait['max']:.2f} ms"
+            if outbox['last_error']:
+                message += f" last_error={outbox['last_error']}"
+            logger.info(message)
+        
+        clock = summary['clock']
+        if clock['synced']:
+            logger.info(
+                f"Arduino clock: offset={clock['offset_s']:.4f} s drift={clock['drift_ppm']:.1f} ppm "
+                f"uncertainty={clock['uncertainty_ms']:.2f} ms ({clock['samples_used']}/{clock['samples']} samples used)"
+            )
+    
+    def log_event_metrics(self, events):
+        """Write the analytics of the device event stream to the log"""
+        if not events:
+            return
+        
+        reaction = events['reaction_ms']
+        message = f"Device events: {events['events']} received, {events['lost']} lost"
+        if reaction['count']:
+            message += f", reaction time median={reaction['median']:.0f} min={reaction['min']:.0f} max={reaction['max']:.0f} ms"
+        message += f", {events['look_aways_during_stimulus']} look-aways during stimulus"
+        get_logger().info(message)
+    
+    def update_fixation_metrics(self):
+        """Show the fixation stability of the test so far"""
+        summary = self.fixation.summary()
+        if summary['bcea'] is None:
+            return
+        losses = summary['fixation_losses']
+        self.fixation_label.setText(
+            f"Fixation: BCEA {summary['bcea']:.0f} px\u00b2, {losses['count']} losses, "
+            f"{summary['time_out_of_threshold']:.1f} s out of threshold"
+        )
+    
+    def log_fixation_metrics(self, summary):
+        """Write the fixation stability of the test to the log"""
+        if summary['bcea'] is None:
+            return
+        losses = summary['fixation_losses']
+        get_logger().info(
+            f"Fixation: dispersion={summary['dispersion']:.1f} px, BCEA={summary['bcea']:.0f} px^2, "
+            f"drift={summary['drift']:.2f} px/s, {summary['time_out_of_threshold']:.1f} s out of threshold, "
+            f"{losses['count']} losses, {summary['blinks']} blinks"
+        )
+    
+    def log_gaze_metrics(self):
+        """Write the look-away decision statistics to the log"""
+        eye_tracker = self.parent.eye_tracker if self.parent and hasattr(self.parent, 'eye_tracker') else None
+        if not eye_tracker or not hasattr(eye_tracker, 'gaze_state'):
+            return
+        
+        summary = eye_tracker.gaze_state.summary()
+        latency = summary['latency']
+        message = f"Gaze decisions: {summary['transitions']} transitions, {summary['suppressed']} suppressed"
+        if latency['count']:
+            message += f", added latency p50={latency['p50']:.0f} p95={latency['p95']:.0f} max={latency['max']:.0f} ms"
+        get_logger().info(message)
+    
     def start_test(self):
         """Initialize and start the test"""
         # Reset test state
@@ -216,6 +424,16 @@ class TestView(QWidget):
         self.num_points = 1
         self.click_counter = 0
         self.click_tracker = None
+        self.successful_detections = 0
+        self.test_results = {}
+        self.fixation.reset()
+        self.fixation_label.setText("Fixation: no data")
+        # The map spans twice the lock threshold around the locked position
+        threshold = self.parent.config['eye_tracking']['lockpos_threshold']
+        if self.parent.eye_tracker:
+            threshold = getattr(self.parent.eye_tracker, 'lockpos_threshold', threshold)
+        self.heatmap = GazeHeatmap(extent=2 * threshold)
+        self.heatmap_widget.set_heatmap(self.heatmap, threshold)
     
         self.test_points_total = 0
         self.test_points_completed = 0
@@ -225,8 +443,16 @@ class TestView(QWidget):
         # Start timers
         self.video_timer.start(8)  # ~30 fps
         self.status_timer.start(500)  # Check test status every 500ms
+        self.heatmap_timer.start(100)
 
-        # Send arduino command to start test
+        # Send arduino command to start test, link statistics are kept per test
+        self.start_session()
+        self.parent.arduino_tracker.protocol.metrics.reset()
+        self.started_at = datetime.now()
+        self.plan = StimulusPlan.from_config(self.parent.config['test'])
+        if self.plan is not None and not self.parent.arduino_tracker.load_plan(self.plan):
+            self.last_action_label.setText("Stimulus plan not loaded, using the built-in points")
+            self.plan = None
         self.parent.arduino_tracker.start_test()
     
     def stop_test(self):
@@ -240,12 +466,30 @@ class TestView(QWidget):
         # Stop timers
         self.video_timer.stop()
         self.status_timer.stop()
+        self.heatmap_timer.stop()
         
-        # Get final results from Arduino
+        # Get final results from Arduino, none after a timeout, a lost link or a test stopped before it started
+        results = None
         if self.parent and hasattr(self.parent, 'arduino_tracker') and self.parent.arduino_tracker:
             results = self.parent.arduino_tracker.get_test_results()
             if results:
-                self.test_results = results
+                self.log_event_metrics(results.get('events'))
+            self.log_link_metrics()
+        self.test_results = dict(results) if results else {'incomplete': True}
+        self.log_gaze_metrics()
+        self.test_results['fixation'] = self.fixation.summary()
+        if self.heatmap:
+            self.test_results['gaze_heatmap'] = dict(self.heatmap.to_dict(), threshold=self.heatmap_widget.threshold)
+        self.log_fixation_metrics(self.test_results['fixation'])
+        
+        session_path = self.close_session(self.test_results)
+        if session_path:
+            self.test_results['session'] = session_path
+        # A test without device results is not a session of the patient's history
+        if results:
+            self.store_results(self.test_results)
+        else:
+            get_logger().warning("No test results from the device, the test is not stored")
         
         # Signal test completion
         if self.parent:
@@ -262,4 +506,5 @@ class TestView(QWidget):
         
         # Stop timers when the view is hidden
         self.video_timer.stop()
-        self.status_timer.stop()
\ No newline at end of file
+        self.status_timer.stop()
+        self.heatmap_timer.stop()
\ No newline at end of file
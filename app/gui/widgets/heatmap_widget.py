@@ -0,0 +1,103 @@
+"""
+Widget showing a GazeHeatmap, the pupil offsets from the locked position
+"""
+from PyQt6.QtWidgets import QWidget
+from PyQt6.QtCore import Qt, QSize, QRectF, QPointF
+from PyQt6.QtGui import QImage, QPainter, QPen, QColor
+
+COLOR_BACKGROUND = QColor(20, 20, 28)
+COLOR_THRESHOLD = QColor(0, 200, 0)
+COLOR_CENTER = QColor(255, 255, 0)
+COLOR_TEXT = QColor(220, 220, 220)
+
+
+class HeatmapWidget(QWidget):
+    """Paints a GazeHeatmap with the lock threshold circle over it.
+    
+    The coloured image is cached and only rebuilt by refresh() when the heatmap
+    changed, a repaint only scales the cached image.
+    """
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.heatmap = None
+        self.threshold = None # Lock threshold in frame pixels, drawn as a circle
+        self.image = None
+        self._version = None
+        self.setMinimumSize(160, 160)
+    
+    def set_heatmap(self, heatmap, threshold=None):
+        """Show a heatmap
+        
+        Args:
+            heatmap: GazeHeatmap, or None to show nothing
+            threshold: Lock threshold in frame pixels, None to leave out the circle
+        """
+        self.heatmap = heatmap
+        self.threshold = threshold
+        self._version = None
+        self.refresh()
+    
+    def refresh(self):
+        """Rebuild the cached image if the heatmap changed, cheap enough to call on a timer"""
+        if self.heatmap is None:
+            if self.image is not None:
+                self.image = None
+                self.update()
+            return
+        if self.heatmap.version == self._version:
+            return
+        
+        rgba = self.heatmap.render()
+        height, width = rgba.shape[:2]
+        # Copied, the heatmap reuses its buffer
+        self.image = QImage(rgba.data, width, height, rgba.strides[0], QImage.Format.Format_RGBA8888).copy()
+        self._version = self.heatmap.version
+        self.update()
+    
+    def map_rect(self):
+        """Square area of the widget the heatmap is drawn into"""
+        side = min(self.width(), self.height())
+        return QRectF((self.width() - side) / 2, (self.height() - side) / 2, side, side)
+    
+    def paintEvent(self, event):
+        """Paint the cached heatmap image and the threshold circle"""
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), COLOR_BACKGROUND)
+        if self.image is None:
+            painter.end()
+            return
+        
+        rect = self.map_rect()
+        # Bins stay sharp squares, no smoothing
+        painter.drawImage(rect, self.image)
+        
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        center = rect.center()
+        if self.threshold:
+            pen = QPen(COLOR_THRESHOLD)
+            pen.setWidthF(1.5)
+            pen.setStyle(Qt.PenStyle.DashLine)
+            painter.setPen(pen)
+            radius = self.threshold / self.heatmap.extent * rect.width() / 2
+            painter.drawEllipse(center, radius, radius)
+        
+        pen = QPen(COLOR_CENTER)
+        pen.setWidthF(1.5)
+        painter.setPen(pen)
+        painter.drawLine(center - QPointF(6, 0), center + QPointF(6, 0))
+        painter.drawLine(center - QPointF(0, 6), center + QPointF(0, 6))
+        
+        if self.heatmap.total:
+            painter.setPen(COLOR_TEXT)
+            outside = self.heatmap.outside / self.heatmap.total * 100
+            painter.drawText(
+                rect.adjusted(4, 4, -4, -4),
+                Qt.AlignmentFlag.AlignBottom | Qt.AlignmentFlag.AlignLeft,
+                f"{self.heatmap.total} frames, {outside:.0f}% off the map"
+            )
+        painter.end()
+    
+    def sizeHint(self):
+        """Return a suitable size for the widget"""
+        return QSize(240, 240)
@@ -0,0 +1,101 @@
+"""
+Vector overlays for pupil tracking results, painted over the video widget
+"""
+from PyQt6.QtCore import Qt, QPointF
+from PyQt6.QtGui import QColor, QPen, QBrush
+
+# Overlay colours
+COLOR_UNLOCKED = QColor(0, 0, 255)        # Pupil ellipse before calibration
+COLOR_WITHIN = QColor(0, 200, 0)          # Pupil within lock threshold
+COLOR_OUTSIDE = QColor(230, 0, 0)         # Pupil outside lock threshold
+COLOR_CENTER = QColor(0, 255, 255)        # Fitted pupil center
+COLOR_LOCK_POINT = QColor(255, 255, 0)    # Calibrated lock position
+
+
+def paint_tracking_overlay(painter, video_widget, observation, offset=(0, 0), ratio=None):
+    """Paint the tracker observation for the displayed frame
+    
+    Args:
+        painter: Active QPainter on the video widget
+        video_widget: VideoWidget showing the frame, used to map frame to widget coordinates
+        observation: Observation dict from EyeTracker, in frame coordinates, may be None.
+                     A binocular observation holds an 'eyes' list of (observation, offset) pairs.
+        offset: Position of the observation's frame within the displayed frame
+        ratio: Displayed frame pixels per observation pixel, derived from the observation's
+               frame_size if None. Differs from 1 when a downscaled preview is displayed.
+    """
+    if not observation or video_widget.frame_rect() is None:
+        return
+    
+    if ratio is None:
+        ratio = video_widget.pixmap.width() / observation['frame_size'][0]
+    
+    # Binocular frames hold one observation per eye, each at its own offset
+    if 'eyes' in observation:
+        for eye_observation, eye_offset in observation['eyes']:
+            paint_tracking_overlay(painter, video_widget, eye_observation, eye_offset, ratio)
+        return
+    
+    scale = video_widget.frame_scale() * ratio
+    offset_x, offset_y = offset
+    
+    def map_point(x, y):
+        return video_widget.map_from_frame((offset_x + x) * ratio, (offset_y + y) * ratio)
+    
+    # Status colour for the ellipse and threshold circle
+    if not observation['is_position_locked']:
+        status_color = COLOR_UNLOCKED
+    elif observation['within_threshold']:
+        status_color = COLOR_WITHIN
+    else:
+        status_color = COLOR_OUTSIDE
+    
+    painter.save()
+    painter.setBrush(Qt.BrushStyle.NoBrush)
+    
+    # Lock point and threshold circle
+    locked_position = observation['locked_position']
+    if locked_position is not None:
+        lock_point = map_point(*locked_position)
+        
+        threshold_pen = QPen(status_color)
+        threshold_pen.setWidthF(1.5)
+        threshold_pen.setStyle(Qt.PenStyle.DashLine)
+        painter.setPen(threshold_pen)
+        radius = observation['lockpos_threshold'] * scale
+        painter.drawEllipse(lock_point, radius, radius)
+        
+        # Inner circle the pupil must return to after leaving, when hysteresis is set
+        reenter_radius = observation['reenter_threshold'] * scale
+        if reenter_radius < radius:
+            threshold_pen.setStyle(Qt.PenStyle.DotLine)
+            threshold_pen.setWidthF(1)
+            painter.setPen(threshold_pen)
+            painter.drawEllipse(lock_point, reenter_radius, reenter_radius)
+        
+        lock_pen = QPen(COLOR_LOCK_POINT)
+        lock_pen.setWidthF(2)
+        painter.setPen(lock_pen)
+        painter.drawLine(lock_point - QPointF(6, 0), lock_point + QPointF(6, 0))
+        painter.drawLine(lock_point - QPointF(0, 6), lock_point + QPointF(0, 6))
+    
+    # Fitted pupil ellipse and its center
+    ellipse = observation['ellipse']
+    if ellipse is not None:
+        (center_x, center_y), (width, height), angle = ellipse
+        center = map_point(center_x, center_y)
+        
+        ellipse_pen = QPen(status_color)
+        ellipse_pen.setWidthF(2)
+        painter.setPen(ellipse_pen)
+        painter.save()
+        painter.translate(center)
+        painter.rotate(angle)
+        painter.drawEllipse(QPointF(0, 0), width * scale / 2, height * scale / 2)
+        painter.restore()
+        
+        painter.setPen(Qt.PenStyle.NoPen)
+        painter.setBrush(QBrush(COLOR_CENTER))
+        painter.drawEllipse(center, 3, 3)
+    
+    painter.restore()
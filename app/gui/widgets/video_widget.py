@@ -2,9 +2,8 @@
 Video widget for displaying camera feed in the EyeTracker application
 """
 from PyQt6.QtWidgets import QWidget, QLabel, QVBoxLayout
-from PyQt6.QtCore import Qt, QSize
+from PyQt6.QtCore import QSize, QRectF, QPointF
 from PyQt6.QtGui import QImage, QPixmap, QPainter
-import cv2
 
 class VideoWidget(QWidget):
     """Widget for displaying video feed from camera"""
@@ -12,6 +11,7 @@ class VideoWidget(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.pixmap = None
+        self.observation = None # Tracker observation for the displayed frame, in frame coordinates
         self.setup_ui()
     
     def setup_ui(self):
@@ -22,50 +22,87 @@ class VideoWidget(QWidget):
         # We no longer need the video_label since we'll paint directly on the widget
         self.setStyleSheet("background-color: black;")
         
-    def update_frame(self, frame):
+    def update_frame(self, frame, observation=None):
         """Update the displayed frame
         
         Args:
-            frame: OpenCV frame (numpy array)
+            frame: OpenCV frame (numpy array), displayed as is without drawing on it
+            observation: Optional tracker observation describing the frame, used for overlays
         """
         if frame is None:
             return
         
-        # Convert OpenCV BGR format to RGB
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        height, width = frame.shape[:2]
         
-        height, width, channels = rgb_frame.shape
-        bytes_per_line = channels * width
-        
-        # Create QImage from the frame
-        qt_image = QImage(rgb_frame.data, width, height, bytes_per_line, QImage.Format.Format_RGB888)
+        # Wrap the BGR buffer directly, Qt reads BGR so no colour conversion copy is needed
+        if frame.ndim == 2:
+            qt_image = QImage(frame.data, width, height, frame.strides[0], QImage.Format.Format_Grayscale8)
+        else:
+            qt_image = QImage(frame.data, width, height, frame.strides[0], QImage.Format.Format_BGR888)
         
         # Convert to QPixmap and store it
         self.pixmap = QPixmap.fromImage(qt_image)
+        self.observation = observation
         
         # Trigger a repaint
         self.update()
 
         return qt_image
     
+    def frame_rect(self):
+        """Get the area of the widget the frame is drawn into
+        
+        Returns:
+            QRectF: Target rectangle in widget coordinates, or None if no frame is shown
+        """
+        if self.pixmap is None or self.pixmap.width() == 0 or self.pixmap.height() == 0:
+            return None
+        
+        # Scale to fit widget while maintaining aspect ratio, centered
+        scale = min(self.width() / self.pixmap.width(), self.height() / self.pixmap.height())
+        target_width = self.pixmap.width() * scale
+        target_height = self.pixmap.height() * scale
+        x = (self.width() - target_width) / 2
+        y = (self.height() - target_height) / 2
+        
+        return QRectF(x, y, target_width, target_height)
+    
+    def frame_scale(self):
+        """Get the factor from frame pixels to widget pixels"""
+        rect = self.frame_rect()
+        if rect is None:
+            return 1.0
+        return rect.width() / self.pixmap.width()
+    
+    def map_from_frame(self, x, y):
+        """Map a point in frame pixel coordinates to widget coordinates
+        
+        Args:
+            x, y: Point in frame coordinates
+            
+        Returns:
+            QPointF: Point in widget coordinates
+        """
+        rect = self.frame_rect()
+        if rect is None:
+            return QPointF(x, y)
+        scale = rect.width() / self.pixmap.width()
+        return QPointF(rect.x() + x * scale, rect.y() + y * scale)
+    
     def paintEvent(self, event):
         """Paint the video frame on the widget"""
         super().paintEvent(event)
         
         if self.pixmap is not None:
             painter = QPainter(self)
-            # Scale pixmap to fit widget while maintaining aspect ratio
-            scaled_pixmap = self.pixmap.scaled(self.size(), Qt.AspectRatioMode.KeepAspectRatio)
-            
-            # Calculate position to center the pixmap in the widget
-            x = (self.width() - scaled_pixmap.width()) // 2
-            y = (self.height() - scaled_pixmap.height()) // 2
+            painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
             
-            # Draw the pixmap
-            painter.drawPixmap(x, y, scaled_pixmap)
+            # Draw the pixmap scaled into the centered target area
+            painter.drawPixmap(self.frame_rect(), self.pixmap, QRectF(self.pixmap.rect()))
             
             # Allow for external paint operations (like overlays)
             if hasattr(self, 'external_paint') and callable(self.external_paint):
+                painter.setRenderHint(QPainter.RenderHint.Antialiasing)
                 self.external_paint(painter)
                 
             painter.end()
@@ -76,4 +113,4 @@ class VideoWidget(QWidget):
     
     def minimumSizeHint(self):
         """Return the minimum size for the widget"""
-        return QSize(320, 240)
\ No newline at end of file
+        return QSize(320, 240)
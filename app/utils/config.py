@@ -14,12 +14,26 @@ DEFAULT_CONFIG = {
         "video_path": "./assets/eye_test.mp4",
         "zoom_factor": 1,
         "zoom_center": None,  # None means use the center of the frame
+        "camera_index": 0,  # Camera used for monocular tracking
+        "first_frame_timeout": 5.0,  # Seconds connecting waits for the camera's first frame
+        "prewarm": False,  # Open the camera and run the detector while the welcome view shows
+        "prewarm_frames": 5,  # Frames processed back to back to warm up the pipeline
+    },
+    
+    # Binocular tracking, one camera per eye processed in parallel
+    "binocular": {
+        "enabled": False,
+        "camera_indices": [0, 1],  # (left eye, right eye)
     },
     
     # Eye tracking settings
     "eye_tracking": {
         "lockpos_threshold": 48,
         "threshold_switch_confidence_margin": 2,
+        # Debouncing of the in/out of threshold decision sent to the Arduino
+        "gaze_hysteresis": 6,      # Pixels below lockpos_threshold to count as back within
+        "gaze_dwell_ms": 100,      # How long a new state must persist before it is sent
+        "gaze_vote_window": 3,     # Frames voting on the state, 1 to decide per frame
     },
     
     # Arduino settings
@@ -27,15 +41,52 @@ DEFAULT_CONFIG = {
         "enabled": False,
         "port": "/dev/cu.usbserial-120",  # Default port, only for platform dev, will be removed
         "baud_rate": 115200,
+        "link_baud_rates": [1000000, 500000, 250000],  # Faster rates tried after connecting, [] to stay at baud_rate
+        "binary_protocol": True,  # COBS framed status messages, falls back to text for older firmware
+        "last_device": None,  # Port, USB serial number and VID:PID of the last connected board, tried first
+        "auto_reconnect": True,  # Watch the link and reconnect in the background when it is lost
+        "heartbeat_timeout": 3.0,  # Seconds without any data from the board before the link counts as lost
         "port_identifiers": ['arduino', 'usb', 'serial', 'uno', 'r4', 'wifi']
     },
     
+    # Multi-station host mode (main.py --host), one process per (camera, Arduino) pair
+    "host": {
+        "stations": [
+            {"name": "Station 1", "camera_index": 0, "arduino_port": None},
+            {"name": "Station 2", "camera_index": 1, "arduino_port": None},
+        ],
+        "latency_budget_ms": 33,  # Per-frame processing budget of each station
+        "preview_fps": 10,  # Rate of the previews shown in the operator view
+        "stall_timeout": 2.0,  # Seconds without a preview before a station is shown as stalled
+    },
+    
     # Test settings
     "test": {
         "num_points": 100,  # Number of points to flash during the test
         "point_duration": 0.5,  # Duration each point is visible in seconds
         "minimum_interval": 0.2,  # Minimum interval between points in seconds
         "maximum_interval": 1.0,  # Maximum interval between points in seconds
+        "pattern": "builtin",  # "builtin" for the firmware's points, or a stimulus plan: "24-2", "30-2"
+        "eye": "right",  # Eye tested by the plan, decides the side of the 24-2 nasal step
+        "servo_center": [100, 35],  # Servo angles pointing at the fixation target
+        "servo_scale": [1.0, 1.0],  # Servo degrees per degree of visual angle (vertical, horizontal)
+        "response_window": 1.0,  # Seconds after each stimulus to wait for a press
+        "seed": None,  # Random seed for the plan's order and intervals, None for a new order each test
+    },
+    
+    # Session recording, per-frame observations and device events of every test
+    "session": {
+        "record": True,
+        "directory": None,  # None for the sessions folder next to the logs
+        "frames": False,  # Also record the camera frames for replay, tens of MB per minute
+        "frame_quality": 75,  # JPEG quality of the recorded frames
+        "frame_rate": 30,  # Most frames recorded per second, observations are kept for every frame
+    },
+    
+    # Results database, patients, sessions and per-point responses of every test
+    "results": {
+        "database": None,  # None for results.db next to the config file
+        "page_size": 50,  # Sessions per page of the results history
     },
     
     # UI settings
@@ -16,6 +16,13 @@ const byte CMD_PING = 0x03;            // Ping signal
 const byte CMD_WITHIN_THRESHOLD = 0x04;  // Within threshold signal
 const byte CMD_OUT_OF_THRESHOLD = 0x05;  // Out of threshold signal
 const byte CMD_TEST_RESULTS = 0x06;  // Get test results
+const byte CMD_SET_BINARY_MODE = 0x07;  // Switch output to binary frames
+const byte CMD_IDENTIFY = 0x08;  // Identify firmware, lets the host find our board among serial ports
+const byte CMD_SYNC = 0x09;  // Report millis(), the host maps our timestamps onto its clock
+const byte CMD_PLAN_BEGIN = 0x0A;   // + total u16, crc16: announce a stimulus plan
+const byte CMD_PLAN_POINTS = 0x0B;  // + start u16, count u8, count points, crc16: fill the plan window
+const byte CMD_SET_BAUD = 0x0C;     // + baud u32, crc16: switch the link rate, binary mode only
+const byte CMD_CONFIRM_BAUD = 0x0D; // + baud u32, crc16: sent by the host at the new rate
 
 // const char CMD_START_TEST = '1';      // Start test
 // const char CMD_END_TEST = '2';        // End test
@@ -27,6 +34,48 @@ const byte CMD_TEST_RESULTS = 0x06;  // Get test results
 // Response byte constants
 const char RESP_ACK = 'O';             // Command acknowledged
 
+// Binary protocol, see app/core/binary_codec.py for the frame layout:
+// COBS(version u8 | msg_type u8 | seq u16 | body | crc16) 0x00, all little-endian
+const byte PROTOCOL_VERSION = 1;
+const byte MSG_TEXT = 0x01;
+const byte MSG_STATUS = 0x02;
+const byte MSG_EVENT = 0x03;
+const byte MSG_RESULTS = 0x04;
+const byte MSG_ACK = 0x05;
+const byte MSG_SYNC = 0x06;
+const byte MSG_PLAN = 0x07;
+const byte MSG_BAUD = 0x08;
+const byte STATE_READY = 0;
+const byte STATE_RUNNING = 1;
+const byte STATE_FINISHED = 2;
+const int MAX_PAYLOAD = 96;
+
+// Event types of MSG_EVENT frames (device_ms u32, event_type u8, point u16, arg i16)
+const byte EV_TEST_START = 1;
+const byte EV_POINT_MOVED = 2;   // arg: total number of points
+const byte EV_LASER_ON = 3;
+const byte EV_LASER_OFF = 4;     // arg: 1 if turned off by a hit, 0 at the end of laser_duration
+const byte EV_BUTTON_HIT = 5;    // Press while the laser is on
+const byte EV_WRONG_PRESS = 6;   // Press while the laser is off
+const byte EV_LOOK_AWAY = 7;     // Host reported out of threshold, arg: out_of_thres_counter
+const byte EV_LOOK_BACK = 8;     // Host reported within threshold
+const byte EV_TEST_END = 9;
+const byte EV_OVERFLOW = 10;     // arg: events lost because the ring buffer was full
+const uint16_t NO_POINT = 0xFFFF;
+
+// Status of MSG_PLAN replies (status u8, max_points u16, window u8, received u16, free u8)
+const byte PLAN_OK = 0;
+const byte PLAN_TOO_LARGE = 1;
+const byte PLAN_BAD_CRC = 2;
+const byte PLAN_BUSY = 3;
+const byte PLAN_OUT_OF_ORDER = 4;
+
+// Status of MSG_BAUD replies (status u8, baud u32)
+const byte BAUD_OK = 0;
+const byte BAUD_UNSUPPORTED = 1;
+const byte BAUD_BAD_CRC = 2;
+const byte BAUD_BUSY = 3;
+
 // Timing constants
 const int point_duration = 5000; // wait time before shifting to next point
 const int laser_duration = 2000; // duration for laser to be turned on
@@ -34,6 +83,7 @@ const int PRE_FIRE_DELAY = 500;    // 0.5 second delay before firing
 const int buzzer_duration = 1000; // Buzzer duration in milliseconds
 const unsigned long DEBOUNCE_DELAY = 50; 
 const int PROGRESS_INTERVAL = 300; // Send progress report every 100ms
+const int HEARTBEAT_INTERVAL = 1000; // Status interval in binary mode, progress is sent as events
 
 // Servo movement parameters
 const float SERVO_STEPS = 1;           
@@ -68,6 +118,34 @@ unsigned long test_start_time = 0;
 const unsigned long TEST_TIMEOUT = 300000; // 5 minutes timeout
 int out_of_thres_counter = 0;
 
+// Output mode, text lines until the host sends CMD_SET_BINARY_MODE
+bool binary_mode = false;
+uint16_t frame_seq = 0;
+
+// Link rate. A new rate is kept only once the host confirms it at that rate within
+// BAUD_CONFIRM_TIMEOUT, otherwise we fall back, so a rate the cable or the USB
+// bridge can't carry never leaves the board unreachable.
+const uint32_t BASE_BAUD = 115200;
+const uint32_t BAUD_RATES[] = {115200, 250000, 500000, 1000000};  // Exact or within 2.1% at 16 MHz
+const unsigned long BAUD_CONFIRM_TIMEOUT = 500;
+uint32_t link_baud = BASE_BAUD;
+uint32_t fallback_baud = BASE_BAUD;
+bool baud_pending = false;  // Switched, waiting for CMD_CONFIRM_BAUD
+unsigned long baud_switch_time = 0;
+
+// Events waiting to be sent, one is sent per loop so the test logic never waits on serial
+struct Event {
+  uint32_t device_ms;
+  byte event_type;
+  uint16_t point;
+  int16_t arg;
+};
+const byte EVENT_BUFFER_SIZE = 16;
+Event event_buffer[EVENT_BUFFER_SIZE];
+byte event_head = 0;   // Next slot to write
+byte event_count = 0;
+int events_lost = 0;
+
 // Servo objects
 Servo myservo1;
 Servo myservo2;
@@ -79,9 +157,37 @@ const int numPoints = sizeof(myPoints) / sizeof(myPoints[0]);
 char click_tracker[numPoints];
 int click_counter = 0;
 
+// Stimulus plan uploaded by the host, replaces myPoints for one test. Only a small
+// window of upcoming points is held, the host refills it as points are shown.
+// SRAM use: PLAN_WINDOW * 8 bytes of points and MAX_PLAN_POINTS / 8 bytes of hits.
+const int MAX_PLAN_POINTS = 512;  // Results frame holds the hit bitmap, 64 bytes
+const byte PLAN_WINDOW = 8;
+const int PLAN_POINT_SIZE = 8;    // Bytes per point on the wire
+const unsigned long PLAN_LEAD_IN = 1000;  // ms before the first plan point
+struct PlanPoint {
+  uint8_t servo1;
+  uint8_t servo2;
+  uint16_t pre_fire_ms;  // Move to laser on
+  uint16_t laser_ms;     // Laser on time
+  uint16_t point_ms;     // Move to next move
+};
+PlanPoint plan_window[PLAN_WINDOW];
+byte plan_head = 0;        // Slot of the next point to show
+byte plan_count = 0;       // Points buffered
+uint16_t plan_total = 0;   // 0 without a plan, the built-in points are used
+uint16_t plan_received = 0;
+bool plan_used = false;    // A plan is run once, later tests fall back to the built-in points
+uint8_t hit_bitmap[MAX_PLAN_POINTS / 8];
+
+// Timing of the current point
+unsigned long current_point_ms = point_duration;
+unsigned long current_pre_fire_ms = PRE_FIRE_DELAY;
+unsigned long current_laser_ms = laser_duration;
+
 void setup() {
   // Setup serial with higher baud rate for efficiency
-  Serial.begin(115200);
+  Serial.begin(BASE_BAUD);
+  Serial.setTimeout(50);  // For command payloads, they are written together with their command byte
 
   // Configure pins
   pinMode(button_pin, INPUT_PULLUP);
@@ -105,18 +211,28 @@ void setup() {
 void loop() {
   unsigned long current_time = millis();
   
+  // Unconfirmed rate change, go back to the rate the host last heard us on
+  if (baud_pending && current_time - baud_switch_time > BAUD_CONFIRM_TIMEOUT) {
+    revertBaud();
+  }
+
   // Process any incoming serial commands (more efficient processing)
   if (Serial.available() > 0) {
     byte command = Serial.read();
     // char command = Serial.read();
+    if (baud_pending && command != CMD_CONFIRM_BAUD) {
+      command = 0;  // Bytes at a rate that doesn't work would be read as random commands
+    }
     
     switch(command) {
       case CMD_START_TEST:
         if (!test_running) {
           startTest(); // This function already prints "Test starting..."
-          Serial.println(point_tracker);
+          if (!binary_mode) {
+            Serial.println(point_tracker);
+          }
         } else {
-          Serial.println("System busy: Test already running");
+          reply("System busy: Test already running");
         }
         break;
         
@@ -128,11 +244,11 @@ void loop() {
         
       case CMD_PING:
         if (test_running) {
-          Serial.println("Test Running");
+          reply("Test Running");
         } else if (test_finished) {
-          Serial.println("Test Ended");
+          reply("Test Ended");
         } else {
-          Serial.println("System Online");
+          reply("System Online");
         }
         break;
         
@@ -141,7 +257,10 @@ void loop() {
         // Handle within threshold command
         digitalWrite(led_pin, LOW);
         led_state = LOW;
-        // Serial.write(RESP_ACK);  // Send immediate acknowledgment
+        sendAck(command);  // The host measures round trips from these
+        if (test_running) {
+          pushEvent(EV_LOOK_BACK, 0);
+        }
         break;
         
       case CMD_OUT_OF_THRESHOLD:
@@ -149,11 +268,18 @@ void loop() {
         out_of_thres_counter += 1;
         digitalWrite(led_pin, HIGH);
         led_state = HIGH;
-        // Serial.write(RESP_ACK);  // Send immediate acknowledgment
+        sendAck(command);
+        if (test_running) {
+          pushEvent(EV_LOOK_AWAY, out_of_thres_counter);
+        }
         break;
 
       // This is extra, during test run, arduino automatically sends updates every 300ms without request
       case CMD_TEST_RESULTS:
+        if (binary_mode) {
+          sendStatusFrame(test_finished && !test_running ? MSG_RESULTS : MSG_STATUS);
+          break;
+        }
         { // Scope for StaticJsonDocument
           JsonDocument doc; // Increased size slightly for safety
           if (test_running) {
@@ -177,24 +303,58 @@ void loop() {
         }
         break;
 
+      case CMD_IDENTIFY:
+        // Firmware version and current output mode, the host may connect without resetting us
+        reply(binary_mode ? "EyeTracker fw1 binary" : "EyeTracker fw1 text");
+        break;
+
+      case CMD_SYNC:
+        sendSync();
+        break;
+
+      case CMD_PLAN_BEGIN:
+        beginPlan();
+        break;
+
+      case CMD_PLAN_POINTS:
+        receivePlanPoints();
+        break;
+
+      case CMD_SET_BAUD:
+        setBaud();
+        break;
+
+      case CMD_CONFIRM_BAUD:
+        confirmBaud();
+        break;
+
+      case CMD_SET_BINARY_MODE:
+        // Confirm in text, everything after this line is framed
+        Serial.println("Binary mode");
+        binary_mode = true;
+        break;
+
       default:
         // Unknown command, ignore
         break;
     }
-    
-    // Clear any remaining serial data
-    while (Serial.available()) {
-      Serial.read();
-    }
+    // Bytes still buffered are handled on the next loops, discarding them would drop
+    // a threshold command sent right after a ping or sync
   }
 
   // Only execute test logic if test is running
   if (test_running) {
     runTestLogic(current_time);
 
-    if (millis() - last_progress_send_time >= PROGRESS_INTERVAL) {
+    // In binary mode progress is sent as events, the status is only a heartbeat
+    if (millis() - last_progress_send_time >= (binary_mode ? HEARTBEAT_INTERVAL : PROGRESS_INTERVAL)) {
       printTestStatus();; // Controlled interval
       last_progress_send_time = millis();
+
+      // Repeat the plan credit, the host refills the window from it if a refill was lost
+      if (plan_total > 0 && plan_received < plan_total && plan_count < PLAN_WINDOW) {
+        sendPlanStatus(PLAN_OK);
+      }
     }
 
     // Check if test should time out
@@ -202,10 +362,12 @@ void loop() {
       endTest("Test timed out");
     }
   }
+
+  sendNextEvent();
 }
 
 void startTest() {
-  Serial.println("Test starting...");
+  reply("Test starting...");
   test_running = true;
   test_finished = false;
   test_start_time = millis();
@@ -219,6 +381,20 @@ void startTest() {
   for (int i = 0; i < numPoints; i++) {
     click_tracker[i] = '0';
   }
+  memset(hit_bitmap, 0, sizeof(hit_bitmap));
+
+  if (plan_used) {
+    plan_total = 0;
+    plan_used = false;
+  }
+  plan_used = plan_total > 0;
+  current_point_ms = plan_used ? PLAN_LEAD_IN : point_duration;
+  current_pre_fire_ms = PRE_FIRE_DELAY;
+  current_laser_ms = laser_duration;
+
+  event_count = 0;
+  events_lost = 0;
+  pushEvent(EV_TEST_START, totalPoints());
   
   // Set initial position
   int target_x = myPoints[point_tracker][0];
@@ -249,6 +425,19 @@ void endTest(String reason) {
   test_finished = true;
   
   // Report test results
+  if (binary_mode) {
+    // Events first, so the host has the full event log when the results arrive
+    pushEvent(EV_TEST_END, 0);
+    while (event_count > 0) {
+      sendNextEvent();
+    }
+    reply("TEST_END");
+    reply(reason.c_str());
+    sendStatusFrame(MSG_RESULTS);
+    reply("System ready");
+    return;
+  }
+
   Serial.println("TEST_END");
   Serial.print("Reason: ");
   Serial.println(reason);
@@ -302,6 +491,11 @@ void smoothServoMove(int target_servo1, int target_servo2) {
 }
 
 void printTestStatus() {
+  if (binary_mode) {
+    sendStatusFrame(MSG_STATUS);
+    return;
+  }
+
   JsonDocument doc; // Increased size slightly for safety
   if (test_running) {
     doc["test_status"] = "Test Running";
@@ -342,12 +536,15 @@ void runTestLogic(unsigned long current_time) {
     last_button_state = reading;
   }
 
-  if (duration > point_duration) {
+  // With a plan, wait if the host has not refilled the window in time
+  bool next_point_ready = plan_total == 0 || plan_count > 0 || point_tracker + 1 >= plan_total;
+
+  if (duration > current_point_ms && next_point_ready) {
     // Update point_tracker to the next point
     point_tracker++;
 
     // Check if we've completed a full cycle and end the test
-    if (point_tracker >= numPoints) {
+    if (point_tracker >= totalPoints()) {
       endTest("Test completed successfully");
       return;
     }
@@ -356,13 +553,29 @@ void runTestLogic(unsigned long current_time) {
     if (laser_state == HIGH) {
       digitalWrite(laser_pin, LOW);
       laser_state = LOW;
+      pushEvent(EV_LASER_OFF, 0);
     }
 
-    int target_x = myPoints[point_tracker][0];
-    int target_y = myPoints[point_tracker][1];
+    int target_x, target_y;
+    if (plan_total > 0) {
+      // Take the point out of the window, the freed slot is credited to the host
+      PlanPoint &next = plan_window[plan_head];
+      target_y = next.servo1;
+      target_x = next.servo2;
+      current_pre_fire_ms = next.pre_fire_ms;
+      current_laser_ms = next.laser_ms;
+      current_point_ms = next.point_ms;
+      plan_head = (plan_head + 1) % PLAN_WINDOW;
+      plan_count--;
+      sendPlanStatus(PLAN_OK);
+    } else {
+      target_x = myPoints[point_tracker][0];
+      target_y = myPoints[point_tracker][1];
+    }
 
     // Move the servos smoothly instead of abruptly
     smoothServoMove(target_y, target_x);  // Note: servo1=y, servo2=x
+    pushEvent(EV_POINT_MOVED, totalPoints());
 
     // Set up laser firing
     laser_flag = HIGH;
@@ -386,6 +599,7 @@ void runTestLogic(unsigned long current_time) {
           digitalWrite(buzzer_pin, HIGH);
           buzzer_state = HIGH;
           buzzer_start_time = current_time;
+          pushEvent(EV_WRONG_PRESS, 0);
         } 
         else {
           // Turn off laser
@@ -395,7 +609,12 @@ void runTestLogic(unsigned long current_time) {
           laser_flag = LOW;
           
           // Add click to click tracker
-          click_tracker[point_tracker] = '1';
+          if (point_tracker < numPoints) {
+            click_tracker[point_tracker] = '1';
+          }
+          hit_bitmap[point_tracker / 8] |= 1 << (point_tracker % 8);
+          pushEvent(EV_BUTTON_HIT, 0);
+          pushEvent(EV_LASER_OFF, 1);
         }
 
         click_counter++;
@@ -406,17 +625,19 @@ void runTestLogic(unsigned long current_time) {
   // Laser control logic
   if (laser_flag == HIGH) {
     if (laser_state == LOW) {
-      if (current_time - laser_start_time >= PRE_FIRE_DELAY) {
+      if (current_time - laser_start_time >= current_pre_fire_ms) {
         digitalWrite(laser_pin, HIGH);
         laser_state = HIGH;
         laser_start_time = current_time;  // Reset start time for duration tracking
+        pushEvent(EV_LASER_ON, 0);
       }
     }
-    else if (current_time - laser_start_time >= laser_duration) {
+    else if (current_time - laser_start_time >= current_laser_ms) {
       // Turn off laser after duration
       digitalWrite(laser_pin, LOW);
       laser_state = LOW;
       laser_flag = LOW;
+      pushEvent(EV_LASER_OFF, 0);
     }
   }
 
@@ -430,3 +651,342 @@ void runTestLogic(unsigned long current_time) {
 }
 
 
+// Binary protocol
+
+uint16_t crc16(const uint8_t *data, size_t len) {
+  // CRC-16/CCITT-FALSE
+  uint16_t crc = 0xFFFF;
+  for (size_t i = 0; i < len; i++) {
+    crc ^= (uint16_t)data[i] << 8;
+    for (int bit = 0; bit < 8; bit++) {
+      crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : (crc << 1);
+    }
+  }
+  return crc;
+}
+
+size_t putU16(uint8_t *buffer, size_t index, uint16_t value) {
+  buffer[index] = value & 0xFF;
+  buffer[index + 1] = value >> 8;
+  return index + 2;
+}
+
+size_t putU32(uint8_t *buffer, size_t index, uint32_t value) {
+  index = putU16(buffer, index, value & 0xFFFF);
+  return putU16(buffer, index, value >> 16);
+}
+
+void writeCobs(const uint8_t *data, size_t len) {
+  // COBS-encode data and write it followed by the 0x00 delimiter. Each block is
+  // written straight from data after its code byte, so no stack buffer is needed
+  size_t start = 0;
+  for (;;) {
+    size_t end = start;
+    while (end < len && end - start < 254 && data[end] != 0) {
+      end++;
+    }
+    bool full = end - start == 254;
+    Serial.write((uint8_t)(end - start + 1));
+    Serial.write(data + start, end - start);
+    if (end == len && !full) {
+      break;
+    }
+    // A full block is not followed by a zero, any other block stands for one
+    start = full ? end : end + 1;
+  }
+  Serial.write((uint8_t)0);
+}
+
+void sendFrame(byte msg_type, const uint8_t *body, size_t len) {
+  uint8_t payload[MAX_PAYLOAD];
+  if (len > MAX_PAYLOAD - 6) {
+    len = MAX_PAYLOAD - 6;
+  }
+
+  payload[0] = PROTOCOL_VERSION;
+  payload[1] = msg_type;
+  size_t index = putU16(payload, 2, frame_seq++);
+  memcpy(payload + index, body, len);
+  index += len;
+  index = putU16(payload, index, crc16(payload, index));
+
+  writeCobs(payload, index);
+}
+
+void reply(const char *text) {
+  // A println in text mode, a TEXT frame in binary mode
+  if (binary_mode) {
+    sendFrame(MSG_TEXT, (const uint8_t *)text, strlen(text));
+  } else {
+    Serial.println(text);
+  }
+}
+
+void sendAck(byte command) {
+  // "O" line in text mode, ACK frame (command u8, device_ms u32) in binary mode
+  if (binary_mode) {
+    uint8_t body[5];
+    body[0] = command;
+    putU32(body, 1, millis());
+    sendFrame(MSG_ACK, body, sizeof(body));
+  } else {
+    Serial.println(RESP_ACK);
+  }
+}
+
+void pushEvent(byte event_type, int16_t arg) {
+  // Events are only streamed in binary mode, text mode hosts get the periodic status
+  if (!binary_mode) {
+    return;
+  }
+  if (event_count == EVENT_BUFFER_SIZE) {
+    events_lost++;
+    return;
+  }
+  Event &event = event_buffer[event_head];
+  event.device_ms = millis();
+  event.event_type = event_type;
+  event.point = point_tracker < 0 ? NO_POINT : point_tracker;
+  event.arg = arg;
+  event_head = (event_head + 1) % EVENT_BUFFER_SIZE;
+  event_count++;
+}
+
+void sendEventFrame(const Event &event) {
+  uint8_t body[9];
+  size_t index = putU32(body, 0, event.device_ms);
+  body[index++] = event.event_type;
+  index = putU16(body, index, event.point);
+  putU16(body, index, (uint16_t)event.arg);
+  sendFrame(MSG_EVENT, body, sizeof(body));
+}
+
+void sendNextEvent() {
+  // Oldest buffered event, then a note of any lost ones once there is room again
+  if (event_count > 0) {
+    byte tail = (event_head + EVENT_BUFFER_SIZE - event_count) % EVENT_BUFFER_SIZE;
+    sendEventFrame(event_buffer[tail]);
+    event_count--;
+  } else if (events_lost > 0) {
+    Event overflow = {millis(), EV_OVERFLOW, NO_POINT, (int16_t)events_lost};
+    sendEventFrame(overflow);
+    events_lost = 0;
+  }
+}
+
+void sendSync() {
+  // "SYNC <millis>" line in text mode, SYNC frame (device_ms u32) in binary mode.
+  // Read the clock last, as close to sending as possible.
+  if (binary_mode) {
+    uint8_t body[4];
+    putU32(body, 0, millis());
+    sendFrame(MSG_SYNC, body, sizeof(body));
+  } else {
+    Serial.print("SYNC ");
+    Serial.println(millis());
+  }
+}
+
+void sendStatusFrame(byte msg_type) {
+  // STATUS body: device_ms u32, state u8, points_shown u16, total_points u16,
+  // clicks u16, hits u16, out_of_thres_counter u16.
+  // RESULTS uses the same body followed by the click bitmap, 1 bit per point.
+  uint8_t body[MAX_PAYLOAD - 6];
+  byte state = test_running ? STATE_RUNNING : (test_finished ? STATE_FINISHED : STATE_READY);
+  int points_shown = test_running ? point_tracker + 1 : point_tracker;
+  int total = totalPoints();
+  int bitmap_size = (total + 7) / 8;
+  int hits = 0;
+  for (int i = 0; i < bitmap_size; i++) {
+    for (byte bits = hit_bitmap[i]; bits; bits &= bits - 1) {
+      hits++;
+    }
+  }
+
+  size_t index = putU32(body, 0, millis());
+  body[index++] = state;
+  index = putU16(body, index, points_shown < 0 ? 0 : points_shown);
+  index = putU16(body, index, total);
+  index = putU16(body, index, click_counter);
+  index = putU16(body, index, hits);
+  index = putU16(body, index, out_of_thres_counter);
+
+  if (msg_type == MSG_RESULTS) {
+    memcpy(body + index, hit_bitmap, bitmap_size);
+    index += bitmap_size;
+  }
+
+  sendFrame(msg_type, body, index);
+}
+
+
+// Stimulus plan
+
+int totalPoints() {
+  return plan_total > 0 ? plan_total : numPoints;
+}
+
+uint16_t getU16(const uint8_t *buffer, size_t index) {
+  return buffer[index] | (uint16_t)buffer[index + 1] << 8;
+}
+
+void sendPlanStatus(byte status) {
+  // Reply to plan commands and credit for freed window slots
+  uint8_t body[7];
+  body[0] = status;
+  size_t index = putU16(body, 1, MAX_PLAN_POINTS);
+  body[index++] = PLAN_WINDOW;
+  index = putU16(body, index, plan_received);
+  body[index++] = PLAN_WINDOW - plan_count;
+  sendFrame(MSG_PLAN, body, sizeof(body));
+}
+
+void rejectPlanPayload(byte status) {
+  // The rest of a bad payload must not be taken for commands
+  while (Serial.available()) {
+    Serial.read();
+  }
+  sendPlanStatus(status);
+}
+
+void beginPlan() {
+  uint8_t payload[4];
+  if (Serial.readBytes(payload, sizeof(payload)) != sizeof(payload) || crc16(payload, 2) != getU16(payload, 2)) {
+    rejectPlanPayload(PLAN_BAD_CRC);
+    return;
+  }
+  if (test_running) {
+    sendPlanStatus(PLAN_BUSY);
+    return;
+  }
+
+  uint16_t total = getU16(payload, 0);
+  plan_total = 0;
+  plan_used = false;
+  plan_received = 0;
+  plan_head = 0;
+  plan_count = 0;
+  if (!binary_mode || total == 0 || total > MAX_PLAN_POINTS) {
+    sendPlanStatus(PLAN_TOO_LARGE);
+    return;
+  }
+  plan_total = total;
+  sendPlanStatus(PLAN_OK);
+}
+
+void receivePlanPoints() {
+  uint8_t payload[3 + PLAN_WINDOW * PLAN_POINT_SIZE + 2];
+  if (Serial.readBytes(payload, 3) != 3 || payload[2] > PLAN_WINDOW) {
+    rejectPlanPayload(PLAN_BAD_CRC);
+    return;
+  }
+  byte count = payload[2];
+  size_t length = 3 + count * PLAN_POINT_SIZE;
+  if (Serial.readBytes(payload + 3, length - 3 + 2) != length - 3 + 2 || crc16(payload, length) != getU16(payload, length)) {
+    rejectPlanPayload(PLAN_BAD_CRC);
+    return;
+  }
+
+  // Only the next expected points, and only as many as fit, the host resends from 'received'
+  uint16_t start = getU16(payload, 0);
+  if (plan_total == 0 || start != plan_received || count > PLAN_WINDOW - plan_count || start + count > plan_total) {
+    sendPlanStatus(PLAN_OUT_OF_ORDER);
+    return;
+  }
+
+  for (byte i = 0; i < count; i++) {
+    const uint8_t *point = payload + 3 + i * PLAN_POINT_SIZE;
+    PlanPoint &slot = plan_window[(plan_head + plan_count) % PLAN_WINDOW];
+    slot.servo1 = point[0];
+    slot.servo2 = point[1];
+    slot.pre_fire_ms = getU16(point, 2);
+    slot.laser_ms = getU16(point, 4);
+    slot.point_ms = getU16(point, 6);
+    plan_count++;
+  }
+  plan_received += count;
+  sendPlanStatus(PLAN_OK);
+}
+
+
+// Link rate negotiation
+
+void sendBaudStatus(byte status, uint32_t baud) {
+  uint8_t body[5];
+  body[0] = status;
+  putU32(body, 1, baud);
+  sendFrame(MSG_BAUD, body, sizeof(body));
+}
+
+bool readBaudPayload(uint32_t &baud) {
+  uint8_t payload[6];
+  if (Serial.readBytes(payload, sizeof(payload)) != sizeof(payload) || crc16(payload, 4) != getU16(payload, 4)) {
+    return false;
+  }
+  baud = getU16(payload, 0) | (uint32_t)getU16(payload, 2) << 16;
+  return true;
+}
+
+void switchBaud(uint32_t baud) {
+  Serial.flush();  // Finish sending at the old rate
+  Serial.end();
+  Serial.begin(baud);
+  link_baud = baud;
+}
+
+void revertBaud() {
+  switchBaud(fallback_baud);
+  baud_pending = false;
+  while (Serial.available()) {
+    Serial.read();  // Received at the wrong rate
+  }
+}
+
+void setBaud() {
+  uint32_t baud;
+  if (!readBaudPayload(baud)) {
+    while (Serial.available()) {
+      Serial.read();
+    }
+    if (binary_mode) {
+      sendBaudStatus(BAUD_BAD_CRC, link_baud);
+    }
+    return;
+  }
+  if (!binary_mode) {
+    return;  // The confirmation is a CRC-checked frame, text mode stays at the base rate
+  }
+  if (test_running) {
+    sendBaudStatus(BAUD_BUSY, link_baud);
+    return;
+  }
+
+  bool supported = false;
+  for (byte i = 0; i < sizeof(BAUD_RATES) / sizeof(BAUD_RATES[0]); i++) {
+    supported = supported || BAUD_RATES[i] == baud;
+  }
+  if (!supported) {
+    sendBaudStatus(BAUD_UNSUPPORTED, link_baud);
+    return;
+  }
+
+  // Reply at the old rate, then wait for the host to confirm at the new one
+  sendBaudStatus(BAUD_OK, baud);
+  fallback_baud = link_baud;
+  switchBaud(baud);
+  baud_pending = true;
+  baud_switch_time = millis();
+}
+
+void confirmBaud() {
+  uint32_t baud;
+  if (!readBaudPayload(baud) || baud != link_baud) {
+    // A corrupt confirmation means the new rate doesn't work, don't wait for the timeout
+    if (baud_pending) {
+      revertBaud();
+    }
+    return;
+  }
+  baud_pending = false;
+  sendBaudStatus(BAUD_OK, link_baud);
+}
@@ -2,6 +2,8 @@
 EyeTracker - Main Application Entry Point
 """
 import sys
+import argparse
+import multiprocessing
 from PyQt6.QtWidgets import QApplication
 from PyQt6.QtCore import QCoreApplication
 
@@ -16,8 +18,13 @@ def main():
     QCoreApplication.setOrganizationName("EyeTracker")
     QCoreApplication.setApplicationName("EyeTracker")
     
+    # Parse our own options, leaving the rest for Qt
+    parser = argparse.ArgumentParser(description="EyeTracker - Visual Field Test")
+    parser.add_argument('--host', action='store_true', help="Run several test stations from this machine")
+    args, qt_args = parser.parse_known_args()
+    
     # Create Qt application
-    app = QApplication(sys.argv)
+    app = QApplication(sys.argv[:1] + qt_args)
     
     # Setup logger
     logger = setup_logger()
@@ -26,8 +33,12 @@ def main():
     # Load configuration
     config = load_config()
     
-    # Create and show the main window
-    main_window = MainWindow(config)
+    # Create and show the main window, or the operator view in host mode
+    if args.host:
+        from app.gui.host_window import HostWindow
+        main_window = HostWindow(config)
+    else:
+        main_window = MainWindow(config)
     main_window.show()
     
     # Start the event loop
@@ -35,4 +46,6 @@ def main():
 
 
 if __name__ == "__main__":
+    # Required for worker processes (binocular tracking) in frozen builds
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark for the EyeTracker application
+
+Every run starts a fresh interpreter, so nothing is cached in sys.modules, and records:
+- the time to import PyQt6 and the main window module,
+- which heavy modules (OpenCV, pyserial, NumPy, tkinter, sqlite3) that import loaded,
+- the time from launching the process to the first paint of the window.
+
+Usage:
+    python scripts/startup_benchmark.py --runs 5 --output startup.json
+    python scripts/startup_benchmark.py --offscreen   # headless machines, e.g. CI
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that should only load once a device is connected or a view needs them
+HEAVY_MODULES = ['cv2', 'serial', 'numpy', 'tkinter', 'sqlite3']
+
+# Run in the fresh interpreter, prints its measurements as JSON on the last line
+CHILD_SCRIPT = r'''
+import sys
+import json
+import time
+
+start = time.perf_counter()
+heavy_modules = sys.argv[1].split(',')
+
+from PyQt6.QtWidgets import QApplication
+from PyQt6.QtCore import QObject, QEvent, QTimer
+qt_imported = time.perf_counter()
+
+from app.gui.main_window import MainWindow
+imported = time.perf_counter()
+loaded_by_import = [name for name in heavy_modules if name in sys.modules]
+
+from app.utils.config import load_config
+
+result = {
+    'qt_import_s': qt_imported - start,
+    'window_import_s': imported - qt_imported,
+    'loaded_by_import': loaded_by_import,
+}
+
+
+class FirstPaint(QObject):
+    """Records the first paint event of any widget, then quits"""
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Type.Paint and 'first_paint_s' not in result:
+            result['first_paint_s'] = time.perf_counter() - start
+            result['first_paint_wall'] = time.time()
+            QTimer.singleShot(0, app.quit)
+        return False
+
+
+app = QApplication(sys.argv[:1])
+first_paint = FirstPaint()
+app.installEventFilter(first_paint)
+
+constructing = time.perf_counter()
+window = MainWindow(load_config())
+result['construct_s'] = time.perf_counter() - constructing
+window.show()
+
+# Never hang if no paint event arrives
+QTimer.singleShot(10000, app.quit)
+app.exec()
+
+result['loaded_at_first_paint'] = [name for name in heavy_modules if name in sys.modules]
+window.close()
+print(json.dumps(result))
+'''
+
+
+def child_env(offscreen):
+    """Environment of the measured process"""
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [ROOT_DIR, env.get('PYTHONPATH')]))
+    if offscreen:
+        env['QT_QPA_PLATFORM'] = 'offscreen'
+    return env
+
+
+def measure_startup(offscreen=False):
+    """Start the main window in a fresh interpreter and time it
+
+    Args:
+        offscreen: Use Qt's offscreen platform, no display needed
+
+    Returns:
+        dict: Timings in seconds and the heavy modules loaded, see CHILD_SCRIPT.
+              'launch_to_paint_s' includes the interpreter start.
+    """
+    launched = time.time()
+    process = subprocess.run(
+        [sys.executable, '-c', CHILD_SCRIPT, ','.join(HEAVY_MODULES)],
+        cwd=ROOT_DIR, env=child_env(offscreen), capture_output=True, text=True
+    )
+    if process.returncode != 0 or not process.stdout.strip():
+        raise RuntimeError(f"Startup run failed:\n{process.stderr}")
+
+    result = json.loads(process.stdout.strip().splitlines()[-1])
+    if 'first_paint_wall' in result:
+        result['launch_to_paint_s'] = result.pop('first_paint_wall') - launched
+    return result
+
+
+def measure_import_breakdown(top=15):
+    """Slowest modules imported by the main window module, from python -X importtime
+
+    Args:
+        top: Number of modules to return
+
+    Returns:
+        list: (module, cumulative seconds) pairs, slowest first
+    """
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import app.gui.main_window'],
+        cwd=ROOT_DIR, env=child_env(False), capture_output=True, text=True
+    )
+    imports = []
+    for line in process.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        imports.append((module.strip(), int(cumulative) / 1e6))
+    imports.sort(key=lambda entry: entry[1], reverse=True)
+    return imports[:top]
+
+
+def summarise(runs, key):
+    """Median and minimum of a timing over the runs that have it"""
+    values = [run[key] for run in runs if key in run]
+    if not values:
+        return None
+    return {'median_s': statistics.median(values), 'min_s': min(values)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EyeTracker startup benchmark")
+    parser.add_argument('--runs', type=int, default=5, help="Number of fresh starts to measure")
+    parser.add_argument('--offscreen', action='store_true', help="Use Qt's offscreen platform")
+    parser.add_argument('--output', help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    runs = []
+    for run in range(args.runs):
+        result = measure_startup(args.offscreen)
+        runs.append(result)
+        print(f"Run {run + 1}: import {result['qt_import_s'] + result['window_import_s']:.3f} s, "
+              f"first paint {result.get('launch_to_paint_s', float('nan')):.3f} s after launch")
+
+    summary = {
+        key: summarise(runs, key)
+        for key in ('qt_import_s', 'window_import_s', 'construct_s', 'first_paint_s', 'launch_to_paint_s')
+    }
+    loaded_by_import = sorted(set().union(*(run['loaded_by_import'] for run in runs)))
+    loaded_at_first_paint = sorted(set().union(*(run.get('loaded_at_first_paint', []) for run in runs)))
+    slowest_imports = measure_import_breakdown()
+
+    print("\nMedian (minimum) over", args.runs, "runs:")
+    for key, value in summary.items():
+        if value:
+            print(f"  {key:20s} {value['median_s'] * 1000:8.1f} ms ({value['min_s'] * 1000:.1f} ms)")
+    print("Heavy modules loaded by the import:", ", ".join(loaded_by_import) or "none")
+    print("Heavy modules loaded at first paint:", ", ".join(loaded_at_first_paint) or "none")
+    print("Slowest imports (cumulative):")
+    for module, seconds in slowest_imports:
+        print(f"  {module:40s} {seconds * 1000:8.1f} ms")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'python': sys.version,
+                'platform': platform.platform(),
+                'offscreen': args.offscreen,
+                'runs': runs,
+                'summary': summary,
+                'loaded_by_import': loaded_by_import,
+                'loaded_at_first_paint': loaded_at_first_paint,
+                'slowest_imports': slowest_imports,
+            }, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()